@@ -1,7 +1,12 @@
-import pandas as pd
 import streamlit as st
-from src.utils.supabase_utils import get_sheet_data
+from src.utils.supabase_utils import (
+    get_dashboard_summary,
+    get_recent_rows,
+    MILEAGE_LOG_COLUMNS,
+    RECEIPT_COLUMNS,
+)
 from src.utils.auth import init_connection, login_or_signup, check_session
+from src.components.ui_components import render_cache_stats
 
 # Configure Streamlit page (must be first Streamlit command)
 st.set_page_config(
@@ -53,23 +58,22 @@ def main():
     st.header("Quick Overview")
     
     try:
-        # Load data from Supabase
-        current_data_dict = get_sheet_data("Mileage_Dictionary")
-        current_data_log = get_sheet_data("mileage_log")
-        current_receipts_df = get_sheet_data("Receipts", create_if_missing=True, 
-                                           headers=["date", "store_name", "total", "upload_timestamp"])
+        # Counts come from one database function; only the 5 newest trips and receipts are fetched
+        summary = get_dashboard_summary()
+        recent_trips = get_recent_rows("mileage_log", MILEAGE_LOG_COLUMNS)
+        recent_receipts = get_recent_rows("receipts", RECEIPT_COLUMNS)
         
         # Display summary metrics
         col1, col2, col3 = st.columns(3)
         
         with col1:
-            st.metric("Saved Locations", len(current_data_dict))
+            st.metric("Saved Locations", summary["location_count"])
         
         with col2:
-            st.metric("Total Trips", len(current_data_log))
+            st.metric("Total Trips", summary["trip_count"])
         
         with col3:
-            st.metric("Receipts Stored", len(current_receipts_df))
+            st.metric("Receipts Stored", summary["receipt_count"])
         
         # Recent activity
         st.header("Recent Activity")
@@ -78,20 +82,24 @@ def main():
         
         with col1:
             st.subheader("Recent Trips")
-            if len(current_data_log) > 0:
-                st.dataframe(current_data_log.head(5), hide_index=True)
+            if len(recent_trips) > 0:
+                st.dataframe(recent_trips, hide_index=True)
             else:
                 st.info("No trips logged yet. Visit the Mileage Log page to add your first trip!")
         
         with col2:
             st.subheader("Recent Receipts")
-            if len(current_receipts_df) > 0:
-                st.dataframe(current_receipts_df.head(5), hide_index=True)
+            if len(recent_receipts) > 0:
+                st.dataframe(recent_receipts, hide_index=True)
             else:
                 st.info("No receipts uploaded yet. Visit the Receipt Tracker page to add your first receipt!")
     
     except Exception as e:
         st.error(f"Error loading data: {str(e)}")
 
+    # Local cache effectiveness for this server process
+    with st.expander("Cache Statistics"):
+        render_cache_stats()
+
 if __name__ == "__main__":
     main()
@@ -1,6 +1,7 @@
 """
 Configuration and constants for the Mileage Manager application
 """
+import os
 import streamlit as st
 import gspread
 from google.oauth2 import service_account
@@ -20,3 +21,83 @@ creds = service_account.Credentials.from_service_account_info(
 
 # Authenticate with gspread
 client = gspread.authorize(creds)
+
+# Local cache settings (optional [cache] section in secrets overrides the defaults)
+cache_settings = st.secrets.get("cache", {})
+
+# SQLite file shared by every session on this node
+CACHE_DB_PATH = cache_settings.get("db_path", os.path.join(".cache", "mileage_tracker.sqlite3"))
+
+# Route distance cache
+ROUTE_CACHE_TTL_DAYS = cache_settings.get("route_ttl_days", 180)
+ROUTE_CACHE_MAX_ENTRIES = cache_settings.get("route_max_entries", 50000)
+ROUTE_CACHE_SYMMETRIC = cache_settings.get("route_symmetric", True)  # Treat A→B and B→A as the same route
+
+# Precomputed distance matrices between each user's saved locations
+LOCATION_MATRIX_DIR = cache_settings.get("location_matrix_dir", os.path.join(".cache", "location_matrices"))
+
+# Local replica of each user's Supabase tables, kept current with delta syncs
+REPLICA_DB_PATH = cache_settings.get("replica_db_path", os.path.join(".cache", "replica.sqlite3"))
+REPLICA_SYNC_INTERVAL_SECONDS = cache_settings.get("replica_sync_interval_seconds", 5)  # Min time between delta queries
+REPLICA_SYNC_OVERLAP_SECONDS = cache_settings.get("replica_sync_overlap_seconds", 5)  # Re-read window for late commits
+
+# Geocode (address search) cache
+GEOCODE_CACHE_TTL_DAYS = cache_settings.get("geocode_ttl_days", 90)
+GEOCODE_CACHE_MAX_ENTRIES = cache_settings.get("geocode_max_entries", 10000)
+
+# OCR result cache, keyed by image content
+OCR_CACHE_TTL_DAYS = cache_settings.get("ocr_ttl_days", 30)
+OCR_CACHE_MAX_ENTRIES = cache_settings.get("ocr_max_entries", 2000)
+
+# Outbound HTTP settings for the Google APIs (optional [http] section in secrets)
+http_settings = st.secrets.get("http", {})
+HTTP_CONNECT_TIMEOUT = http_settings.get("connect_timeout", 3.05)  # Seconds to open a connection
+HTTP_READ_TIMEOUT = http_settings.get("read_timeout", 10)  # Seconds to wait for a response
+HTTP_POOL_SIZE = http_settings.get("pool_size", 10)  # Keep-alive connections per host
+HTTP_MAX_RETRIES = http_settings.get("max_retries", 3)
+HTTP_BACKOFF_FACTOR = http_settings.get("backoff_factor", 0.5)  # Retry delays: 0.5s, 1s, 2s, ...
+GOOGLE_REQUESTS_PER_SECOND = http_settings.get("google_requests_per_second", 10)
+
+# Distance calculation (optional [distance] section in secrets)
+distance_settings = st.secrets.get("distance", {})
+# "api": call the Distance Matrix API, estimating only when it fails
+# "estimate": never call the API, use cached or estimated distances
+# "background": return an estimate immediately and refine it from the API in the background
+DISTANCE_MODE = distance_settings.get("mode", "api")
+ROAD_CIRCUITY_FACTOR = distance_settings.get("road_circuity_factor", 1.25)  # Road miles per straight-line mile
+
+# Worker pools (optional [workers] section in secrets)
+worker_settings = st.secrets.get("workers", {})
+BACKGROUND_WORKERS = worker_settings.get("background_threads", 4)  # Threads for background network jobs
+OCR_WORKERS = worker_settings.get("ocr_threads", os.cpu_count() or 2)  # Concurrent Tesseract runs on this node
+OCR_MAX_QUEUED = worker_settings.get("ocr_max_queued", 32)  # OCR jobs allowed to wait before submitters block
+RECEIPT_JOB_WORKERS = worker_settings.get("receipt_job_threads", OCR_WORKERS)  # Receipts processed at once in batch uploads
+
+# Receipt OCR (optional [ocr] section in secrets)
+ocr_settings = st.secrets.get("ocr", {})
+OCR_OSD_MAX_SIDE = ocr_settings.get("osd_max_side", 2000)  # Longest side (px) of the image given to orientation detection
+OCR_OSD_MIN_CONFIDENCE = ocr_settings.get("osd_min_confidence", 2.0)  # Trust OSD at or above this orientation confidence
+OCR_PROBE_MAX_SIDE = ocr_settings.get("probe_max_side", 1200)  # Longest side (px) of fallback rotation probes
+OCR_PROBE_EARLY_EXIT_CONFIDENCE = ocr_settings.get("probe_early_exit_confidence", 75)  # Stop probing at this word confidence
+OCR_TARGET_DPI = ocr_settings.get("target_dpi", 300)  # Resolution scans are normalized to before OCR
+OCR_MAX_SIDE = ocr_settings.get("max_side", 2400)  # Longest side (px) photos are reduced to before OCR
+OCR_BINARIZE_WINDOW = ocr_settings.get("binarize_window", 31)  # Neighborhood (px) for adaptive thresholding
+OCR_BINARIZE_OFFSET = ocr_settings.get("binarize_offset", 0.12)  # Pixels this much darker than their neighborhood become ink
+OCR_DESKEW_MAX_ANGLE = ocr_settings.get("deskew_max_angle", 5)  # Largest skew (degrees) corrected before OCR
+OCR_STORE_NAMES_PATH = ocr_settings.get(  # Known store names (default is resolved from the repo root, not the working directory)
+    "store_names_path", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "store_names.txt")
+)
+# Tesseract profile: page segmentation mode 4 reads a single column of text of varying sizes, like a
+# receipt; engine mode 1 is the LSTM recognizer only
+OCR_PSM = ocr_settings.get("psm", 4)
+OCR_OEM = ocr_settings.get("oem", 1)
+OCR_LANG = ocr_settings.get("lang", "eng")
+OCR_AMOUNT_WHITELIST = ocr_settings.get("amount_whitelist", "0123456789.,$-")  # Characters allowed when reading amounts
+# "full": read the whole receipt
+# "regions": a cheap layout pass finds the header, date and total lines; only those are read at full quality
+OCR_MODE = ocr_settings.get("mode", "full")
+OCR_LAYOUT_MAX_SIDE = ocr_settings.get("layout_max_side", 1000)  # Longest side (px) of the image given to the layout pass
+
+# Tax reporting (optional [tax] section in secrets)
+tax_settings = st.secrets.get("tax", {})
+MILEAGE_RATE = tax_settings.get("mileage_rate", 0.67)  # IRS standard mileage rate ($ per business mile)
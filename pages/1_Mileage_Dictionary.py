@@ -3,7 +3,8 @@ Mileage Dictionary Page - Manage saved locations
 """
 import streamlit as st
 import pandas as pd
-from src.utils.supabase_utils import get_sheet_data
+from src.utils.supabase_utils import get_sheet_data, get_mileage_dictionary, get_row_count, update_location, delete_location
+from src.utils.google_api import geocode_address
 from src.utils.auth import init_connection, check_session
 from src.components.ui_components import render_location_form
 
@@ -44,26 +45,9 @@ with col2:
     # Add search/filter
     search = st.text_input("Search locations", placeholder="Type to filter...")
     
-    # Get all locations with IDs from Supabase
-    from src.utils.auth import init_connection
-    supabase = init_connection()
-    user_id = st.session_state.get("user").id if "user" in st.session_state else None
-    
-    if user_id:
-        response = supabase.table('mileage_dictionary').select('*').eq('user_id', user_id).execute()
-        all_locations = response.data if response.data else []
-    else:
-        all_locations = []
-    
-    # Filter locations if search is provided
-    if search:
-        filtered_locations = [
-            loc for loc in all_locations 
-            if search.lower() in loc['location_name'].lower() or 
-               search.lower() in loc['location_address'].lower()
-        ]
-    else:
-        filtered_locations = all_locations
+    # Get matching locations with IDs (searched in the local replica's search index)
+    filtered_locations = get_mileage_dictionary(include_ids=True, search=search).to_dict('records')
+    location_count = get_row_count('mileage_dictionary')
     
     # Display locations with edit/delete buttons
     if len(filtered_locations) > 0:
@@ -94,7 +78,7 @@ with col2:
                 height=400
             )
             
-            st.caption(f"Showing {len(filtered_locations)} of {len(all_locations)} locations")
+            st.caption(f"Showing {len(filtered_locations)} of {location_count} locations")
             
             # Action buttons in a compact row
             st.write("**Actions:**")
@@ -136,10 +120,13 @@ with col2:
                         with col_save:
                             if st.form_submit_button("Save Changes", use_container_width=True):
                                 try:
-                                    supabase.table('mileage_dictionary').update({
-                                        'location_name': new_name,
-                                        'location_address': new_address
-                                    }).eq('id', loc['id']).execute()
+                                    # Keep the saved coordinates unless the address changed
+                                    latitude, longitude = loc.get('latitude'), loc.get('longitude')
+                                    if new_address != loc['location_address']:
+                                        geocode = geocode_address(new_address)
+                                        latitude, longitude = (geocode["lat"], geocode["lng"]) if geocode else (None, None)
+
+                                    update_location(loc['id'], new_name, new_address, latitude, longitude)
                                     
                                     st.success(f"Updated '{new_name}'!")
                                     del st.session_state[f"editing_{loc['id']}"]
@@ -161,7 +148,7 @@ with col2:
                     with col_confirm:
                         if st.button("Yes, Delete", key=f"confirm_yes_{loc['id']}", use_container_width=True):
                             try:
-                                supabase.table('mileage_dictionary').delete().eq('id', loc['id']).execute()
+                                delete_location(loc['id'])
                                 st.success(f"Deleted '{loc['location_name']}'")
                                 del st.session_state[f"confirm_delete_{loc['id']}"]
                                 st.rerun()
@@ -3,10 +3,27 @@ Mileage Log Page - Track and log trips
 """
 import streamlit as st
 import pandas as pd
-from datetime import datetime, timedelta
-from src.utils.supabase_utils import get_sheet_data, get_mileage_log, get_user_id
+from datetime import datetime
+from config.config import MILEAGE_RATE
+from src.utils.supabase_utils import (
+    get_sheet_data,
+    get_row_count,
+    get_summary,
+    iter_pages,
+    update_trip,
+    delete_trip,
+    MILEAGE_LOG_COLUMNS,
+    STREAM_PAGE_SIZE,
+)
 from src.utils.auth import init_connection, check_session
-from src.components.ui_components import render_trip_form
+from src.components.ui_components import (
+    render_trip_form,
+    render_date_range_filter,
+    load_paginated,
+    render_load_more,
+    render_csv_export,
+    DATE_COLUMN_CONFIG,
+)
 
 # Configure page
 st.set_page_config(page_title="Mileage Log", layout="wide")
@@ -41,14 +58,13 @@ if 'trip_to_delete' not in st.session_state:
 
 # Load data
 current_data_dict = get_sheet_data("Mileage_Dictionary")
-current_data_log = get_mileage_log()
 
 # Two column layout
 col1, col2 = st.columns([1, 2], gap="large")
 
 with col1:
     st.header("Log New Trip")
-    render_trip_form(current_data_dict, current_data_log)
+    render_trip_form(current_data_dict)
 
 with col2:
     st.header("Trip History")
@@ -67,133 +83,98 @@ with col2:
         # Search filter
         search = st.text_input("Search trips", placeholder="Type to filter...")
     
-    # Apply date filter
-    filtered_log = current_data_log.copy()
-    
-    if len(filtered_log) > 0 and 'date' in filtered_log.columns:
-        # Ensure date column is datetime
-        filtered_log['date'] = pd.to_datetime(filtered_log['date'])
-        
-        if date_filter == "Last 7 Days":
-            cutoff_date = datetime.now() - timedelta(days=7)
-            filtered_log = filtered_log[filtered_log['date'] >= cutoff_date]
-        elif date_filter == "Last 30 Days":
-            cutoff_date = datetime.now() - timedelta(days=30)
-            filtered_log = filtered_log[filtered_log['date'] >= cutoff_date]
-        elif date_filter == "This Month":
-            current_month = datetime.now().month
-            current_year = datetime.now().year
-            filtered_log = filtered_log[
-                (filtered_log['date'].dt.month == current_month) & 
-                (filtered_log['date'].dt.year == current_year)
-            ]
-        elif date_filter == "Custom Range":
-            col_date1, col_date2 = st.columns(2)
-            with col_date1:
-                start_date = st.date_input("Start Date", value=datetime.now() - timedelta(days=30))
-            with col_date2:
-                end_date = st.date_input("End Date", value=datetime.now())
-            
-            filtered_log = filtered_log[
-                (filtered_log['date'] >= pd.Timestamp(start_date)) & 
-                (filtered_log['date'] <= pd.Timestamp(end_date))
-            ]
-    
-    # Apply search filter
-    if search and len(filtered_log) > 0:
-        filtered_log = filtered_log[
-            filtered_log.apply(lambda row: search.lower() in str(row).lower(), axis=1)
-        ]
+    # Only the matching trips are read, one page at a time
+    date_from, date_to = render_date_range_filter(date_filter)
+    filters = {"date_from": date_from, "date_to": date_to, "search": search}
+    filter_key = (date_from, date_to, search)
+    filtered_log, has_more_trips = load_paginated(
+        iter_pages('mileage_log', MILEAGE_LOG_COLUMNS, **filters), "trip_history", filter_key
+    )
     
     # Display summary stats
     if len(filtered_log) > 0:
         col_stat1, col_stat2, col_stat3 = st.columns(3)
         
+        # Stats cover every matching trip, not just the loaded pages (one aggregate query)
+        trip_summary = get_summary('mileage_log', 'distance', **filters)
+        matching_trip_count = trip_summary["count"]
+        total_miles = trip_summary["sum"]
+        
         with col_stat1:
-            st.metric("Total Trips", len(filtered_log))
+            st.metric("Total Trips", matching_trip_count)
         
         with col_stat2:
-            if 'distance' in filtered_log.columns:
-                total_miles = filtered_log['distance'].sum()
-                st.metric("Total Miles", f"{total_miles:.2f}")
-            else:
-                st.metric("Total Miles", "N/A")
+            st.metric("Total Miles", f"{total_miles:.2f}")
         
         with col_stat3:
-            if 'distance' in filtered_log.columns:
-                # IRS mileage rate for 2025 (example - update as needed)
-                mileage_rate = 0.67  # $0.67 per mile
-                estimated_deduction = total_miles * mileage_rate
-                st.metric("Est. Deduction", f"${estimated_deduction:.2f}")
-            else:
-                st.metric("Est. Deduction", "N/A")
+            # IRS mileage rate (set [tax] mileage_rate in secrets to update)
+            estimated_deduction = total_miles * MILEAGE_RATE
+            st.metric("Est. Deduction", f"${estimated_deduction:.2f}")
         
         st.divider()
         
-        # Format date column to show only dates (not timestamps)
-        display_log = filtered_log.copy()
-        if 'date' in display_log.columns:
-            display_log['date'] = pd.to_datetime(display_log['date']).dt.strftime('%Y-%m-%d')
-        
-        # Display the dataframe
+        # Display the dataframe (already sorted newest first, dates already parsed)
         st.dataframe(
-            display_log.sort_values('date', ascending=False) if 'date' in display_log.columns else display_log,
+            filtered_log[MILEAGE_LOG_COLUMNS],
             hide_index=True,
             use_container_width=True,
-            height=400
+            height=400,
+            column_config=DATE_COLUMN_CONFIG
         )
         
-        st.caption(f"Showing {len(filtered_log)} of {len(current_data_log)} trips")
+        st.caption(f"Showing {len(filtered_log)} of {matching_trip_count} matching trips ({get_row_count('mileage_log')} total)")
+        render_load_more("trip_history", has_more_trips)
         
-        # Download button
-        csv = filtered_log.to_csv(index=False)
-        st.download_button(
-            label="Download as CSV",
-            data=csv,
-            file_name=f"mileage_log_{datetime.now().strftime('%Y%m%d')}.csv",
-            mime="text/csv"
+        # Download every matching trip, streamed page by page
+        render_csv_export(
+            (
+                chunk[MILEAGE_LOG_COLUMNS]
+                for chunk in iter_pages('mileage_log', MILEAGE_LOG_COLUMNS, page_size=STREAM_PAGE_SIZE, **filters)
+            ),
+            "trip_history",
+            filter_key,
+            f"mileage_log_{datetime.now().strftime('%Y%m%d')}.csv",
+            "Prepare CSV of all matching trips"
         )
         
         # Edit/Delete section
         st.divider()
         st.subheader("Manage Trips")
         
-        # Get full trip data with IDs from database
-        supabase = init_connection()
-        user_id = get_user_id()
-        response = supabase.table('mileage_log').select('*').eq('user_id', user_id).order('date', desc=True).execute()
-        
-        if response.data:
-            trips_with_ids = pd.DataFrame(response.data)
+        # Trips to manage are the ones loaded above, so the search box and "Load more" narrow the list
+        if not filtered_log.empty:
             
-            # Create dropdown options with readable format
-            trip_options = []
-            for _, trip in trips_with_ids.iterrows():
-                trip_date = pd.to_datetime(trip['date']).strftime('%Y-%m-%d')
-                option_label = f"{trip_date}: {trip['start_location']} → {trip['end_location']} ({trip['distance']} mi)"
-                trip_options.append(option_label)
+            # Label every trip at once; options are trip ids, so equal-looking trips stay distinct
+            trip_labels = dict(zip(
+                filtered_log['id'].tolist(),
+                filtered_log['date'].dt.strftime('%Y-%m-%d') + ": "
+                + filtered_log['start_location'].astype(str) + " → "
+                + filtered_log['end_location'].astype(str)
+                + " (" + filtered_log['distance'].astype(str) + " mi)"
+            ))
+            trips_by_id = filtered_log.set_index('id')
             
-            selected_trip_label = st.selectbox(
+            selected_trip_id = st.selectbox(
                 "Select trip to edit or delete:",
-                ["Select a trip..."] + trip_options,
+                [None] + list(trip_labels),
+                format_func=lambda trip_id: "Select a trip..." if trip_id is None else trip_labels[trip_id],
                 key="trip_selector"
             )
+            st.caption("Search or load more trips above to find older ones.")
             
             # Action buttons
             action_col1, action_col2 = st.columns(2)
             
             with action_col1:
-                if st.button("Edit Trip", disabled=(selected_trip_label == "Select a trip...")):
-                    selected_idx = trip_options.index(selected_trip_label)
-                    st.session_state.trip_to_edit = trips_with_ids.iloc[selected_idx].to_dict()
+                if st.button("Edit Trip", disabled=(selected_trip_id is None)):
+                    st.session_state.trip_to_edit = {'id': selected_trip_id, **trips_by_id.loc[selected_trip_id].to_dict()}
                     st.session_state.editing_trip = True
                     st.session_state.deleting_trip = False
                     st.rerun()
             
             with action_col2:
-                if st.button("Delete Trip", disabled=(selected_trip_label == "Select a trip...")):
-                    selected_idx = trip_options.index(selected_trip_label)
-                    st.session_state.trip_to_delete = trips_with_ids.iloc[selected_idx].to_dict()
+                if st.button("Delete Trip", disabled=(selected_trip_id is None)):
+                    st.session_state.trip_to_delete = {'id': selected_trip_id, **trips_by_id.loc[selected_trip_id].to_dict()}
                     st.session_state.deleting_trip = True
                     st.session_state.editing_trip = False
                     st.rerun()
@@ -254,11 +235,7 @@ with col2:
                                 'distance': float(edit_distance)
                             }
                             
-                            supabase.table('mileage_log').update(update_data).eq(
-                                'id', trip['id']
-                            ).eq(
-                                'user_id', user_id
-                            ).execute()
+                            update_trip(trip['id'], update_data)
                             
                             st.success("Trip updated successfully!")
                             st.session_state.editing_trip = False
@@ -285,11 +262,7 @@ with col2:
                 with conf_col1:
                     if st.button("Yes, Delete", use_container_width=True):
                         try:
-                            supabase.table('mileage_log').delete().eq(
-                                'id', trip['id']
-                            ).eq(
-                                'user_id', user_id
-                            ).execute()
+                            delete_trip(trip['id'])
                             
                             st.success("Trip deleted successfully!")
                             st.session_state.deleting_trip = False
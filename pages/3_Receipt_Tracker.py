@@ -3,10 +3,17 @@ Receipt Tracker Page - Upload and manage receipts
 """
 import streamlit as st
 import pandas as pd
-from datetime import datetime, timedelta
-from src.utils.supabase_utils import get_data
+from datetime import datetime
+from src.utils.supabase_utils import get_row_count, get_summary, iter_pages, RECEIPT_COLUMNS, STREAM_PAGE_SIZE
 from src.utils.auth import init_connection, check_session
-from src.components.ui_components import render_receipt_section
+from src.components.ui_components import (
+    render_receipt_section,
+    render_date_range_filter,
+    load_paginated,
+    render_load_more,
+    render_csv_export,
+    DATE_COLUMN_CONFIG,
+)
 
 # Configure page
 st.set_page_config(page_title="Receipt Tracker", layout="wide")
@@ -29,9 +36,9 @@ else:
 st.title("Receipt Tracker")
 st.markdown("Upload and manage your business expense receipts with automatic OCR extraction.")
 
-# Load receipts data
-current_receipts_df = get_data("Receipts", create_if_missing=True, 
-                                   headers=["date", "store_name", "total", "upload_timestamp"])
+# Load the newest page of receipts for the upload section
+current_receipts_df = next(iter_pages('receipts', RECEIPT_COLUMNS), pd.DataFrame(columns=RECEIPT_COLUMNS))[RECEIPT_COLUMNS]
+total_receipt_count = get_row_count('receipts')
 
 # Receipt upload section
 st.header("Upload New Receipt")
@@ -60,105 +67,69 @@ with col_filter3:
     # Sort option
     sort_by = st.selectbox("Sort by", ["Date (Newest)", "Date (Oldest)", "Total (High-Low)", "Total (Low-High)"])
 
-# Apply filters
-filtered_receipts = current_receipts_df.copy()
-
-if len(filtered_receipts) > 0:
-    # Apply date filter if date column exists
-    if 'date' in filtered_receipts.columns:
-        # Ensure date column is datetime
-        filtered_receipts['date'] = pd.to_datetime(filtered_receipts['date'])
-        
-        if date_filter == "Last 7 Days":
-            cutoff_date = datetime.now() - timedelta(days=7)
-            filtered_receipts = filtered_receipts[filtered_receipts['date'] >= cutoff_date]
-        elif date_filter == "Last 30 Days":
-            cutoff_date = datetime.now() - timedelta(days=30)
-            filtered_receipts = filtered_receipts[filtered_receipts['date'] >= cutoff_date]
-        elif date_filter == "This Month":
-            current_month = datetime.now().month
-            current_year = datetime.now().year
-            filtered_receipts = filtered_receipts[
-                (filtered_receipts['date'].dt.month == current_month) & 
-                (filtered_receipts['date'].dt.year == current_year)
-            ]
-        elif date_filter == "Custom Range":
-            col_date1, col_date2 = st.columns(2)
-            with col_date1:
-                start_date = st.date_input("Start Date", value=datetime.now() - timedelta(days=30))
-            with col_date2:
-                end_date = st.date_input("End Date", value=datetime.now())
-            
-            filtered_receipts = filtered_receipts[
-                (filtered_receipts['date'] >= pd.Timestamp(start_date)) & 
-                (filtered_receipts['date'] <= pd.Timestamp(end_date))
-            ]
-    
-    # Apply search filter
-    if search:
-        filtered_receipts = filtered_receipts[
-            filtered_receipts.apply(lambda row: search.lower() in str(row).lower(), axis=1)
-        ]
-    
-    # Apply sorting
-    if 'date' in filtered_receipts.columns:
-        if sort_by == "Date (Newest)":
-            filtered_receipts = filtered_receipts.sort_values('date', ascending=False)
-        elif sort_by == "Date (Oldest)":
-            filtered_receipts = filtered_receipts.sort_values('date', ascending=True)
-    
-    if 'total' in filtered_receipts.columns:
-        # Convert total to numeric for sorting
-        filtered_receipts['total_numeric'] = pd.to_numeric(filtered_receipts['total'], errors='coerce')
-        
-        if sort_by == "Total (High-Low)":
-            filtered_receipts = filtered_receipts.sort_values('total_numeric', ascending=False)
-        elif sort_by == "Total (Low-High)":
-            filtered_receipts = filtered_receipts.sort_values('total_numeric', ascending=True)
-        
-        # Drop the temporary column
-        filtered_receipts = filtered_receipts.drop(columns=['total_numeric'])
-    
+# Sort choices and the database order they map to
+sort_orders = {
+    "Date (Newest)": ("date", True),
+    "Date (Oldest)": ("date", False),
+    "Total (High-Low)": ("total", True),
+    "Total (Low-High)": ("total", False),
+}
+order_by, descending = sort_orders[sort_by]
+
+# Only the matching receipts are read, already sorted, one page at a time
+date_from, date_to = render_date_range_filter(date_filter)
+filters = {"date_from": date_from, "date_to": date_to, "search": search}
+filter_key = (date_from, date_to, search, sort_by)
+filtered_receipts, has_more_receipts = load_paginated(
+    iter_pages('receipts', RECEIPT_COLUMNS, order_by=order_by, descending=descending, **filters),
+    "receipt_history",
+    filter_key
+)
+
+if total_receipt_count > 0:
     # Display summary stats
     if len(filtered_receipts) > 0:
         col_stat1, col_stat2, col_stat3 = st.columns(3)
         
+        # Stats cover every matching receipt, not just the loaded pages (one aggregate query)
+        receipt_summary = get_summary('receipts', 'total', **filters)
+        matching_receipt_count = receipt_summary["count"]
+        total_amount = receipt_summary["sum"]
+        
         with col_stat1:
-            st.metric("Total Receipts", len(filtered_receipts))
+            st.metric("Total Receipts", matching_receipt_count)
         
         with col_stat2:
-            if 'total' in filtered_receipts.columns:
-                total_amount = pd.to_numeric(filtered_receipts['total'], errors='coerce').sum()
-                st.metric("Total Amount", f"${total_amount:.2f}")
-            else:
-                st.metric("Total Amount", "N/A")
+            st.metric("Total Amount", f"${total_amount:.2f}")
         
         with col_stat3:
-            if 'date' in filtered_receipts.columns:
-                avg_per_receipt = pd.to_numeric(filtered_receipts['total'], errors='coerce').mean()
-                st.metric("Avg per Receipt", f"${avg_per_receipt:.2f}")
-            else:
-                st.metric("Avg per Receipt", "N/A")
+            st.metric("Avg per Receipt", f"${receipt_summary['mean']:.2f}")
         
         st.divider()
         
         # Display the dataframe
         st.dataframe(
-            filtered_receipts,
+            filtered_receipts[RECEIPT_COLUMNS],
             hide_index=True,
             use_container_width=True,
-            height=400
+            height=400,
+            column_config=DATE_COLUMN_CONFIG
         )
         
-        st.caption(f"Showing {len(filtered_receipts)} of {len(current_receipts_df)} receipts")
+        st.caption(f"Showing {len(filtered_receipts)} of {matching_receipt_count} matching receipts ({total_receipt_count} total)")
+        render_load_more("receipt_history", has_more_receipts)
         
-        # Download button
-        csv = filtered_receipts.to_csv(index=False)
-        st.download_button(
-            label="Download as CSV",
-            data=csv,
-            file_name=f"receipts_{datetime.now().strftime('%Y%m%d')}.csv",
-            mime="text/csv"
+        # Download every matching receipt, streamed page by page
+        render_csv_export(
+            (
+                chunk[RECEIPT_COLUMNS]
+                for chunk in iter_pages('receipts', RECEIPT_COLUMNS, page_size=STREAM_PAGE_SIZE,
+                                        order_by=order_by, descending=descending, **filters)
+            ),
+            "receipt_history",
+            filter_key,
+            f"receipts_{datetime.now().strftime('%Y%m%d')}.csv",
+            "Prepare CSV of all matching receipts"
         )
     else:
         if search or date_filter != "All Time":
@@ -0,0 +1,161 @@
+"""
+Tax Report Page - Yearly and monthly mileage and expense totals
+"""
+import streamlit as st
+import pandas as pd
+from datetime import date, datetime
+from config.config import MILEAGE_RATE
+from src.utils.supabase_utils import get_rollups
+from src.utils.auth import init_connection, check_session
+
+# Configure page
+st.set_page_config(page_title="Tax Report", layout="wide")
+
+# Check authentication
+supabase = init_connection()
+
+if check_session():
+    st.sidebar.success(f"Logged in as {st.session_state['user'].email}")
+
+    if st.sidebar.button("Logout"):
+        st.session_state.pop("user", None)
+        st.session_state.pop("auth_session", None)
+        st.rerun()
+else:
+    st.warning("Please log in from the home page")
+    st.stop()
+
+# Page content
+st.title("Tax Report")
+st.markdown("Yearly and monthly totals of your mileage and expenses for tax filing.")
+
+# Every number below comes from the precomputed rollups, never from individual trips or receipts
+yearly = get_rollups("year")
+
+if yearly.empty:
+    st.info("No trips or receipts logged yet. Totals will appear here once you add some.")
+    st.stop()
+
+years = sorted(yearly["period_start"].dt.year.unique().tolist(), reverse=True)
+selected_year = st.selectbox("Tax year", years)
+
+year_rows = yearly[yearly["period_start"].dt.year == selected_year]
+trip_rows = year_rows[year_rows["source"] == "mileage_log"]
+receipt_rows = year_rows[year_rows["source"] == "receipts"]
+
+total_miles = trip_rows["amount"].sum()
+total_expenses = receipt_rows["amount"].sum()
+
+# Year totals
+col_stat1, col_stat2, col_stat3, col_stat4, col_stat5 = st.columns(5)
+
+with col_stat1:
+    st.metric("Total Trips", int(trip_rows["row_count"].sum()))
+
+with col_stat2:
+    st.metric("Total Miles", f"{total_miles:.2f}")
+
+with col_stat3:
+    st.metric("Est. Deduction", f"${total_miles * MILEAGE_RATE:.2f}")
+
+with col_stat4:
+    st.metric("Receipts", int(receipt_rows["row_count"].sum()))
+
+with col_stat5:
+    st.metric("Total Expenses", f"${total_expenses:.2f}")
+
+st.caption(f"Estimated deduction uses the IRS standard mileage rate of ${MILEAGE_RATE:.3f} per mile.")
+
+st.divider()
+
+# Monthly breakdown
+st.header("Monthly Breakdown")
+
+monthly = get_rollups("month", date_from=date(selected_year, 1, 1), date_to=date(selected_year, 12, 31))
+monthly_totals = (
+    monthly.pivot_table(index="period_start", columns="source", values=["row_count", "amount"], aggfunc="sum")
+    if not monthly.empty else pd.DataFrame()
+)
+
+months = pd.date_range(f"{selected_year}-01-01", periods=12, freq="MS")
+breakdown = pd.DataFrame({"Month": months.strftime("%B")})
+for column, (value, source) in {
+    "Trips": ("row_count", "mileage_log"),
+    "Miles": ("amount", "mileage_log"),
+    "Receipts": ("row_count", "receipts"),
+    "Expenses": ("amount", "receipts"),
+}.items():
+    if (value, source) in monthly_totals.columns:
+        breakdown[column] = monthly_totals[(value, source)].reindex(months, fill_value=0).fillna(0).to_numpy()
+    else:
+        breakdown[column] = 0
+breakdown[["Trips", "Receipts"]] = breakdown[["Trips", "Receipts"]].astype(int)
+breakdown["Est. Deduction"] = breakdown["Miles"] * MILEAGE_RATE
+
+# Charts are indexed by YYYY-MM so the months sort in calendar order
+chart_data = breakdown.set_index(months.strftime("%Y-%m"))
+
+col_chart1, col_chart2 = st.columns(2)
+
+with col_chart1:
+    st.subheader("Miles by Month")
+    st.bar_chart(chart_data, y="Miles")
+
+with col_chart2:
+    st.subheader("Expenses by Month")
+    st.bar_chart(chart_data, y="Expenses")
+
+st.dataframe(
+    breakdown,
+    hide_index=True,
+    use_container_width=True,
+    column_config={
+        "Miles": st.column_config.NumberColumn("Miles", format="%.2f"),
+        "Expenses": st.column_config.NumberColumn("Expenses", format="$%.2f"),
+        "Est. Deduction": st.column_config.NumberColumn("Est. Deduction", format="$%.2f"),
+    }
+)
+
+st.download_button(
+    "Download monthly breakdown (CSV)",
+    breakdown.to_csv(index=False),
+    f"tax_report_{selected_year}_{datetime.now().strftime('%Y%m%d')}.csv",
+    "text/csv"
+)
+
+st.divider()
+
+# Totals by destination and by store
+col_trips, col_receipts = st.columns(2)
+
+with col_trips:
+    st.subheader("Miles by Destination")
+    if trip_rows.empty:
+        st.info(f"No trips logged in {selected_year}.")
+    else:
+        st.dataframe(
+            trip_rows.sort_values("amount", ascending=False)[["label", "row_count", "amount"]],
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                "label": "Destination",
+                "row_count": "Trips",
+                "amount": st.column_config.NumberColumn("Miles", format="%.2f"),
+            }
+        )
+
+with col_receipts:
+    st.subheader("Expenses by Store")
+    if receipt_rows.empty:
+        st.info(f"No receipts logged in {selected_year}.")
+    else:
+        st.dataframe(
+            receipt_rows.sort_values("amount", ascending=False)[["label", "row_count", "amount"]],
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                "label": "Store",
+                "row_count": "Receipts",
+                "amount": st.column_config.NumberColumn("Total", format="$%.2f"),
+            }
+        )
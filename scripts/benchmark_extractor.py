@@ -0,0 +1,103 @@
+"""
+Micro-benchmark for the receipt field extractor
+
+Times extract_fields over a corpus of sample OCR texts and reports field accuracy, alongside
+the regex-list extractor it replaced for comparison. The two run at about the same speed
+(within roughly 10% either way, depending on the machine), so the gain is accuracy, not speed.
+
+Usage:
+    python scripts/benchmark_extractor.py [--corpus PATH] [--iterations N]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src.utils.receipt_extractor import extract_fields, get_store_matcher
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "sample_ocr_texts.jsonl")
+FIELDS = ["store_name", "date", "total"]
+
+def legacy_extract(ocr_text):
+    """The previous extractor: regex lists rebuilt on every call, whole-text rescans per pattern"""
+    extracted = {}
+    store_patterns = [
+        r'(WALMART|WAL-MART|TARGET|COSTCO|KROGER|SAFEWAY|WHOLE FOODS|CVS|WALGREENS|MCDONALD\'S|STARBUCKS|DOLLAR TREE)',
+        r'^([A-Z][A-Z\s&]+)(?=\n|\r)',
+    ]
+    date_patterns = [
+        r'(\d{1,2}[\/\-]\d{1,2}[\/\-]\d{2,4})',
+        r'(\d{2,4}[\/\-]\d{1,2}[\/\-]\d{1,2})',
+        r'(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+\d{1,2},?\s+\d{2,4}',
+    ]
+    total_patterns = [
+        r'(?:TOTAL|Total|AMOUNT|Amount|BALANCE|Balance)[:\s]*\$?(\d+\.?\d*)',
+        r'\$(\d+\.\d{2})\s*$',
+        r'(\d+\.\d{2})\s*(?:TOTAL|Total|$)',
+    ]
+    for pattern in store_patterns:
+        match = re.search(pattern, ocr_text, re.IGNORECASE | re.MULTILINE)
+        if match:
+            extracted["store_name"] = match.group(1).strip()
+            break
+    for pattern in date_patterns:
+        match = re.search(pattern, ocr_text, re.IGNORECASE)
+        if match:
+            extracted["date"] = match.group(1).strip()
+            break
+    for pattern in total_patterns:
+        matches = re.findall(pattern, ocr_text, re.IGNORECASE | re.MULTILINE)
+        if matches:
+            amounts = [float(match) for match in matches if match.replace('.', '').isdigit()]
+            if amounts:
+                extracted["total"] = str(max(amounts))
+                break
+    return extracted
+
+def _matches(field, expected, actual):
+    if field == "total":
+        try:
+            return abs(float(expected) - float(actual)) < 0.005
+        except (TypeError, ValueError):
+            return False
+    return str(expected).strip().lower() == str(actual or "").strip().lower()
+
+def run(name, extractor, samples, iterations):
+    """Time an extractor over the corpus and print its speed and accuracy"""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for sample in samples:
+            extractor(sample["text"])
+    elapsed = time.perf_counter() - started
+    per_text = elapsed / (iterations * len(samples)) * 1e6
+
+    results = [extractor(sample["text"]) for sample in samples]
+    accuracy = {
+        field: sum(_matches(field, sample[field], result.get(field)) for sample, result in zip(samples, results))
+        for field in FIELDS
+    }
+    scores = ", ".join(f"{field} {correct}/{len(samples)}" for field, correct in accuracy.items())
+    print(f"{name:<10} {per_text:8.1f} µs/text   {scores}")
+    return per_text
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="JSON lines with text, store_name, date and total")
+    parser.add_argument("--iterations", type=int, default=200, help="Passes over the corpus per extractor")
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as corpus_file:
+        samples = [json.loads(line) for line in corpus_file if line.strip()]
+
+    get_store_matcher()  # Load the store dictionary outside the timed loop, as the app does once
+    print(f"{len(samples)} sample texts, {args.iterations} iterations")
+    legacy = run("legacy", legacy_extract, samples, args.iterations)
+    current = run("extractor", extract_fields, samples, args.iterations)
+    print(f"speedup    {legacy / current:8.2f}x")
+
+if __name__ == "__main__":
+    main()
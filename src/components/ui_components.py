@@ -1,12 +1,24 @@
 """
 UI components for the Mileage Manager application
 """
+import io
+import itertools
 import streamlit as st
 import pandas as pd
-from datetime import datetime
-from src.utils.google_api import get_google_address, get_mileage
+from datetime import datetime, timedelta
+from config.config import DISTANCE_MODE
+from src.utils.google_api import geocode_address, get_mileages
 from src.utils.ocr_utils import process_receipt_ocr
-from src.utils.supabase_utils import add_data
+from src.utils.ocr_jobs import submit_receipt_batch, get_batch_progress, collect_batch
+from src.utils.location_matrix import get_location_matrix
+from src.utils.supabase_utils import add_data, get_user_id, find_duplicate_receipts, PAGE_SIZE
+from src.utils.cache_utils import get_cache_stats
+
+# Seconds between progress checks while a batch of receipts is being processed
+RECEIPT_BATCH_POLL_SECONDS = 1
+
+# Shows the parsed date column of history pages as plain dates
+DATE_COLUMN_CONFIG = {"date": st.column_config.DateColumn("date", format="YYYY-MM-DD")}
 
 def parse_ocr_date(date_string):
     """
@@ -47,7 +59,101 @@ def parse_ocr_date(date_string):
     # If no format matches, return today's date
     return datetime.today().date()
 
-def render_trip_form(current_data_dict, current_data_log):
+def render_date_range_filter(date_filter):
+    """
+    Turn a date filter choice into a (date_from, date_to) range for the database query
+    Shows start/end date inputs for "Custom Range"; None means unbounded
+    """
+    today = datetime.today().date()
+
+    if date_filter == "Last 7 Days":
+        return today - timedelta(days=7), None
+    elif date_filter == "Last 30 Days":
+        return today - timedelta(days=30), None
+    elif date_filter == "This Month":
+        month_start = today.replace(day=1)
+        month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        return month_start, month_end
+    elif date_filter == "Custom Range":
+        col_date1, col_date2 = st.columns(2)
+        with col_date1:
+            start_date = st.date_input("Start Date", value=today - timedelta(days=30))
+        with col_date2:
+            end_date = st.date_input("End Date", value=today)
+        return start_date, end_date
+
+    return None, None
+
+def load_paginated(pages, state_key, filter_key, page_size=PAGE_SIZE):
+    """
+    Take as many pages from a page iterator as the user has loaded so far
+    Starts over at the first page whenever the filters change
+
+    Returns (DataFrame of the loaded rows, whether more rows may exist)
+    """
+    pages_key = f"{state_key}_pages_loaded"
+    filters_key = f"{state_key}_filters"
+    if st.session_state.get(filters_key) != filter_key:
+        st.session_state[filters_key] = filter_key
+        st.session_state[pages_key] = 1
+
+    chunks = list(itertools.islice(pages, st.session_state[pages_key]))
+    if not chunks:
+        return pd.DataFrame(), False
+
+    has_more = len(chunks) == st.session_state[pages_key] and len(chunks[-1]) == page_size
+    return pd.concat(chunks, ignore_index=True), has_more
+
+def render_load_more(state_key, has_more):
+    """Show a button that loads the next page of a paginated table"""
+    if has_more and st.button("Load more", key=f"{state_key}_load_more"):
+        st.session_state[f"{state_key}_pages_loaded"] += 1
+        st.rerun()
+
+def render_csv_export(pages, state_key, filter_key, file_name, label):
+    """
+    Build a CSV of every matching row on request and offer it for download
+    Rows are streamed page by page into the CSV instead of being held as one DataFrame
+    """
+    export_key = f"{state_key}_csv"
+    if st.button(label, key=f"{state_key}_prepare_csv"):
+        buffer = io.StringIO()
+        for i, chunk in enumerate(pages):
+            chunk.to_csv(buffer, index=False, header=(i == 0))
+        st.session_state[export_key] = (filter_key, buffer.getvalue())
+
+    # Only offer a prepared CSV while it still matches the current filters
+    prepared = st.session_state.get(export_key)
+    if prepared and prepared[0] == filter_key:
+        st.download_button(
+            label="Download as CSV",
+            data=prepared[1],
+            file_name=file_name,
+            mime="text/csv",
+            key=f"{state_key}_download_csv"
+        )
+
+def render_cache_stats():
+    """Show hit/miss counts of the local route, geocode and OCR caches since this server started"""
+    stats = get_cache_stats()
+    cache_cols = st.columns(3)
+    for col, (cache, label) in zip(cache_cols, [("route", "Route Cache"), ("geocode", "Geocode Cache"), ("ocr", "OCR Cache")]):
+        hits = stats.get(f"{cache}_hits", 0)
+        lookups = hits + stats.get(f"{cache}_misses", 0)
+        with col:
+            st.metric(label, f"{hits} / {lookups} hits")
+            if lookups:
+                st.caption(f"{hits / lookups:.0%} hit rate")
+
+def get_location_coordinates(current_data_dict):
+    """Map each saved location address to its (lat, lng), skipping locations without coordinates"""
+    if 'latitude' not in current_data_dict.columns or 'longitude' not in current_data_dict.columns:
+        return {}
+
+    located = current_data_dict.dropna(subset=['latitude', 'longitude'])
+    return dict(zip(located['location_address'], zip(located['latitude'], located['longitude'])))
+
+def render_trip_form(current_data_dict):
     """Render the form for adding new trips"""
     st.subheader("Add New Trip to Mileage Log")
     
@@ -62,6 +168,12 @@ def render_trip_form(current_data_dict, current_data_log):
             
         # Get locations list
         locations = current_data_dict['location_name'].tolist()
+
+        # Saved coordinates by address, used to estimate distances when the API is unavailable
+        coordinates = get_location_coordinates(current_data_dict)
+
+        # Precomputed distances between saved locations (refreshed in the background when stale)
+        location_matrix = get_location_matrix(get_user_id(), current_data_dict)
         
         # Start of form to add a new trip
         with st.form(key='mileage_log_form'):
@@ -110,34 +222,90 @@ def render_trip_form(current_data_dict, current_data_log):
                     start_location_address = current_data_dict[current_data_dict['location_name'] == start_location_name]['location_address'].values[0]
                     end_location_address = current_data_dict[current_data_dict['location_name'] == end_location_name]['location_address'].values[0]
                     
-                    # Calculate mileage between start_location_name and end_location_name
-                    total_mileage = get_mileage(start_location_address, end_location_address, start_location_name, end_location_name, current_data_log)
-
-                    if trip_date and total_mileage > 0:
+                    if trip_date:
                         # Convert trip_date to string
                         trip_date = trip_date.strftime("%Y-%m-%d")
 
-                        # Add the new trip to the session state entries list
-                        st.session_state.entries_mileage_log.append([trip_date, start_location_name, start_location_address, end_location_name, end_location_address, total_mileage])
-                        st.success(f"Trip added: {trip_date} - {start_location_name} to {end_location_name} - {total_mileage} miles")
+                        # Queue the trip; distances missing from the location matrix are fetched in one batch on submit
+                        total_mileage = location_matrix.lookup(start_location_address, end_location_address) if location_matrix else None
+                        mileage_estimated = False
+                        if total_mileage is None and DISTANCE_MODE != "api":
+                            # Show a cached or estimated distance right away without waiting on the API
+                            route = (start_location_address, end_location_address)
+                            mileages, estimated_routes = get_mileages([route], coordinates)
+                            total_mileage = mileages[route]
+                            mileage_estimated = route in estimated_routes
+
+                        st.session_state.entries_mileage_log.append([trip_date, start_location_name, start_location_address, end_location_name, end_location_address, total_mileage, mileage_estimated])
+                        st.success(f"Trip added: {trip_date} - {start_location_name} to {end_location_name}")
                     else:
-                        st.error("Please enter a valid trip date with non-zero mileage!")
+                        st.error("Please enter a valid trip date!")
                 else:
                     st.error("Please select both start and end locations!")
 
         # Display the current list of entries to be submitted (Mileage Log)
         if st.session_state.entries_mileage_log:
             st.write("### Trip Entries to Submit to Mileage Log")
-            entries_log_df = pd.DataFrame(st.session_state.entries_mileage_log, columns=["trip_date", "start_location_name", "start_location_address", "end_location_name","end_location_address", "total_mileage"])
+            st.caption("Any missing mileage is calculated for all pending trips at once when you submit.")
+            entries_log_df = pd.DataFrame(st.session_state.entries_mileage_log, columns=["trip_date", "start_location_name", "start_location_address", "end_location_name","end_location_address", "total_mileage", "estimated"])
             st.dataframe(entries_log_df, hide_index=True, height=200)
 
         # Submit Changes to Database
         if st.button("Submit Changes to Mileage Log"):
             if st.session_state.entries_mileage_log:
-                new_data_log = pd.DataFrame(st.session_state.entries_mileage_log, columns=["trip_date", "start_location_name", "start_location_address", "end_location_name","end_location_address", "total_mileage"])
-                add_data(new_data_log, "mileage_log")
-                st.session_state.entries_mileage_log = []
-                st.rerun()
+                # The location matrix may have finished building since the trips were queued, so take
+                # every distance it now has (this also replaces estimates shown when a trip was queued)
+                if location_matrix is not None:
+                    for entry in st.session_state.entries_mileage_log:
+                        matrix_mileage = location_matrix.lookup(entry[2], entry[4])
+                        if matrix_mileage is not None:
+                            entry[5] = matrix_mileage
+                            entry[6] = False
+
+                # Calculate the rest with as few Distance Matrix requests as possible
+                unresolved_entries = [
+                    entry for entry in st.session_state.entries_mileage_log
+                    if entry[5] is None or entry[6]
+                ]
+                mileages, estimated_routes = get_mileages(((entry[2], entry[4]) for entry in unresolved_entries), coordinates)
+                for entry in unresolved_entries:
+                    entry[5] = mileages[(entry[2], entry[4])]
+                    entry[6] = (entry[2], entry[4]) in estimated_routes
+
+                # Keep trips without a valid distance in the list so they can be fixed, and hold
+                # estimated distances until the user agrees to save them
+                save_estimates = st.session_state.get("save_estimated_mileage", False)
+                valid_entries = [entry for entry in st.session_state.entries_mileage_log if entry[5] > 0 and (save_estimates or not entry[6])]
+                zero_mileage_entries = [entry for entry in st.session_state.entries_mileage_log if not entry[5] > 0]
+                estimated_entries = [entry for entry in st.session_state.entries_mileage_log if entry[5] > 0 and entry[6] and not save_estimates]
+                rejected_entries = []
+
+                if valid_entries:
+                    new_data_log = pd.DataFrame([entry[:6] for entry in valid_entries], columns=["trip_date", "start_location_name", "start_location_address", "end_location_name","end_location_address", "total_mileage"])
+                    result = add_data(new_data_log, "mileage_log")
+                    # Trips the database rejected stay in the list too (add_data already showed why)
+                    rejected_entries = [valid_entries[row] for row, _ in result["failed"]]
+                st.session_state.entries_mileage_log = zero_mileage_entries + estimated_entries + rejected_entries
+
+                if zero_mileage_entries:
+                    st.error(f"Could not calculate a non-zero mileage for {len(zero_mileage_entries)} trip(s). They are still listed above.")
+                if estimated_entries:
+                    st.warning(
+                        f"Google could not calculate the distance for {len(estimated_entries)} trip(s), so their mileage "
+                        "is an estimate from saved coordinates. Submit again later to retry, or confirm below to save the estimates."
+                    )
+                if rejected_entries:
+                    st.error(f"{len(rejected_entries)} trip(s) could not be saved to the database. They are still listed above.")
+                if not st.session_state.entries_mileage_log:
+                    st.rerun()
+
+
+        # Estimated distances are only saved once the user says so
+        if any(entry[6] for entry in st.session_state.entries_mileage_log):
+            st.checkbox(
+                "Save estimated distances for trips marked as estimated (saved trips keep the estimate; edit them later if needed)",
+                key="save_estimated_mileage"
+            )
     else:
         st.warning("Please add locations to the Mileage Dictionary first!")
 
@@ -154,10 +322,12 @@ def render_location_form(current_data_dict):
     # Trigger Google Address Search when button is clicked
     if search_button:
         if location_address_search:
-            google_location_address = get_google_address(location_address_search)
-            if google_location_address:
-                # Save the address to session state when found
+            google_geocode = geocode_address(location_address_search)
+            if google_geocode:
+                # Save the address and its coordinates to session state when found
+                google_location_address = google_geocode["formatted_address"]
                 st.session_state.google_location_address = google_location_address
+                st.session_state.google_location_coordinates = (google_geocode["lat"], google_geocode["lng"])
                 st.success(f"Found Google Address: {google_location_address}")
             else:
                 st.error("No matching address found.")
@@ -192,8 +362,9 @@ def render_location_form(current_data_dict):
                 if location_name in location_names_in_entries or location_name in location_names_in_existing_dict:
                     st.error(f"Location '{location_name}' already exists in the Mileage Dictionary.")
                 else:
-                    # Add the new location to session state (or database)
-                    st.session_state.entries_mileage_dict.append([location_name, st.session_state["google_location_address"]])
+                    # Add the new location and its coordinates to session state (or database)
+                    latitude, longitude = st.session_state.get("google_location_coordinates", (None, None))
+                    st.session_state.entries_mileage_dict.append([location_name, st.session_state["google_location_address"], latitude, longitude])
                     st.success(f"Location added: {location_name} - {st.session_state['google_location_address']}")
             else:
                 st.error("Please enter both location name and address!")
@@ -201,19 +372,129 @@ def render_location_form(current_data_dict):
     # Display new locations added (but not yet submitted to database)
     if st.session_state.entries_mileage_dict:
         st.write("### Locations to Submit to Mileage Dictionary")
-        entries_dict_df = pd.DataFrame(st.session_state.entries_mileage_dict, columns=["Location Name", "Location Address"])
+        entries_dict_df = pd.DataFrame(
+            [entry[:2] for entry in st.session_state.entries_mileage_dict],
+            columns=["Location Name", "Location Address"]
+        )
         st.dataframe(entries_dict_df, hide_index=True, height=200)
     
     # Submit Changes to Database
     if st.button("Submit Changes to Mileage Dictionary"):
         if st.session_state.entries_mileage_dict:
             new_data_dict = pd.DataFrame(st.session_state.entries_mileage_dict)
-            add_data(new_data_dict, "Mileage_Dictionary")
+            result = add_data(new_data_dict, "Mileage_Dictionary")
             # Clear session state values (delete keys to reset form fields)
             if "google_location_address" in st.session_state:
                 del st.session_state["google_location_address"]
-            st.session_state.entries_mileage_dict = []
-            st.rerun()
+            st.session_state.pop("google_location_coordinates", None)
+            # Keep locations the database rejected so they can be retried
+            st.session_state.entries_mileage_dict = [st.session_state.entries_mileage_dict[row] for row, _ in result["failed"]]
+            if not result["failed"]:
+                st.rerun()
+
+def get_duplicate_image_warnings(content_hash):
+    """Warnings for a processed receipt image that was already saved or queued"""
+    warnings = []
+    saved = find_duplicate_receipts(content_hash=content_hash)
+    if not saved.empty:
+        first = saved.iloc[0]
+        warnings.append(
+            f"This image was already saved as a receipt: {first['store_name']} - ${first['total']} on {first['date']}"
+        )
+    if any(len(entry) > 4 and entry[4] == content_hash for entry in st.session_state.entries_receipts):
+        warnings.append("This image is already in the receipt entries waiting to be submitted")
+    return warnings
+
+def _parse_total(value):
+    """Parse a receipt total like "$1,234.50" to a float, or None if it is blank or not a number"""
+    try:
+        return float(str(value).replace('$', '').replace(',', ''))
+    except ValueError:
+        return None
+
+def get_duplicate_entry_warnings(receipt_date, store_name, total_amount):
+    """Warnings for a receipt whose date, store and total match one already saved or queued"""
+    total = float(total_amount.replace('$', '').replace(',', ''))
+    warnings = []
+    if not find_duplicate_receipts(date=receipt_date, store_name=store_name, total=total).empty:
+        warnings.append(f"A {store_name} receipt for ${total:.2f} on {receipt_date} is already saved")
+    for entry in st.session_state.entries_receipts:
+        # Batch and PDF entries can be queued without a total, and can never match one
+        if (entry[0] == receipt_date and entry[1].strip().lower() == store_name.strip().lower()
+                and _parse_total(entry[2]) == total):
+            warnings.append(f"A {store_name} receipt for ${total:.2f} on {receipt_date} is already waiting to be submitted")
+            break
+    return warnings
+
+def add_receipt_entries(receipts, content_hash):
+    """Queue OCR'd receipts (dicts with store_name, date and total) as pending receipt entries"""
+    upload_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for receipt in receipts:
+        st.session_state.entries_receipts.append([
+            parse_ocr_date(receipt["date"]).strftime("%Y-%m-%d"),
+            receipt["store_name"],
+            receipt["total"],
+            upload_timestamp,
+            content_hash
+        ])
+
+def render_receipt_batch_upload():
+    """
+    Render the multi-file receipt upload
+    Receipts are OCR'd by background jobs; every extracted receipt is added to the pending
+    receipt entries at once when the batch finishes
+    """
+    for message in st.session_state.pop("receipt_batch_messages", []):
+        st.warning(message)
+
+    batch_id = st.session_state.get("receipt_batch_id")
+    if batch_id is not None:
+        render_receipt_batch_progress(batch_id)
+        return
+
+    # A new key after each batch clears the uploaded files
+    uploader_key = f"receipt_batch_uploader_{st.session_state.get('receipt_batch_count', 0)}"
+    uploaded_files = st.file_uploader(
+        "Choose receipt image or PDF files",
+        type=['png', 'jpg', 'jpeg', 'pdf'],
+        accept_multiple_files=True,
+        key=uploader_key
+    )
+
+    if uploaded_files and st.button(f"Process {len(uploaded_files)} Receipts with OCR", key="process_ocr_batch"):
+        st.session_state.receipt_batch_id = submit_receipt_batch(
+            [(uploaded_file.name, uploaded_file.getvalue()) for uploaded_file in uploaded_files]
+        )
+        st.rerun()
+
+@st.fragment(run_every=RECEIPT_BATCH_POLL_SECONDS)
+def render_receipt_batch_progress(batch_id):
+    """Poll a running batch, showing its progress until every receipt is processed"""
+    progress = get_batch_progress(batch_id)
+    if progress is None:
+        # The server restarted and the batch was lost
+        del st.session_state["receipt_batch_id"]
+        st.session_state.receipt_batch_messages = ["The batch was interrupted. Please upload the receipts again."]
+        st.rerun()
+
+    finished, total = progress
+    st.progress(finished / total, text=f"Processed {finished} of {total} receipts")
+
+    results = collect_batch(batch_id)
+    if results is None:
+        return
+
+    messages = []
+    for name, result in results:
+        if not result["success"]:
+            messages.append(f"{name}: {result['error']}")
+            continue
+        add_receipt_entries(result["receipts"], result["content_hash"])
+
+    del st.session_state["receipt_batch_id"]
+    st.session_state.receipt_batch_count = st.session_state.get("receipt_batch_count", 0) + 1
+    st.session_state.receipt_batch_messages = messages
+    st.rerun()
 
 def render_receipt_section(current_receipts_df):
     """Render the receipt processing section"""
@@ -249,19 +530,42 @@ def render_receipt_section(current_receipts_df):
                         st.session_state.ocr_result = {
                             "store_name": ocr_result["store_name"],
                             "date": ocr_result["date"],
-                            "total": ocr_result["total"]
+                            "total": ocr_result["total"],
+                            "content_hash": ocr_result["content_hash"],
+                            "warnings": get_duplicate_image_warnings(ocr_result["content_hash"]),
+                            "receipts": ocr_result["receipts"],
+                            "raw_text": ocr_result["raw_text"],
+                            "timings": ocr_result["timings"]
                         }
-                        
-                        # Show extracted text for debugging
-                        with st.expander("View OCR Text (for debugging)"):
-                            st.text(ocr_result["raw_text"])
-                        
+
                         st.rerun()
                     else:
                         st.error(f"OCR processing failed: {ocr_result['error']}")
 
+        # Show the extracted text and step timings of the last processed receipt for debugging
+        if "raw_text" in st.session_state.get("ocr_result", {}):
+            with st.expander("View OCR Text (for debugging)"):
+                st.text(st.session_state.ocr_result["raw_text"])
+                st.caption(" · ".join(
+                    f"{step} {seconds:.2f}s" for step, seconds in st.session_state.ocr_result["timings"].items()
+                ))
+
+        with st.expander("Upload Multiple Receipts"):
+            render_receipt_batch_upload()
+
         # Manual entry form (in case OCR fails or for editing)
         st.subheader("Receipt Details")
+        for warning in st.session_state.get("ocr_result", {}).get("warnings", []):
+            st.warning(warning)
+
+        # A PDF statement can hold several receipts; the form below shows the first
+        found_receipts = st.session_state.get("ocr_result", {}).get("receipts", [])
+        if len(found_receipts) > 1:
+            st.info(f"Found {len(found_receipts)} receipts in this PDF. The first one is shown below.")
+            if st.button(f"Add all {len(found_receipts)} receipts to entries", key="add_all_pdf_receipts"):
+                add_receipt_entries(found_receipts, st.session_state.ocr_result["content_hash"])
+                del st.session_state["ocr_result"]
+                st.rerun()
         with st.form(key='receipt_form'):
             # Pre-populate with OCR results if available
             ocr_data = st.session_state.get("ocr_result", {})
@@ -297,12 +601,17 @@ def render_receipt_section(current_receipts_df):
                         # Add timestamp
                         upload_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                         
+                        # Warn (but don't block) if this purchase was already recorded
+                        for warning in get_duplicate_entry_warnings(receipt_date.strftime("%Y-%m-%d"), store_name, total_amount):
+                            st.warning(warning)
+                        
                         # Add to session state
                         st.session_state.entries_receipts.append([
                             receipt_date.strftime("%Y-%m-%d"),
                             store_name,
                             total_amount,
-                            upload_timestamp
+                            upload_timestamp,
+                            ocr_data.get("content_hash")
                         ])
                         
                         st.success(f"Receipt added: {store_name} - ${total_amount} on {receipt_date}")
@@ -319,7 +628,7 @@ def render_receipt_section(current_receipts_df):
     with receipt_col2:
         st.subheader("Current Receipts")
         if not current_receipts_df.empty:
-            st.dataframe(current_receipts_df, hide_index=True, height=300)
+            st.dataframe(current_receipts_df, hide_index=True, height=300, column_config=DATE_COLUMN_CONFIG)
         else:
             st.info("No receipts found. Upload your first receipt!")
         
@@ -328,17 +637,19 @@ def render_receipt_section(current_receipts_df):
             st.write("### Receipt Entries to Submit")
             entries_receipts_df = pd.DataFrame(
                 st.session_state.entries_receipts, 
-                columns=["Date", "Store Name", "Total", "Upload Timestamp"]
+                columns=["Date", "Store Name", "Total", "Upload Timestamp", "Content Hash"]
             )
-            st.dataframe(entries_receipts_df, hide_index=True, height=200)
+            st.dataframe(entries_receipts_df.drop(columns="Content Hash"), hide_index=True, height=200)
             
             # Submit receipts to Database
             if st.button("Submit Receipts to Database", key="submit_receipts"):
                 if st.session_state.entries_receipts:
                     new_receipts_data = pd.DataFrame(
                         st.session_state.entries_receipts,
-                        columns=["date", "store_name", "total", "upload_timestamp"]
+                        columns=["date", "store_name", "total", "upload_timestamp", "content_hash"]
                     )
-                    add_data(new_receipts_data, "Receipts")
-                    st.session_state.entries_receipts = []
-                    st.rerun()
+                    result = add_data(new_receipts_data, "Receipts")
+                    # Keep receipts the database rejected so they can be retried
+                    st.session_state.entries_receipts = [st.session_state.entries_receipts[row] for row, _ in result["failed"]]
+                    if not result["failed"]:
+                        st.rerun()
@@ -0,0 +1,273 @@
+"""
+Local persistent cache utilities backed by SQLite
+The cache file is shared by every session on the node and survives restarts
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+import streamlit as st
+from config.config import (
+    CACHE_DB_PATH,
+    ROUTE_CACHE_TTL_DAYS,
+    ROUTE_CACHE_MAX_ENTRIES,
+    ROUTE_CACHE_SYMMETRIC,
+    GEOCODE_CACHE_TTL_DAYS,
+    GEOCODE_CACHE_MAX_ENTRIES,
+    OCR_CACHE_TTL_DAYS,
+    OCR_CACHE_MAX_ENTRIES,
+)
+
+# sqlite3 connections are not safe to use from several threads at once
+_db_lock = threading.Lock()
+
+# Hit/miss counters for this process, e.g. {"geocode_hits": 12, "geocode_misses": 3}
+_cache_stats = Counter()
+
+# Common street words and their postal abbreviations
+ADDRESS_ABBREVIATIONS = {
+    "street": "st",
+    "avenue": "ave",
+    "road": "rd",
+    "boulevard": "blvd",
+    "drive": "dr",
+    "lane": "ln",
+    "court": "ct",
+    "place": "pl",
+    "parkway": "pkwy",
+    "highway": "hwy",
+    "suite": "ste",
+    "north": "n",
+    "south": "s",
+    "east": "e",
+    "west": "w",
+}
+
+@st.cache_resource
+def init_cache_db():
+    """Open the shared SQLite cache database and create the cache tables"""
+    cache_dir = os.path.dirname(CACHE_DB_PATH)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+
+    conn = sqlite3.connect(CACHE_DB_PATH, check_same_thread=False, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")  # Lets other processes read while we write
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS route_cache (
+            origin TEXT NOT NULL,
+            destination TEXT NOT NULL,
+            units TEXT NOT NULL,
+            distance REAL NOT NULL,
+            created_at REAL NOT NULL,
+            last_accessed REAL NOT NULL,
+            PRIMARY KEY (origin, destination, units)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_route_cache_accessed ON route_cache (last_accessed)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS geocode_cache (
+            query TEXT PRIMARY KEY,
+            formatted_address TEXT NOT NULL,
+            place_id TEXT,
+            lat REAL,
+            lng REAL,
+            created_at REAL NOT NULL,
+            last_accessed REAL NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_geocode_cache_accessed ON geocode_cache (last_accessed)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ocr_cache (
+            key TEXT PRIMARY KEY,
+            result TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_accessed REAL NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ocr_cache_accessed ON ocr_cache (last_accessed)")
+    conn.commit()
+    return conn
+
+def normalize_address(address):
+    """
+    Normalize an address or search query for use as a cache key
+    Lowercases, drops punctuation, abbreviates street words and collapses whitespace
+    so "123 Main Street." and "123 main st" share a key
+    """
+    if not address:
+        return ""
+    words = re.sub(r"[.,#;]", " ", str(address).lower()).split()
+    return " ".join(ADDRESS_ABBREVIATIONS.get(word, word) for word in words)
+
+def get_cache_stats():
+    """Return the cache hit/miss counters for this process"""
+    return dict(_cache_stats)
+
+def _fetch_fresh(conn, table, where, key, ttl_days, columns):
+    """
+    Fetch one unexpired cache row and mark it as recently used
+    Expired rows are deleted so the caller refreshes them
+    Must be called with _db_lock held
+    """
+    row = conn.execute(f"SELECT {columns}, created_at FROM {table} WHERE {where}", key).fetchone()
+    if row is None:
+        return None
+
+    now = time.time()
+    if row[-1] < now - ttl_days * 86400:
+        conn.execute(f"DELETE FROM {table} WHERE {where}", key)
+        conn.commit()
+        return None
+
+    # Record the access for LRU eviction
+    conn.execute(f"UPDATE {table} SET last_accessed = ? WHERE {where}", (now, *key))
+    conn.commit()
+    return row[:-1]
+
+def _evict_lru(conn, table, max_entries):
+    """Delete the least recently used rows once a cache table is over capacity"""
+    count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    if count > max_entries:
+        conn.execute(
+            f"DELETE FROM {table} WHERE rowid IN "
+            f"(SELECT rowid FROM {table} ORDER BY last_accessed LIMIT ?)",
+            (count - max_entries,)
+        )
+
+def get_cached_distance(origin_address, destination_address, units="imperial", symmetric=ROUTE_CACHE_SYMMETRIC):
+    """
+    Look up a route distance in the shared route cache
+    Returns the distance in the requested units, or None on a miss or expired entry
+    """
+    origin = normalize_address(origin_address)
+    destination = normalize_address(destination_address)
+    keys = [(origin, destination, units)]
+    if symmetric and origin != destination:
+        keys.append((destination, origin, units))
+
+    try:
+        conn = init_cache_db()
+        with _db_lock:
+            for key in keys:
+                row = _fetch_fresh(
+                    conn, "route_cache", "origin = ? AND destination = ? AND units = ?",
+                    key, ROUTE_CACHE_TTL_DAYS, "distance"
+                )
+                if row is not None:
+                    _cache_stats["route_hits"] += 1
+                    return row[0]
+    except sqlite3.Error:
+        # The cache is best-effort; fall back to the API
+        pass
+
+    _cache_stats["route_misses"] += 1
+    return None
+
+def set_cached_distance(origin_address, destination_address, distance, units="imperial"):
+    """Store a route distance in the shared route cache, evicting least recently used routes"""
+    now = time.time()
+    key = (normalize_address(origin_address), normalize_address(destination_address), units)
+
+    try:
+        conn = init_cache_db()
+        with _db_lock:
+            conn.execute(
+                "INSERT OR REPLACE INTO route_cache (origin, destination, units, distance, created_at, last_accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (*key, float(distance), now, now)
+            )
+            _evict_lru(conn, "route_cache", ROUTE_CACHE_MAX_ENTRIES)
+            conn.commit()
+    except sqlite3.Error:
+        pass
+
+def get_cached_geocode(query):
+    """
+    Look up an address search in the shared geocode cache
+    Returns a dict with formatted_address, place_id, lat and lng, or None on a miss
+    """
+    try:
+        conn = init_cache_db()
+        with _db_lock:
+            row = _fetch_fresh(
+                conn, "geocode_cache", "query = ?", (normalize_address(query),),
+                GEOCODE_CACHE_TTL_DAYS, "formatted_address, place_id, lat, lng"
+            )
+    except sqlite3.Error:
+        row = None
+
+    if row is None:
+        _cache_stats["geocode_misses"] += 1
+        return None
+
+    _cache_stats["geocode_hits"] += 1
+    return {
+        "formatted_address": row[0],
+        "place_id": row[1],
+        "lat": row[2],
+        "lng": row[3]
+    }
+
+def set_cached_geocode(query, geocode):
+    """Store an address search result in the shared geocode cache"""
+    now = time.time()
+
+    try:
+        conn = init_cache_db()
+        with _db_lock:
+            conn.execute(
+                "INSERT OR REPLACE INTO geocode_cache "
+                "(query, formatted_address, place_id, lat, lng, created_at, last_accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    normalize_address(query),
+                    geocode["formatted_address"],
+                    geocode.get("place_id"),
+                    geocode.get("lat"),
+                    geocode.get("lng"),
+                    now,
+                    now
+                )
+            )
+            _evict_lru(conn, "geocode_cache", GEOCODE_CACHE_MAX_ENTRIES)
+            conn.commit()
+    except sqlite3.Error:
+        pass
+
+def get_cached_ocr(key):
+    """
+    Look up an OCR result by content key (image hash plus pipeline version)
+    Returns the stored result dict, or None on a miss or expired entry
+    """
+    try:
+        conn = init_cache_db()
+        with _db_lock:
+            row = _fetch_fresh(conn, "ocr_cache", "key = ?", (key,), OCR_CACHE_TTL_DAYS, "result")
+    except sqlite3.Error:
+        row = None
+
+    if row is None:
+        _cache_stats["ocr_misses"] += 1
+        return None
+
+    _cache_stats["ocr_hits"] += 1
+    return json.loads(row[0])
+
+def set_cached_ocr(key, result):
+    """Store an OCR result dict, evicting least recently used results"""
+    now = time.time()
+
+    try:
+        conn = init_cache_db()
+        with _db_lock:
+            conn.execute(
+                "INSERT OR REPLACE INTO ocr_cache (key, result, created_at, last_accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(result), now, now)
+            )
+            _evict_lru(conn, "ocr_cache", OCR_CACHE_MAX_ENTRIES)
+            conn.commit()
+    except sqlite3.Error:
+        pass
@@ -0,0 +1,27 @@
+"""
+Offline distance estimation from latitude/longitude coordinates
+"""
+import numpy as np
+from config.config import ROAD_CIRCUITY_FACTOR
+
+EARTH_RADIUS_MILES = 3958.8
+
+def haversine_miles(start_lat, start_lng, end_lat, end_lng):
+    """
+    Great-circle distance in miles between two points
+    Accepts scalars or NumPy arrays of matching shape
+    """
+    start_lat, start_lng, end_lat, end_lng = (
+        np.radians(np.asarray(value, dtype=float))
+        for value in (start_lat, start_lng, end_lat, end_lng)
+    )
+
+    a = (
+        np.sin((end_lat - start_lat) / 2) ** 2
+        + np.cos(start_lat) * np.cos(end_lat) * np.sin((end_lng - start_lng) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a))
+
+def estimate_road_miles(start_lat, start_lng, end_lat, end_lng, circuity_factor=ROAD_CIRCUITY_FACTOR):
+    """Estimate driving miles as the great-circle distance times a road circuity factor"""
+    return haversine_miles(start_lat, start_lng, end_lat, end_lng) * circuity_factor
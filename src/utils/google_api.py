@@ -1,81 +1,382 @@
 """
 Google API utilities for address lookup and distance calculations
 """
+import math
+import threading
+import time
+import numpy as np
 import requests
 import streamlit as st
-from functools import lru_cache
-from config.config import google_api_key
+from config.config import (
+    google_api_key,
+    ROUTE_CACHE_SYMMETRIC,
+    DISTANCE_MODE,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT,
+    HTTP_MAX_RETRIES,
+    HTTP_BACKOFF_FACTOR,
+)
+from src.utils.cache_utils import (
+    get_cached_distance,
+    set_cached_distance,
+    get_cached_geocode,
+    set_cached_geocode,
+)
+from src.utils.geo_utils import estimate_road_miles
+from src.utils.http_utils import get_http_session, get_google_rate_limiter
+from src.utils.workers import get_background_executor
+
+# Distance Matrix API limits for a single request
+MAX_MATRIX_ORIGINS = 25
+MAX_MATRIX_DESTINATIONS = 25
+MAX_MATRIX_ELEMENTS = 100
+
+# Distance Matrix bills every origin x destination element in a request, including ones no
+# trip needs. Packing routes together saves requests (and latency) but bills those extra
+# elements, so a request may carry at most this many unneeded elements
+MAX_MATRIX_WASTED_ELEMENTS = 10
+
+# Routes currently being refined on the background pool
+_refining_routes = set()
+_refining_lock = threading.Lock()
+
+def _google_get(url, params):
+    """
+    Send a GET request to a Google Maps API through the shared session
+    Retries OVER_QUERY_LIMIT responses with exponential backoff
+    """
+    session = get_http_session()
+    rate_limiter = get_google_rate_limiter()
+
+    for attempt in range(HTTP_MAX_RETRIES + 1):
+        rate_limiter.acquire()
+        response = session.get(url, params=params, timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+
+        # Google reports quota errors in the body of a 200 response
+        if response.status_code != 200 or response.json().get("status") != "OVER_QUERY_LIMIT":
+            return response
+        if attempt < HTTP_MAX_RETRIES:
+            time.sleep(HTTP_BACKOFF_FACTOR * (2 ** attempt))
+
+    return response
 
-# Caching the Google Address lookup to avoid redundant API calls
-@lru_cache(maxsize=100)
 def get_google_address(address):
     """Get formatted address from Google Places API"""
-    url = f"https://maps.googleapis.com/maps/api/place/textsearch/json?query={address}&key={google_api_key}"
+    geocode = geocode_address(address)
+    return geocode["formatted_address"] if geocode else None
+
+def geocode_address(address):
+    """
+    Look up an address with the Google Places API
+    Results are kept in the shared geocode cache so repeat searches skip the API
+
+    Returns a dict with formatted_address, place_id, lat and lng, or None if nothing was found
+    """
+    cached_geocode = get_cached_geocode(address)
+    if cached_geocode:
+        return cached_geocode
+
+    url = "https://maps.googleapis.com/maps/api/place/textsearch/json"
+    params = {
+        "query": address,
+        "key": google_api_key
+    }
 
     # Make the API request
-    response = requests.get(url)
+    try:
+        response = _google_get(url, params)
+    except requests.RequestException as e:
+        st.error(f"Address lookup failed: {str(e)}")
+        return None
     results = response.json()
 
     if response.status_code == 200 and "results" in results and len(results["results"]) > 0:
         # Use the first result to get the address
-        google_location_address = results["results"][0]["formatted_address"]
-        return google_location_address
+        result = results["results"][0]
+        location = result.get("geometry", {}).get("location", {})
+        geocode = {
+            "formatted_address": result["formatted_address"],
+            "place_id": result.get("place_id"),
+            "lat": location.get("lat"),
+            "lng": location.get("lng")
+        }
+        set_cached_geocode(address, geocode)
+        return geocode
     else:
         return None  # Return None if no result is found
 
-def get_mileage(start_location_address, end_location_address, start_location_name, end_location_name, current_data_log):
+def get_mileage(start_location_address, end_location_address, coordinates=None):
     """Calculate mileage between two locations using Google Distance Matrix API"""
-    # Check if the trip route already exists in the Mileage Log (to reuse cached distance)
-    if trip_exists(start_location_name, end_location_name, current_data_log):
-        # Find the existing mileage for this trip route
-        existing_mileage = current_data_log[
-            (current_data_log['start_location'] == start_location_name) & 
-            (current_data_log['end_location'] == end_location_name)
-        ]['distance'].values
-        if existing_mileage.size > 0:
-            # Return the existing mileage without showing a message (allows same route on different dates)
-            return existing_mileage[0]
+    route = (start_location_address, end_location_address)
+    mileages, _ = get_mileages([route], coordinates)
+    return mileages[route]
+
+def get_mileages(pairs, coordinates=None, mode=DISTANCE_MODE):
+    """
+    Calculate mileage for many routes using as few Distance Matrix requests as possible
+
+    Args:
+        pairs: Iterable of (start_address, end_address) tuples
+        coordinates: Optional dict mapping an address to its (lat, lng), used for offline estimates
+        mode: "api" to call the API and estimate only when it fails, "estimate" to never
+              call the API, or "background" to estimate now and refine in a background thread
+
+    Returns (dict mapping each pair to its mileage (0 if it could not be calculated),
+             set of pairs whose mileage is an offline estimate rather than a Google distance)
+    """
+    routes = list(dict.fromkeys(pairs))  # Dedupe while keeping order
+    mileages = {}
+    pending = []
+
+    # Answer what we can from the shared route cache
+    for route in routes:
+        cached_mileage = get_cached_distance(*route)
+        if cached_mileage is not None:
+            mileages[route] = round(cached_mileage)
+        else:
+            pending.append(route)
+
+    if pending and mode == "api":
+        distances, errors = _fetch_distances(pending)
+        for error in errors:
+            st.error(error)
+        for route, miles in distances.items():
+            mileages[route] = round(miles)
+    elif pending and mode == "background":
+        _refine_in_background(pending)
+
+    # Fall back to an offline estimate for anything the cache and API could not answer
+    missing = [route for route in routes if mileages.get(route) is None]
+    if missing:
+        mileages.update(estimate_mileages(missing, coordinates or {}))
+
+    return mileages, set(missing)
+
+def fetch_mileages(pairs):
+    """
+    Look up routes in the route cache and Distance Matrix API without showing any UI messages
+    Safe to call from background threads
+
+    Returns a dict mapping each route that could be resolved to its (unrounded) miles
+    """
+    distances = {}
+    pending = []
+    for route in dict.fromkeys(pairs):
+        cached_mileage = get_cached_distance(*route)
+        if cached_mileage is not None:
+            distances[route] = cached_mileage
+        else:
+            pending.append(route)
+
+    if pending:
+        fetched_distances, _ = _fetch_distances(pending)
+        distances.update(fetched_distances)
+
+    return distances
 
+def estimate_mileages(pairs, coordinates):
+    """
+    Estimate road mileage from saved coordinates without calling the API
+    Routes with an unknown endpoint are estimated as 0
+    """
+    pairs = list(pairs)
+    start_points = np.array([coordinates.get(route[0], (np.nan, np.nan)) for route in pairs], dtype=float).reshape(-1, 2)
+    end_points = np.array([coordinates.get(route[1], (np.nan, np.nan)) for route in pairs], dtype=float).reshape(-1, 2)
+
+    estimates = estimate_road_miles(start_points[:, 0], start_points[:, 1], end_points[:, 0], end_points[:, 1])
+    estimates = np.nan_to_num(np.round(estimates), nan=0)
+    return {route: int(miles) for route, miles in zip(pairs, estimates)}
+
+def _refine_in_background(routes):
+    """Fetch routes on the background pool so the next lookup finds them in the route cache"""
+    with _refining_lock:
+        routes = [route for route in routes if route not in _refining_routes]
+        _refining_routes.update(routes)
+    if not routes:
+        return
+
+    def refine():
+        try:
+            _fetch_distances(routes)
+        finally:
+            with _refining_lock:
+                _refining_routes.difference_update(routes)
+
+    get_background_executor().submit(refine)
+
+def _fetch_distances(routes):
+    """
+    Fetch route distances from the Distance Matrix API and store them in the route cache
+    Returns (dict mapping route to miles, list of error messages)
+    """
+    distances = {}
+    errors = []
+
+    # A route and its reverse only need one lookup when the cache treats them as the same
+    pending = {}  # Insertion-ordered set of routes that need the API
+    for route in routes:
+        if not (ROUTE_CACHE_SYMMETRIC and (route[1], route[0]) in pending):
+            pending[route] = None
+
+    for tile_origins, tile_destinations in _plan_matrix_tiles(pending):
+        tile_distances, tile_errors = _request_distance_matrix(tile_origins, tile_destinations, pending)
+        errors.extend(tile_errors)
+
+        for route, miles in tile_distances.items():
+            if route not in distances:
+                set_cached_distance(route[0], route[1], miles)
+                distances[route] = miles
+
+    # Routes skipped above reuse the distance of their reverse route
+    for route in routes:
+        reverse_route = (route[1], route[0])
+        if route not in distances and reverse_route in distances:
+            distances[route] = distances[reverse_route]
+
+    return distances, errors
+
+def _plan_matrix_tiles(routes):
+    """
+    Plan the Distance Matrix requests that cover a set of routes
+    Returns a list of (origins, destinations), each within the per-request limits
+
+    Two plans are compared: a uniform grid over every origin and destination (best when most
+    origins need most destinations), and origins packed together by the destinations they need
+    (best for sparse sets, like many unrelated trips). Requests are billed per element, so the
+    plan with fewer billed elements wins, and the one with fewer requests breaks ties
+    """
+    routes = list(dict.fromkeys(routes))
+    if not routes:
+        return []
+    return min(
+        _plan_grid_tiles(routes),
+        _plan_grouped_tiles(routes),
+        key=lambda tiles: (_billed_elements(tiles), len(tiles))
+    )
+
+def _billed_elements(tiles):
+    """Count the elements Google bills for a plan: every origin x destination pair sent"""
+    return sum(len(origins) * len(destinations) for origins, destinations in tiles)
+
+def _plan_grid_tiles(routes):
+    """Cover the routes with one tile shape repeated over all origins and destinations, skipping empty tiles"""
+    origins = list(dict.fromkeys(route[0] for route in routes))
+    destinations = list(dict.fromkeys(route[1] for route in routes))
+    wanted_routes = set(routes)
+
+    # Pick the tile shape (rows, cols) that covers the matrix in the fewest requests
+    best_tile = None
+    for rows in range(1, min(len(origins), MAX_MATRIX_ORIGINS) + 1):
+        cols = min(len(destinations), MAX_MATRIX_DESTINATIONS, MAX_MATRIX_ELEMENTS // rows)
+        request_count = math.ceil(len(origins) / rows) * math.ceil(len(destinations) / cols)
+        if best_tile is None or request_count < best_tile[0]:
+            best_tile = (request_count, rows, cols)
+    _, tile_rows, tile_cols = best_tile
+
+    tiles = []
+    for i in range(0, len(origins), tile_rows):
+        for j in range(0, len(destinations), tile_cols):
+            wanted = [
+                (origin, destination)
+                for origin in origins[i:i + tile_rows]
+                for destination in destinations[j:j + tile_cols]
+                if (origin, destination) in wanted_routes
+            ]
+            if wanted:
+                # Only send the origins and destinations this tile actually needs
+                tiles.append((
+                    list(dict.fromkeys(route[0] for route in wanted)),
+                    list(dict.fromkeys(route[1] for route in wanted))
+                ))
+    return tiles
+
+def _plan_grouped_tiles(routes):
+    """
+    Pack origins into requests one at a time, keeping origins that need the same destinations together
+    An origin only joins a request if the request stays within MAX_MATRIX_WASTED_ELEMENTS unneeded
+    elements; origins sharing a destination set add none, unrelated trips add more the larger the request
+    """
+    needs = {}
+    for origin, destination in routes:
+        needs.setdefault(origin, []).append(destination)
+
+    # Split origins needing more destinations than one request holds, then order them so
+    # identical destination sets sit next to each other
+    chunks = [
+        (origin, destinations[start:start + MAX_MATRIX_DESTINATIONS])
+        for origin, destinations in needs.items()
+        for start in range(0, len(destinations), MAX_MATRIX_DESTINATIONS)
+    ]
+    chunks.sort(key=lambda chunk: (-len(chunk[1]), sorted(chunk[1])))
+
+    tiles = []
+    tile_origins = {}
+    tile_destinations = {}
+    tile_needed = 0
+    for origin, destinations in chunks:
+        origins = {**tile_origins, origin: None}
+        merged = {**tile_destinations, **dict.fromkeys(destinations)}
+        needed = tile_needed + len(destinations)
+        if tile_origins and (
+            len(origins) > MAX_MATRIX_ORIGINS
+            or len(merged) > MAX_MATRIX_DESTINATIONS
+            or len(origins) * len(merged) > MAX_MATRIX_ELEMENTS
+            or len(origins) * len(merged) - needed > MAX_MATRIX_WASTED_ELEMENTS
+        ):
+            tiles.append((list(tile_origins), list(tile_destinations)))
+            origins = {origin: None}
+            merged = dict.fromkeys(destinations)
+            needed = len(destinations)
+        tile_origins, tile_destinations, tile_needed = origins, merged, needed
+    tiles.append((list(tile_origins), list(tile_destinations)))
+    return tiles
+
+def _request_distance_matrix(origins, destinations, wanted=None):
+    """
+    Make one Distance Matrix request
+    When wanted (a collection of routes) is given, other elements of the response are ignored,
+    since a request packing several trips may cover routes nobody asked for
+
+    Returns (dict mapping (origin, destination) to miles for every element that succeeded, list of error messages)
+    """
     url = "https://maps.googleapis.com/maps/api/distancematrix/json"
     params = {
-        "origins": start_location_address,
-        "destinations": end_location_address,
+        "origins": "|".join(origins),
+        "destinations": "|".join(destinations),
         "key": google_api_key
     }
 
+    distances = {}
+    errors = []
+
     # Make the API request
-    response = requests.get(url, params=params)
-    
+    try:
+        response = _google_get(url, params)
+    except requests.RequestException as e:
+        errors.append(f"Distance Matrix request failed: {str(e)}")
+        return distances, errors
+
     if response.status_code == 200:  # Check if the request was successful
         response_json = response.json()
         rows = response_json.get("rows", [])
-        
+
         if rows:
-            elements = rows[0].get("elements", [])
-            
-            if elements and elements[0].get("status") == "OK":
-                # Extract the distance in meters and convert to miles
-                distance = elements[0].get("distance", {}).get("value", 0)
-                if distance:
-                    return round(distance / 1609.34)  # Convert to miles
-                else:
-                    st.error("Distance value is missing.")
-            else:
-                st.error(f"Error in response: {elements[0].get('status')}")
+            for origin, row in zip(origins, rows):
+                for destination, element in zip(destinations, row.get("elements", [])):
+                    if wanted is not None and (origin, destination) not in wanted:
+                        continue
+                    if element.get("status") == "OK":
+                        # Extract the distance in meters and convert to miles
+                        distance = element.get("distance", {}).get("value")
+                        if distance is not None:
+                            distances[(origin, destination)] = distance / 1609.34
+                        else:
+                            errors.append(f"Distance value is missing for {origin} → {destination}.")
+                    else:
+                        errors.append(f"Error in response for {origin} → {destination}: {element.get('status')}")
         else:
-            st.error("No elements found in the API response.")
+            errors.append(f"No elements found in the API response: {response_json.get('status')}")
     else:
-        st.error(f"API request failed with status code: {response.status_code}")
-    
-    return 0  # Return 0 miles if there was any error
-
-def trip_exists(start_location_name, end_location_name, current_data_log):
-    """Check if a trip already exists in the Mileage Log dataframe"""
-    # Check if the trip exists in the current data log (compare both directions)
-    return (
-        (current_data_log['start_location'] == start_location_name) & 
-        (current_data_log['end_location'] == end_location_name)
-    ).any() or (
-        (current_data_log['start_location'] == end_location_name) & 
-        (current_data_log['end_location'] == start_location_name)
-    ).any()
+        errors.append(f"API request failed with status code: {response.status_code}")
+
+    return distances, errors
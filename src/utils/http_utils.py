@@ -0,0 +1,69 @@
+"""
+Shared HTTP session utilities for calls to external APIs
+"""
+import threading
+import time
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config.config import (
+    HTTP_POOL_SIZE,
+    HTTP_MAX_RETRIES,
+    HTTP_BACKOFF_FACTOR,
+    GOOGLE_REQUESTS_PER_SECOND,
+)
+
+class RateLimiter:
+    """
+    Thread-safe token bucket that limits how many requests start per second
+    Callers block in acquire() until a token is available
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Wait until a request may be sent"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+
+            time.sleep(wait_time)
+
+@st.cache_resource
+def get_http_session():
+    """
+    Create the process-wide requests session
+    Keeps connections alive between calls and retries connection errors and 5xx/429 responses
+    """
+    retry = Retry(
+        total=HTTP_MAX_RETRIES,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET"]),
+        respect_retry_after_header=True,
+        raise_on_status=False  # Hand the last response back instead of raising
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+@st.cache_resource
+def get_google_rate_limiter():
+    """Create the process-wide rate limiter for Google Maps API requests"""
+    return RateLimiter(GOOGLE_REQUESTS_PER_SECOND)
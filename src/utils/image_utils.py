@@ -0,0 +1,132 @@
+"""
+Image preprocessing steps that prepare receipt photos and scans for OCR
+Each step takes and returns a PIL image, so steps can be reused and reordered
+"""
+import time
+import numpy as np
+from PIL import Image, ImageOps
+from config.config import (
+    OCR_TARGET_DPI,
+    OCR_MAX_SIDE,
+    OCR_BINARIZE_WINDOW,
+    OCR_BINARIZE_OFFSET,
+    OCR_DESKEW_MAX_ANGLE,
+)
+
+# Below this the DPI in a file's metadata is usually a placeholder (phone cameras report 72)
+MIN_TRUSTED_DPI = 100
+
+# Skew is measured on a copy this wide, and smaller corrections are skipped
+DESKEW_PROBE_WIDTH = 800
+DESKEW_STEP = 0.5
+
+def load_for_ocr(image_file):
+    """
+    Open an uploaded image, decoding JPEGs at reduced size when they are far larger than OCR needs
+    The draft decode skips most of the work (and memory) of loading a 12+ MP photo
+    """
+    image_file.seek(0)
+    image = Image.open(image_file)
+    image.verify()  # Reject corrupt files before doing any work
+
+    # verify() leaves the image unusable, so reopen it
+    image_file.seek(0)
+    image = Image.open(image_file)
+    scale = OCR_MAX_SIDE / max(image.size)
+    if scale < 1:
+        image.draft('RGB', (round(image.width * scale), round(image.height * scale)))
+
+    # Fix image orientation using EXIF data if available
+    return ImageOps.exif_transpose(image)
+
+def to_grayscale(image):
+    """Convert to 8-bit grayscale; color carries no information for OCR"""
+    return image if image.mode == 'L' else ImageOps.grayscale(image.convert('RGB'))
+
+def normalize_resolution(image, target_dpi=OCR_TARGET_DPI, max_side=OCR_MAX_SIDE):
+    """
+    Scale an image to the resolution Tesseract reads best
+    Scans with a real DPI are resampled to target_dpi; everything is capped at max_side pixels
+    """
+    scale = 1.0
+    dpi = image.info.get('dpi', (0, 0))[0]
+    if dpi >= MIN_TRUSTED_DPI:
+        scale = min(target_dpi / dpi, 2.0)
+    scale = min(scale, max_side / max(image.size))
+    if abs(scale - 1) < 0.05:
+        return image
+
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    resample = Image.Resampling.LANCZOS if scale > 1 else Image.Resampling.BILINEAR
+    return image.resize(size, resample, reducing_gap=2.0 if scale < 1 else None)
+
+def adaptive_binarize(image, window=OCR_BINARIZE_WINDOW, offset=OCR_BINARIZE_OFFSET):
+    """
+    Threshold each pixel against the mean of its neighborhood (Bradley's method)
+    Handles uneven lighting and shadows across a phone photo, unlike a single global threshold
+    """
+    pixels = np.asarray(to_grayscale(image), dtype=np.uint8)
+    half = window // 2
+    window = 2 * half + 1
+
+    # Integral image of the edge-padded pixels, so every window sum is four slices. It is built
+    # in place as uint32: sums may wrap around on huge images, but the wraparound cancels in the
+    # four-slice difference because every window sum fits in 32 bits
+    padded = np.pad(pixels, half, mode='edge')
+    integral = np.zeros((padded.shape[0] + 1, padded.shape[1] + 1), dtype=np.uint32)
+    integral[1:, 1:] = padded
+    np.cumsum(integral, axis=0, out=integral)
+    np.cumsum(integral, axis=1, out=integral)
+    window_sums = integral[window:, window:] - integral[:-window, window:]
+    window_sums -= integral[window:, :-window]
+    window_sums += integral[:-window, :-window]
+    del integral, padded
+
+    thresholds = window_sums.astype(np.float32)
+    del window_sums
+    thresholds *= np.float32((1 - offset) / (window * window))
+    ink = pixels < thresholds
+    return Image.fromarray(np.where(ink, 0, 255).astype(np.uint8))
+
+def _line_sharpness(ink):
+    """Score how cleanly text rows separate; highest when lines are horizontal"""
+    profile = ink.sum(axis=1, dtype=np.float64)
+    return float(np.square(np.diff(profile)).sum())
+
+def deskew(image, max_angle=OCR_DESKEW_MAX_ANGLE):
+    """
+    Straighten a slightly rotated receipt
+    The skew is found on a small copy by maximizing the sharpness of the row projection profile
+    """
+    probe = to_grayscale(image)
+    if probe.width > DESKEW_PROBE_WIDTH:
+        probe = probe.resize(
+            (DESKEW_PROBE_WIDTH, max(1, round(probe.height * DESKEW_PROBE_WIDTH / probe.width))),
+            Image.Resampling.BILINEAR
+        )
+
+    best_angle, best_score = 0.0, None
+    for angle in np.arange(-max_angle, max_angle + DESKEW_STEP, DESKEW_STEP):
+        rotated = probe.rotate(float(angle), resample=Image.Resampling.NEAREST, fillcolor=255)
+        score = _line_sharpness(np.asarray(rotated) < 128)
+        if best_score is None or score > best_score:
+            best_angle, best_score = float(angle), score
+
+    if abs(best_angle) < DESKEW_STEP:
+        return image
+    fill = 255 if image.mode == 'L' else (255,) * len(image.getbands())
+    return image.rotate(best_angle, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=fill)
+
+def run_pipeline(image, steps):
+    """
+    Apply (name, step) pairs in order, timing each one
+
+    Returns:
+        (processed image, dict of step name -> seconds taken)
+    """
+    timings = {}
+    for name, step in steps:
+        started = time.perf_counter()
+        image = step(image)
+        timings[name] = time.perf_counter() - started
+    return image, timings
@@ -0,0 +1,202 @@
+"""
+Precomputed all-pairs mileage between a user's saved locations
+Trip entry looks distances up in the matrix instead of waiting on the Distance Matrix API
+"""
+import os
+import threading
+import time
+import numpy as np
+from config.config import LOCATION_MATRIX_DIR
+from src.utils.google_api import fetch_mileages
+from src.utils.workers import get_background_executor
+
+# In-memory matrices for this process, keyed by user id
+_matrices = {}
+_matrices_lock = threading.Lock()
+
+# One lock per user so two syncs for the same user never interleave
+_user_locks = {}
+
+# Users with a sync queued or running, so reruns don't queue duplicates
+_syncing_users = set()
+
+# Seconds to wait before retrying pairs whose lookup failed
+MATRIX_RETRY_SECONDS = 300
+
+# When each user's matrix last had failed pairs retried
+_last_retry = {}
+
+class LocationMatrix:
+    """Mileage between every pair of a user's saved locations (NaN where unknown)"""
+
+    def __init__(self, names, addresses, distances):
+        self.names = list(names)
+        self.addresses = list(addresses)
+        self.distances = distances
+        self.index = {address: i for i, address in enumerate(self.addresses)}
+
+    def signature(self):
+        """The (name, address) pairs the matrix was built for"""
+        return tuple(zip(self.names, self.addresses))
+
+    def has_missing(self):
+        """Whether any pair of different addresses has no distance yet (e.g. after an API error)"""
+        return bool(np.isnan(self.distances).any())
+
+    def lookup(self, start_location_address, end_location_address):
+        """
+        Return the mileage between two saved location addresses, or None if it is not known yet
+        Looking up by address keeps a stale matrix correct after a location is renamed or moved
+        """
+        start = self.index.get(start_location_address)
+        end = self.index.get(end_location_address)
+        if start is None or end is None:
+            return None
+
+        miles = self.distances[start, end]
+        return None if np.isnan(miles) else round(float(miles))
+
+def _matrix_path(user_id):
+    return os.path.join(LOCATION_MATRIX_DIR, f"{user_id}.npz")
+
+def _user_lock(user_id):
+    with _matrices_lock:
+        return _user_locks.setdefault(user_id, threading.Lock())
+
+def load_location_matrix(user_id):
+    """Return the stored matrix for a user from memory or disk, or None if there is none"""
+    with _matrices_lock:
+        matrix = _matrices.get(user_id)
+    if matrix is not None:
+        return matrix
+
+    try:
+        with np.load(_matrix_path(user_id)) as stored:
+            matrix = LocationMatrix(stored["names"].tolist(), stored["addresses"].tolist(), stored["distances"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+    with _matrices_lock:
+        _matrices[user_id] = matrix
+    return matrix
+
+def _save_location_matrix(user_id, matrix):
+    """Persist a matrix to disk and make it the current in-memory copy"""
+    os.makedirs(LOCATION_MATRIX_DIR, exist_ok=True)
+    temp_path = _matrix_path(user_id) + ".tmp.npz"
+    np.savez(
+        temp_path,
+        names=np.array(matrix.names, dtype=str),
+        addresses=np.array(matrix.addresses, dtype=str),
+        distances=matrix.distances
+    )
+    os.replace(temp_path, _matrix_path(user_id))  # Atomic, so readers never see a partial file
+
+    with _matrices_lock:
+        _matrices[user_id] = matrix
+
+def sync_location_matrix(user_id, locations):
+    """
+    Bring a user's matrix in line with their saved locations
+
+    Distances between locations whose name and address are unchanged are kept. Only the rows
+    and columns of new or changed locations are fetched, along with kept pairs whose earlier
+    lookup failed, and removed locations are dropped.
+
+    Args:
+        user_id: Owner of the locations
+        locations: DataFrame with location_name and location_address columns
+    """
+    names = locations["location_name"].tolist()
+    addresses = locations["location_address"].tolist()
+
+    with _user_lock(user_id):
+        old_matrix = load_location_matrix(user_id)
+        if (old_matrix is not None and old_matrix.signature() == tuple(zip(names, addresses))
+                and not old_matrix.has_missing()):
+            return old_matrix
+
+        distances = np.full((len(names), len(names)), np.nan, dtype=np.float32)
+        np.fill_diagonal(distances, 0)
+
+        # Copy over every pair whose endpoints did not change
+        old_pairs = {pair: i for i, pair in enumerate(old_matrix.signature())} if old_matrix else {}
+        kept_new = [i for i, pair in enumerate(zip(names, addresses)) if pair in old_pairs]
+        kept_old = [old_pairs[(names[i], addresses[i])] for i in kept_new]
+        if kept_new:
+            distances[np.ix_(kept_new, kept_new)] = old_matrix.distances[np.ix_(kept_old, kept_old)]
+        kept_set = set(kept_new)
+
+        # Retry kept pairs whose lookup failed last time
+        retry_cells = {}
+        for i, j in zip(*np.nonzero(np.isnan(distances))):
+            if i in kept_set and j in kept_set:
+                retry_cells.setdefault((addresses[i], addresses[j]), []).append((i, j))
+
+        # Fetch the rows and columns of new or changed locations
+        changed = sorted(set(range(len(names))) - kept_set)
+        row_cells = {}
+        column_cells = {}
+        if changed:
+            changed_set = set(changed)
+            for i in changed:
+                for j in range(len(names)):
+                    if addresses[i] == addresses[j]:
+                        distances[i, j] = distances[j, i] = 0
+                        continue
+                    row_cells.setdefault((addresses[i], addresses[j]), []).append((i, j))
+                    if j not in changed_set:
+                        column_cells.setdefault((addresses[j], addresses[i]), []).append((j, i))
+
+        # Rows and columns are fetched separately so each packs into narrow, full matrix tiles
+        for cells in (row_cells, column_cells, retry_cells):
+            if not cells:
+                continue
+            for route, miles in fetch_mileages(cells).items():
+                for cell in cells[route]:
+                    distances[cell] = miles
+
+        matrix = LocationMatrix(names, addresses, distances)
+        _save_location_matrix(user_id, matrix)
+        return matrix
+
+def schedule_location_matrix_sync(user_id, locations):
+    """Sync a user's matrix on the background pool without blocking the script run"""
+    if not user_id:
+        return
+    with _matrices_lock:
+        if user_id in _syncing_users:
+            return
+        _syncing_users.add(user_id)
+
+    locations = locations.copy()  # The caller's frame may change before the job runs
+
+    def sync():
+        try:
+            sync_location_matrix(user_id, locations)
+        finally:
+            with _matrices_lock:
+                _syncing_users.discard(user_id)
+
+    get_background_executor().submit(sync)
+
+def get_location_matrix(user_id, locations):
+    """
+    Return the user's matrix for trip entry
+    If it is missing or out of date, a background sync is started and the stored
+    (possibly partial) matrix is returned so the caller never waits on the network.
+    Pairs whose lookup failed are retried at most every MATRIX_RETRY_SECONDS.
+    """
+    matrix = load_location_matrix(user_id)
+    current_signature = tuple(zip(locations["location_name"], locations["location_address"]))
+    if matrix is None or matrix.signature() != current_signature:
+        schedule_location_matrix_sync(user_id, locations)
+    elif matrix.has_missing():
+        now = time.monotonic()
+        with _matrices_lock:
+            retry_due = now - _last_retry.get(user_id, float("-inf")) >= MATRIX_RETRY_SECONDS
+            if retry_due:
+                _last_retry[user_id] = now
+        if retry_due:
+            schedule_location_matrix_sync(user_id, locations)
+    return matrix
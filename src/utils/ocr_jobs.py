@@ -0,0 +1,69 @@
+"""
+Background OCR jobs for batch receipt uploads
+Batches run on a shared worker pool so the script run never blocks while receipts are processed
+"""
+import io
+import threading
+import time
+import uuid
+import streamlit as st
+from src.utils.ocr_utils import process_receipt_ocr
+from src.utils.workers import get_receipt_job_executor
+
+# Finished batches nobody collected (e.g. the browser tab was closed) are dropped after this long
+BATCH_RETENTION_SECONDS = 3600
+
+_batches_lock = threading.Lock()
+
+@st.cache_resource
+def _get_batches():
+    """Process-wide {batch id: (submit time, [(file name, future)])} for batches not yet collected"""
+    return {}
+
+def _run_job(data):
+    return process_receipt_ocr(io.BytesIO(data))
+
+def submit_receipt_batch(files):
+    """
+    Queue OCR for a list of (file name, image bytes) and return the batch id
+    The bytes are copied out of the uploads, so the jobs don't depend on the script run
+    """
+    executor = get_receipt_job_executor()
+    jobs = [(name, executor.submit(_run_job, data)) for name, data in files]
+
+    batch_id = uuid.uuid4().hex
+    now = time.time()
+    with _batches_lock:
+        batches = _get_batches()
+        for stale_id, (submitted_at, stale_jobs) in list(batches.items()):
+            if now - submitted_at > BATCH_RETENTION_SECONDS and all(future.done() for _, future in stale_jobs):
+                del batches[stale_id]
+        batches[batch_id] = (now, jobs)
+    return batch_id
+
+def get_batch_progress(batch_id):
+    """Return (finished jobs, total jobs) for a batch, or None if the batch is unknown"""
+    with _batches_lock:
+        _, jobs = _get_batches().get(batch_id, (None, None))
+    if jobs is None:
+        return None
+    return sum(future.done() for _, future in jobs), len(jobs)
+
+def collect_batch(batch_id):
+    """
+    Return [(file name, OCR result)] in upload order once every job in the batch has finished
+    and forget the batch; returns None while jobs are still running
+    """
+    with _batches_lock:
+        _, jobs = _get_batches().get(batch_id, (None, None))
+        if jobs is None or not all(future.done() for _, future in jobs):
+            return None
+        del _get_batches()[batch_id]
+
+    results = []
+    for name, future in jobs:
+        try:
+            results.append((name, future.result()))
+        except Exception as e:
+            results.append((name, {"success": False, "error": f"Error processing receipt: {str(e)}"}))
+    return results
@@ -2,92 +2,456 @@
 OCR processing utilities using Tesseract
 """
 import pytesseract
-from PIL import Image, ImageEnhance, ImageOps
-import re
-import io
+from PIL import Image
+import time
+import hashlib
+from concurrent.futures import as_completed
+from config.config import (
+    OCR_OSD_MAX_SIDE,
+    OCR_OSD_MIN_CONFIDENCE,
+    OCR_PROBE_MAX_SIDE,
+    OCR_PROBE_EARLY_EXIT_CONFIDENCE,
+    OCR_STORE_NAMES_PATH,
+    OCR_PSM,
+    OCR_OEM,
+    OCR_LANG,
+    OCR_AMOUNT_WHITELIST,
+    OCR_MODE,
+    OCR_LAYOUT_MAX_SIDE,
+    OCR_TARGET_DPI,
+    OCR_MAX_SIDE,
+    OCR_BINARIZE_WINDOW,
+    OCR_BINARIZE_OFFSET,
+    OCR_DESKEW_MAX_ANGLE,
+)
+from src.utils.workers import get_ocr_executor
+from src.utils.cache_utils import get_cached_ocr, set_cached_ocr
+from src.utils.pdf_utils import is_pdf, iter_pdf_pages
+from src.utils.receipt_extractor import (
+    extract_fields,
+    get_store_matcher,
+    load_store_names,
+    is_total_line,
+    has_date,
+    AMOUNT_WORD_PATTERN,
+    HEADER_LINES,
+)
+from src.utils.image_utils import (
+    load_for_ocr,
+    to_grayscale,
+    normalize_resolution,
+    adaptive_binarize,
+    deskew,
+    run_pipeline,
+)
 
-def auto_rotate_image(image):
+# Rotations tried by the fallback search, most common first (upright, then upside down)
+PROBE_ANGLES = [0, 180, 90, 270]
+
+# Clockwise rotations as lossless transposes (PIL's ROTATE_* constants turn counter-clockwise)
+CLOCKWISE_TRANSPOSES = {
+    90: Image.Transpose.ROTATE_270,
+    180: Image.Transpose.ROTATE_180,
+    270: Image.Transpose.ROTATE_90,
+}
+
+# Page segmentation mode for a single line of text, used for the bands read in "regions" mode
+SINGLE_LINE_PSM = 7
+
+# Padding around each band cropped in "regions" mode, in line heights
+REGION_PADDING = 0.5
+
+def tesseract_config(psm=OCR_PSM, whitelist=None):
+    """Tesseract options for the configured OCR profile, optionally limited to some characters"""
+    config = f"--psm {psm} --oem {OCR_OEM}"
+    if whitelist:
+        config += f" -c tessedit_char_whitelist={whitelist}"
+    return config
+
+def run_tesseract(function, *args, **kwargs):
     """
-    Automatically rotate image to optimal orientation for OCR
-    Tests all 4 orientations and returns the one with highest OCR confidence
+    Run a pytesseract call on the shared OCR pool and wait for its result
+    Bounds the number of Tesseract processes across all sessions; never call from an OCR pool thread
     """
-    best_image = image
-    best_confidence = 0
-    
-    # Test all 4 possible orientations (0°, 90°, 180°, 270°)
-    for angle in [0, 90, 180, 270]:
-        # Rotate image
-        if angle == 0:
-            rotated_image = image
+    return get_ocr_executor().submit(function, *args, **kwargs).result()
+
+def rotate_clockwise(image, angle):
+    """Rotate an image clockwise by a multiple of 90 degrees"""
+    angle %= 360
+    return image.transpose(CLOCKWISE_TRANSPOSES[angle]) if angle else image
+
+def downscale(image, max_side):
+    """Return a copy of the image shrunk so its longest side is at most max_side pixels"""
+    scale = max_side / max(image.size)
+    if scale >= 1:
+        return image
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    # reducing_gap shrinks by whole factors first, which is much faster on large photos
+    return image.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+def read_words(image, config=None):
+    """
+    OCR an image once and return its words as dicts with text, conf (0-100), left, top, width,
+    height and the block, paragraph and line Tesseract placed them in, in reading order
+    config defaults to the configured OCR profile
+    """
+    data = pytesseract.image_to_data(
+        image, lang=OCR_LANG, config=config or tesseract_config(), output_type=pytesseract.Output.DICT
+    )
+    words = []
+    for index, text in enumerate(data['text']):
+        conf = float(data['conf'][index])
+        # Rows for pages, blocks and lines (conf -1) and empty detections carry no text
+        if conf < 0 or not str(text).strip():
+            continue
+        words.append({
+            "text": str(text).strip(),
+            "conf": conf,
+            "left": data['left'][index],
+            "top": data['top'][index],
+            "width": data['width'][index],
+            "height": data['height'][index],
+            "block": data['block_num'][index],
+            "paragraph": data['par_num'][index],
+            "line": data['line_num'][index],
+        })
+    return words
+
+def words_to_lines(words):
+    """
+    Group words into text lines the way image_to_string lays them out
+    Returns a list of dicts with the line's text and words; an empty line separates blocks,
+    so "\n".join of the texts gives the receipt's raw text
+    """
+    lines = []
+    current_key = None
+    for word in words:
+        key = (word["block"], word["paragraph"], word["line"])
+        if key != current_key:
+            if lines and word["block"] != current_key[0]:
+                lines.append({"text": "", "words": []})
+            lines.append({"text": word["text"], "words": [word]})
+            current_key = key
         else:
-            rotated_image = image.rotate(-angle, expand=True)
-        
+            lines[-1]["text"] += " " + word["text"]
+            lines[-1]["words"].append(word)
+    return lines
+
+def mean_word_confidence(image):
+    """Average Tesseract word confidence for an image (0 if no words are found)"""
+    confidences = [word["conf"] for word in read_words(image) if word["conf"] > 0]
+    return sum(confidences) / len(confidences) if confidences else 0
+
+def detect_orientation(image):
+    """
+    Find the clockwise rotation (0, 90, 180 or 270) that makes the receipt upright
+
+    Tries Tesseract's orientation detection (OSD) on a downscaled copy first, which is a single
+    fast run. If OSD fails or is unsure, probes the rotations of a smaller copy by OCR word
+    confidence on the shared OCR pool, stopping as soon as one is confident enough.
+
+    Returns (angle, confidence, method) where method is "osd" or "probe"
+    """
+    try:
+        osd = run_tesseract(
+            pytesseract.image_to_osd, downscale(image, OCR_OSD_MAX_SIDE), output_type=pytesseract.Output.DICT
+        )
+        if osd['orientation_conf'] >= OCR_OSD_MIN_CONFIDENCE:
+            return osd['rotate'] % 360, osd['orientation_conf'], "osd"
+    except Exception:
+        # OSD needs a minimum amount of text; fall back to probing
+        pass
+
+    # Probe every rotation in parallel, stopping as soon as one is confident enough
+    probe = downscale(image, OCR_PROBE_MAX_SIDE)
+    executor = get_ocr_executor()
+    futures = {
+        executor.submit(mean_word_confidence, rotate_clockwise(probe, angle)): angle
+        for angle in PROBE_ANGLES
+    }
+
+    best_angle, best_confidence = 0, 0
+    for future in as_completed(futures):
         try:
-            # Get OCR confidence for this orientation
-            data = pytesseract.image_to_data(rotated_image, output_type=pytesseract.Output.DICT)
-            confidences = [int(conf) for conf in data['conf'] if int(conf) > 0]
-            
-            if confidences:
-                avg_confidence = sum(confidences) / len(confidences)
-                
-                # If this orientation has better confidence, use it
-                if avg_confidence > best_confidence:
-                    best_confidence = avg_confidence
-                    best_image = rotated_image
-        except:
+            confidence = future.result()
+        except Exception:
             # If OCR fails for this orientation, skip it
             continue
-    
-    return best_image
+
+        angle = futures[future]
+        if confidence > best_confidence:
+            best_angle, best_confidence = angle, confidence
+        if confidence >= OCR_PROBE_EARLY_EXIT_CONFIDENCE:
+            break
+
+    # Probes that haven't started yet are no longer needed
+    for future in futures:
+        future.cancel()
+
+    return best_angle, best_confidence, "probe"
+
+def auto_rotate_image(image):
+    """
+    Automatically rotate image to optimal orientation for OCR
+    Orientation is detected on downscaled copies; only the final rotation touches the full image
+    """
+    angle, _, _ = detect_orientation(image)
+    return rotate_clockwise(image, angle)
+
+# Bump whenever preprocessing, OCR or extraction changes, so cached OCR results are recomputed
+OCR_PIPELINE_VERSION = 4
+
+def _store_names_digest(path):
+    """Hash the store names a dictionary file defines, so editing it invalidates cached results"""
+    return hashlib.sha256(repr(sorted(load_store_names(path).items())).encode()).hexdigest()
+
+# Every setting that changes OCR results (Tesseract profile, layout pass, preprocessing,
+# orientation detection and the store name dictionary), part of the cache key; the rest
+# are folded into a short hash
+OCR_PROFILE = f"{OCR_MODE}-psm{OCR_PSM}-oem{OCR_OEM}-{OCR_LANG}-" + hashlib.sha256(repr((
+    OCR_AMOUNT_WHITELIST,
+    OCR_LAYOUT_MAX_SIDE,
+    OCR_TARGET_DPI,
+    OCR_MAX_SIDE,
+    OCR_BINARIZE_WINDOW,
+    OCR_BINARIZE_OFFSET,
+    OCR_DESKEW_MAX_ANGLE,
+    OCR_OSD_MAX_SIDE,
+    OCR_OSD_MIN_CONFIDENCE,
+    OCR_PROBE_MAX_SIDE,
+    OCR_PROBE_EARLY_EXIT_CONFIDENCE,
+    OCR_STORE_NAMES_PATH,
+    _store_names_digest(OCR_STORE_NAMES_PATH),
+)).encode()).hexdigest()[:12]
+
+# Bytes read at a time while hashing uploads
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Preprocessing applied to every receipt before OCR, in order
+PREPROCESS_STEPS = [
+    ("grayscale", to_grayscale),
+    ("normalize", normalize_resolution),
+    ("orient", auto_rotate_image),
+    ("binarize", adaptive_binarize),
+    ("deskew", deskew),
+]
+
+# PDF pages are rendered upright at the OCR resolution, so they skip normalizing and orientation
+PDF_PREPROCESS_STEPS = [
+    ("binarize", adaptive_binarize),
+    ("deskew", deskew),
+]
+
+def content_hash(image_file):
+    """SHA-256 hex digest of an uploaded file's bytes"""
+    image_file.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: image_file.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    image_file.seek(0)
+    return digest.hexdigest()
+
+def _band_box(words, image, scale=1.0):
+    """Bounding box of some words, scaled to the image and padded by REGION_PADDING line heights"""
+    height = max(word["height"] for word in words)
+    pad = REGION_PADDING * height
+    left = min(word["left"] for word in words) - pad
+    top = min(word["top"] for word in words) - pad
+    right = max(word["left"] + word["width"] for word in words) + pad
+    bottom = max(word["top"] + word["height"] for word in words) + pad
+    return (
+        max(0, int(left * scale)),
+        max(0, int(top * scale)),
+        min(image.width, int(right * scale) + 1),
+        min(image.height, int(bottom * scale) + 1),
+    )
+
+def _read_band(image, box, config, block, line=None):
+    """
+    OCR one band of an image; word boxes are moved into full-image coordinates and put in the
+    given block (and line, to join several crops into one text line)
+    """
+    words = read_words(image.crop(box), config)
+    for word in words:
+        word["left"] += box[0]
+        word["top"] += box[1]
+        word["block"] = block
+        if line is not None:
+            word["paragraph"], word["line"] = 1, line
+    return words
+
+def ocr_regions(image):
+    """
+    Two-stage OCR of a preprocessed receipt image
+    A cheap pass over a downscaled copy locates the header, date and total lines; only those
+    bands of the full image are then read, in parallel, with the amounts read against the amount
+    whitelist. Returns OCR lines like words_to_lines, or None when no total line was found.
+    """
+    layout_image = downscale(image, OCR_LAYOUT_MAX_SIDE)
+    scale = image.width / layout_image.width
+    lines = [line for line in words_to_lines(run_tesseract(read_words, layout_image)) if line["words"]]
+
+    # Each band is a list of (box, config) crops; the crops of a band are joined into one text line
+    bands = []
+    header = [word for line in lines[:HEADER_LINES] for word in line["words"]]
+    if header:
+        bands.append([(_band_box(header, image, scale), tesseract_config())])
+
+    found_total = False
+    for index, line in enumerate(lines[HEADER_LINES:], start=HEADER_LINES):
+        if has_date(line["text"]):
+            bands.append([(_band_box(line["words"], image, scale), tesseract_config(SINGLE_LINE_PSM))])
+        if not is_total_line(line["text"]):
+            continue
+
+        # The label and the amount are read separately, the amount only with amount characters
+        label_words, amount_words = line["words"], []
+        if AMOUNT_WORD_PATTERN.fullmatch(line["words"][-1]["text"]):
+            label_words, amount_words = line["words"][:-1], line["words"][-1:]
+        elif index + 1 < len(lines):
+            amount_words = lines[index + 1]["words"][-1:]  # Amount printed below its label
+        crops = [(_band_box(label_words, image, scale), tesseract_config(SINGLE_LINE_PSM))] if label_words else []
+        if amount_words:
+            crops.append((
+                _band_box(amount_words, image, scale),
+                tesseract_config(SINGLE_LINE_PSM, OCR_AMOUNT_WHITELIST),
+            ))
+        bands.append(crops)
+        found_total = True
+
+    if not found_total:
+        return None
+
+    executor = get_ocr_executor()
+    futures = [
+        [executor.submit(_read_band, image, box, config, block, line=1 if len(crops) > 1 else None) for box, config in crops]
+        for block, crops in enumerate(bands, start=1)
+    ]
+    words = [word for band in futures for future in band for word in future.result()]
+    return words_to_lines(words)
+
+def ocr_pdf_pages(pdf_file):
+    """
+    Read the text of every page of a PDF
+    Pages are rendered one at a time and their OCR runs on the shared pool while the next page
+    renders; the pool's queue limit keeps the number of rendered pages in memory bounded
+
+    Returns (list of page texts, dict of step name -> total seconds)
+    """
+    timings = {"render": 0.0}
+    pages = []
+    executor = get_ocr_executor()
+    started = time.perf_counter()
+
+    for text, image in iter_pdf_pages(pdf_file):
+        timings["render"] += time.perf_counter() - started
+        if image is None:
+            # Text layer; no OCR needed
+            pages.append(text)
+        else:
+            image, step_timings = run_pipeline(image, PDF_PREPROCESS_STEPS)
+            for name, seconds in step_timings.items():
+                timings[name] = timings.get(name, 0.0) + seconds
+            pages.append(executor.submit(pytesseract.image_to_string, image, lang=OCR_LANG, config=tesseract_config()))
+        started = time.perf_counter()
+
+    started = time.perf_counter()
+    page_texts = [page if isinstance(page, str) else page.result() for page in pages]
+    timings["ocr"] = time.perf_counter() - started
+    return page_texts, timings
+
+def split_receipts(page_texts):
+    """
+    Split the page texts of a PDF into the text of each receipt it contains
+
+    A receipt ends at the first paragraph break (blank line) or page end after a total line,
+    so a statement with several receipts per page is split, and a long receipt continued on
+    the next page stays whole. Trailing text without a total joins the last receipt.
+    """
+    receipts = []
+    current = []
+    seen_total = False
+
+    for page_text in page_texts:
+        for line in page_text.splitlines() + [""]:  # A page end counts as a paragraph break
+            if seen_total and not line.strip():
+                receipts.append("\n".join(current).strip())
+                current, seen_total = [], False
+                continue
+            current.append(line)
+            if is_total_line(line):
+                seen_total = True
+
+    leftover = "\n".join(current).strip()
+    if leftover:
+        if receipts:
+            receipts[-1] += "\n" + leftover
+        else:
+            receipts.append(leftover)
+    return receipts or [""]
 
 def process_receipt_ocr(image_file):
     """
-    Use Tesseract OCR to extract store, date, and total from receipt image
+    Use Tesseract OCR to extract store, date, and total from receipt image or PDF
+    The image is preprocessed first; per-step timings (seconds) are returned under "timings"
+
+    A PDF can hold several receipts; every receipt found is returned under "receipts" (a list
+    of dicts with store_name, date, total and raw_text) and the top-level fields are the first
+
+    Results are cached by the image's SHA-256 (returned as "content_hash"), so processing the
+    same image again, on a rerun or as a duplicate upload, returns instantly with "cached" set
     """
     try:
-        # Reset file pointer to beginning
-        image_file.seek(0)
-        
-        # Convert uploaded file to PIL Image
-        image = Image.open(image_file)
-        
-        # Verify image is valid
-        image.verify()
-        
-        # Reopen image (verify() closes the file)
-        image_file.seek(0)
-        image = Image.open(image_file)
-        
-        # Convert to RGB if image is in a different mode (RGBA, P, etc.)
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Fix image orientation using EXIF data if available
-        image = ImageOps.exif_transpose(image)
-        
-        # Auto-rotate image to best orientation for OCR
-        image = auto_rotate_image(image)
-        
-        # Optional: Enhance image for better OCR results
-        # Uncomment these lines if OCR accuracy is poor
-        enhancer = ImageEnhance.Contrast(image)
-        image = enhancer.enhance(1.5)  # Increase contrast
-        enhancer = ImageEnhance.Sharpness(image)
-        image = enhancer.enhance(2.0)  # Increase sharpness
-        
-        # Perform OCR using Tesseract
-        ocr_text = pytesseract.image_to_string(image)
+        digest = content_hash(image_file)
+        cache_key = f"{OCR_PIPELINE_VERSION}:{OCR_PROFILE}:{digest}"
+        cached = get_cached_ocr(cache_key)
+        if cached is not None:
+            return {**cached, "content_hash": digest, "cached": True}
+
+        if is_pdf(image_file):
+            page_texts, timings = ocr_pdf_pages(image_file)
+            ocr_text = "\n\n".join(page_texts)
+            receipt_texts = split_receipts(page_texts)
+            receipt_lines = [None] * len(receipt_texts)  # Word boxes aren't kept across PDF pages
+        else:
+            image = load_for_ocr(image_file)
+            image, timings = run_pipeline(image, PREPROCESS_STEPS)
+            
+            # One Tesseract pass gives both the word boxes and the text built from them
+            started = time.perf_counter()
+            lines = ocr_regions(image) if OCR_MODE == "regions" else None
+            if lines is None:
+                # Full mode, or the layout pass found no total line to focus on
+                lines = words_to_lines(run_tesseract(read_words, image))
+            ocr_text = "\n".join(line["text"] for line in lines)
+            timings["ocr"] = time.perf_counter() - started
+            receipt_texts = [ocr_text]
+            receipt_lines = [lines]
         
-        # Extract information using regex patterns
-        extracted_data = extract_receipt_info(ocr_text)
+        # Extract the receipt fields from each receipt's text
+        receipts = []
+        for text, lines in zip(receipt_texts, receipt_lines):
+            extracted_data = extract_receipt_info(text, lines)
+            receipts.append({
+                "store_name": extracted_data["store_name"],
+                "date": extracted_data["date"],
+                "total": extracted_data["total"],
+                "confidence": extracted_data["confidence"],
+                "raw_text": text
+            })
         
-        return {
+        result = {
             "success": True,
-            "store_name": extracted_data.get("store_name", ""),
-            "date": extracted_data.get("date", ""),
-            "total": extracted_data.get("total", ""),
-            "raw_text": ocr_text
+            "store_name": receipts[0]["store_name"],
+            "date": receipts[0]["date"],
+            "total": receipts[0]["total"],
+            "confidence": receipts[0]["confidence"],
+            "raw_text": ocr_text,
+            "timings": timings,
+            "receipts": receipts
         }
+        set_cached_ocr(cache_key, result)
+        return {**result, "content_hash": digest, "cached": False}
     
     except Exception as e:
         return {
@@ -95,54 +459,10 @@ def process_receipt_ocr(image_file):
             "error": f"Error processing receipt: {str(e)}. Please try a different image format or ensure the image is not corrupted."
         }
 
-def extract_receipt_info(ocr_text):
+def extract_receipt_info(ocr_text, lines=None):
     """
-    Extract store name, date, and total from OCR text using regex patterns
+    Extract store name, date, and total from OCR text
+    lines (from words_to_lines) adds layout cues such as the right-aligned price column
+    Returns a dict with store_name, date, total and per-field confidence scores (0 to 1)
     """
-    extracted = {}
-    
-    # Common store name patterns (add more as needed)
-    store_patterns = [
-        r'(WALMART|WAL-MART|TARGET|COSTCO|KROGER|SAFEWAY|WHOLE FOODS|CVS|WALGREENS|MCDONALD\'S|STARBUCKS|DOLLAR TREE)',
-        r'^([A-Z][A-Z\s&]+)(?=\n|\r)',  # First line with all caps
-    ]
-    
-    # Date patterns (MM/DD/YYYY, DD/MM/YYYY, YYYY-MM-DD, etc.)
-    date_patterns = [
-        r'(\d{1,2}[\/\-]\d{1,2}[\/\-]\d{2,4})',
-        r'(\d{2,4}[\/\-]\d{1,2}[\/\-]\d{1,2})',
-        r'(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+\d{1,2},?\s+\d{2,4}',
-    ]
-    
-    # Total patterns (look for amounts near "total", "amount", etc.)
-    total_patterns = [
-        r'(?:TOTAL|Total|AMOUNT|Amount|BALANCE|Balance)[:\s]*\$?(\d+\.?\d*)',
-        r'\$(\d+\.\d{2})\s*$',  # Dollar amount at end of line
-        r'(\d+\.\d{2})\s*(?:TOTAL|Total|$)',  # Amount followed by total or end
-    ]
-    
-    # Extract store name
-    for pattern in store_patterns:
-        match = re.search(pattern, ocr_text, re.IGNORECASE | re.MULTILINE)
-        if match:
-            extracted["store_name"] = match.group(1).strip()
-            break
-    
-    # Extract date
-    for pattern in date_patterns:
-        match = re.search(pattern, ocr_text, re.IGNORECASE)
-        if match:
-            extracted["date"] = match.group(1).strip()
-            break
-    
-    # Extract total
-    for pattern in total_patterns:
-        matches = re.findall(pattern, ocr_text, re.IGNORECASE | re.MULTILINE)
-        if matches:
-            # Get the highest amount (likely the total)
-            amounts = [float(match) for match in matches if match.replace('.', '').isdigit()]
-            if amounts:
-                extracted["total"] = str(max(amounts))
-                break
-    
-    return extracted
+    return extract_fields(ocr_text, get_store_matcher(OCR_STORE_NAMES_PATH), lines)
@@ -0,0 +1,47 @@
+"""
+PDF receipt utilities
+Pages are read one at a time so large statements never have to fit in memory at once
+"""
+import pypdfium2 as pdfium
+from config.config import OCR_TARGET_DPI, OCR_MAX_SIDE
+
+# PDF canvas units per inch
+PDF_UNITS_PER_INCH = 72
+
+# A page whose text layer has at least this many non-space characters is read without OCR
+MIN_TEXT_LAYER_CHARS = 20
+
+def is_pdf(uploaded_file):
+    """Check an uploaded file's signature for a PDF header"""
+    uploaded_file.seek(0)
+    header = uploaded_file.read(5)
+    uploaded_file.seek(0)
+    return header == b"%PDF-"
+
+def iter_pdf_pages(pdf_file, dpi=OCR_TARGET_DPI, max_side=OCR_MAX_SIDE):
+    """
+    Yield (page text, page image) for each page of a PDF, one page at a time
+
+    Pages with a usable text layer (digital receipts and statements) yield their text and no
+    image. Other pages are rendered straight to grayscale at the OCR resolution, capped at
+    max_side pixels, and yield an empty text and the image to OCR.
+    """
+    pdf_file.seek(0)
+    document = pdfium.PdfDocument(pdf_file)
+    try:
+        for index in range(len(document)):
+            page = document[index]
+            try:
+                text_page = page.get_textpage()
+                text = text_page.get_text_bounded()
+                text_page.close()
+                if len("".join(text.split())) >= MIN_TEXT_LAYER_CHARS:
+                    yield text, None
+                    continue
+
+                scale = min(dpi / PDF_UNITS_PER_INCH, max_side / max(page.get_size()))
+                yield "", page.render(scale=scale, grayscale=True).to_pil()
+            finally:
+                page.close()
+    finally:
+        document.close()
@@ -0,0 +1,289 @@
+"""
+Single-pass receipt field extractor
+OCR text is tokenized once into dates, amounts, total labels and line breaks, candidates for
+each field are scored as the tokens stream past, and each field gets a confidence from 0 to 1
+"""
+import os
+import re
+from functools import lru_cache
+
+# Store names recognized on receipts (see the file for its format)
+DEFAULT_STORE_NAMES_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "data", "store_names.txt")
+
+MONTHS = r'(?:JAN|FEB|MAR|APR|MAY|JUN|JUL|AUG|SEP|SEPT|OCT|NOV|DEC)[A-Z]*\.?'
+
+# Scans the uppercased text once, yielding line breaks, dates, amounts and labels in order
+# (the lookahead and a single \b check gate every token, which keeps the scan cheap between tokens)
+TOKEN_PATTERN = re.compile(
+    r'(?=[\n0-9A-Z])(?:\n|\b(?:'
+    # Dates like 07/22/2025, 7-22-25, 2025-07-22 and JUL 22, 2025
+    r'(?P<date>\d{1,2}[/-]\d{1,2}[/-]\d{2,4}|\d{4}[/-]\d{1,2}[/-]\d{1,2}|' + MONTHS + r'[ \t]+\d{1,2},?[ \t]+\d{2,4})\b'
+    # Amounts with cents, like 25.99, 1,234.50 or 12,34 (OCR often reads the point as a comma)
+    r'|(?P<amount>(?:\d{1,3}(?:,\d{3})+|\d+)[.,]\d{2})(?![.,]?\d)'
+    r'|(?P<label>SUB[ \t]*-?[ \t]*TOTAL|GRAND[ \t]+TOTAL|(?:TOTAL|AMOUNT|BALANCE)[ \t]+DUE|TOTAL|AMOUNT|BALANCE|DATE'
+    r'|TAX|SAVINGS|SAVED|DISCOUNT|CHANGE|CASH|TENDERED|TIP|ITEMS?|POINTS|REWARDS?)\b'
+    r'))'
+)
+
+# Confidence that a line with each label holds the total
+TOTAL_LABEL_SCORES = {
+    "GRAND TOTAL": 0.95,
+    "TOTAL DUE": 0.95,
+    "AMOUNT DUE": 0.95,
+    "BALANCE DUE": 0.95,
+    "TOTAL": 0.85,
+    "AMOUNT": 0.6,
+    "BALANCE": 0.6,
+}
+
+# A whole OCR word that is an amount, like $18.00 or 2.00- (a discount)
+AMOUNT_WORD_PATTERN = re.compile(r'\$?((?:\d{1,3}(?:,\d{3})+|\d+)[.,]\d{2})-?')
+
+# Header lines made of capital letters, used as the store name when no known store is found
+CAPS_LINE_PATTERN = re.compile(r"^[A-Z][A-Z&'.\- ]{2,}$")
+
+NON_WORD_PATTERN = re.compile(r"[^A-Z0-9&]+")
+
+# Store names normally appear in the first few lines
+HEADER_LINES = 5
+
+def normalize_store_text(text):
+    """Uppercase and reduce to space-separated words, so "Wal-Mart" and "WAL MART" compare equal"""
+    return NON_WORD_PATTERN.sub(" ", text.upper().replace("'", "")).split()
+
+class StoreMatcher:
+    """
+    Word trie over known store names
+    Finds the longest known name in a line without trying each name in turn
+    """
+
+    # Trie key marking the end of a name
+    END = ""
+
+    def __init__(self, names):
+        # names maps each spelling to its display name
+        self.root = {}
+        for spelling, display_name in names.items():
+            words = normalize_store_text(spelling)
+            node = self.root
+            for word in words:
+                node = node.setdefault(word, {})
+            node[self.END] = (len(" ".join(words)), display_name)
+
+    def longest_match(self, line):
+        """Return the display name of the longest known store name in a line, or None"""
+        words = normalize_store_text(line)
+        best = None
+        for start in range(len(words)):
+            node = self.root
+            for word in words[start:]:
+                node = node.get(word)
+                if node is None:
+                    break
+                match = node.get(self.END)
+                if match and (best is None or match[0] > best[0]):
+                    best = match
+        return best[1] if best else None
+
+def load_store_names(path):
+    """
+    Read a store name dictionary file into {spelling: display name}
+    Each line is "Name" or "Name: alias, alias"; blank lines and # comments are skipped
+    """
+    names = {}
+    with open(path, encoding="utf-8") as store_file:
+        for line in store_file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            display_name, _, aliases = line.partition(":")
+            display_name = display_name.strip()
+            names[display_name] = display_name
+            for alias in aliases.split(","):
+                if alias.strip():
+                    names[alias.strip()] = display_name
+    return names
+
+@lru_cache(maxsize=None)
+def get_store_matcher(path=DEFAULT_STORE_NAMES_PATH):
+    """Build the store matcher for a dictionary file once per process"""
+    return StoreMatcher(load_store_names(path))
+
+def _parse_amount(text):
+    """Parse an amount token like "1,234.50" or "12,34" into a float"""
+    return int(text.replace(",", "").replace(".", "")) / 100
+
+def _label_kind(text):
+    """Normalize the spacing of a label token, e.g. "GRAND  TOTAL" to "GRAND TOTAL\""""
+    return " ".join(text.split()) if " " in text or "\t" in text else text
+
+def _date_confidence(text):
+    """How likely a date token is a real date: 0.9 if its numbers are in range, else 0.5"""
+    if text[0].isalpha():
+        return 0.9  # The month name already matched; the pattern bounds day and year
+
+    parts = [int(part) for part in text.replace("-", "/").split("/")]
+    if parts[0] > 31:
+        _, month, day = parts  # YYYY-MM-DD
+        valid = 1 <= month <= 12 and 1 <= day <= 31
+    else:
+        # MM/DD or DD/MM, so either order of month and day is accepted
+        low, high = sorted(parts[:2])
+        valid = 1 <= low <= 12 and high <= 31
+    return 0.9 if valid else 0.5
+
+def _price_column(lines):
+    """
+    For each OCR line (from words_to_lines), its last word as (amount text, word confidence)
+    when that word is an amount right-aligned in the receipt's price column, else None
+
+    The price column is the median right edge of line-ending amounts; amounts ending within
+    about two character heights of it count as aligned
+    """
+    endings = []
+    for line in lines:
+        word = line["words"][-1] if line["words"] else None
+        match = word and AMOUNT_WORD_PATTERN.fullmatch(word["text"])
+        endings.append((match.group(1), word) if match else None)
+
+    aligned = [None] * len(lines)
+    amount_words = sorted((ending[1] for ending in endings if ending), key=lambda word: word["left"] + word["width"])
+    if not amount_words:
+        return aligned
+
+    median_word = amount_words[len(amount_words) // 2]
+    column_right = median_word["left"] + median_word["width"]
+    tolerance = 2 * median_word["height"]
+    for index, ending in enumerate(endings):
+        if ending and abs(ending[1]["left"] + ending[1]["width"] - column_right) <= tolerance:
+            aligned[index] = (ending[0], ending[1]["conf"])
+    return aligned
+
+def is_total_line(line):
+    """Whether a line holds a receipt's grand total (not a subtotal, tax or change line)"""
+    labels = [_label_kind(match.group("label")) for match in TOKEN_PATTERN.finditer(line.upper()) if match.group("label")]
+    return any(TOTAL_LABEL_SCORES.get(label, 0) >= 0.85 for label in labels) and all(
+        label in TOTAL_LABEL_SCORES or label == "DATE" for label in labels
+    )
+
+def has_date(line):
+    """Whether a line contains something that looks like a date"""
+    return any(match.lastgroup == "date" for match in TOKEN_PATTERN.finditer(line.upper()))
+
+def extract_fields(ocr_text, store_matcher=None, lines=None):
+    """
+    Extract store name, date and total from receipt OCR text in a single pass
+
+    One compiled scanner walks the text once; its tokens (dates, amounts, labels and line
+    breaks) are scored line by line. Only the first few lines are checked for a store name.
+
+    With Tesseract's lines, the total is read from the right-aligned price column and its
+    confidence is weighted by the OCR confidence of the amount's word.
+
+    Args:
+        ocr_text: Text read from the receipt
+        store_matcher: StoreMatcher for known store names (defaults to the bundled dictionary)
+        lines: Optional OCR lines (from words_to_lines) that ocr_text was built from, one per text line
+
+    Returns:
+        dict with store_name, date and total (strings, "" when not found) and
+        confidence, a dict of the same keys with scores between 0 and 1
+    """
+    store_matcher = store_matcher or get_store_matcher()
+
+    # Store: a known store name in the header, or failing that a capitalized header line
+    store = ("", 0.0)
+    header = ocr_text.strip().split("\n", HEADER_LINES)[:HEADER_LINES]
+    for number, line in enumerate(header):
+        line = line.strip()
+        known_store = store_matcher.longest_match(line)
+        if known_store:
+            store = (known_store, 0.95)
+            break
+        if not store[0] and CAPS_LINE_PATTERN.match(line):
+            store = (line, 0.6 - 0.05 * number)
+
+    date = ("", 0.0)
+    total = (0.0, 0.0)  # (confidence, amount), so ties go to the larger amount
+    amounts = []  # Every amount token, parsed only if no labelled total is found
+    pending_label = 0.0  # Score of a total label whose amount is on the next line
+
+    # Layout cues, one entry per text line (None without word boxes)
+    price_column = _price_column(lines) if lines else None
+    column_amounts = []  # Amounts in the price column
+    line_number = 0
+
+    # Per-line state, reset at each line break
+    line_amounts = []
+    line_label = 0.0
+    line_excluded = False
+    line_date = None
+    line_date_label = False
+
+    upper_text = ocr_text.upper()
+    if len(upper_text) != len(ocr_text):
+        ocr_text = upper_text  # Rare characters like "ß" grow when uppercased, so offsets would drift
+    for token in TOKEN_PATTERN.finditer(upper_text + "\n"):
+        kind = token.lastgroup
+        if kind == "amount":
+            line_amounts.append(token.group(kind))
+        elif kind == "label":
+            label = _label_kind(token.group(kind))
+            if label in TOTAL_LABEL_SCORES:
+                line_label = max(line_label, TOTAL_LABEL_SCORES[label])
+            elif label == "DATE":
+                line_date_label = True
+            else:
+                # Subtotal, tax, change and the like: the line mentions a total but isn't one
+                line_excluded = True
+        elif kind == "date":
+            # Upper-casing keeps offsets, so the date is sliced from the original text
+            line_date = line_date or ocr_text[token.start(kind):token.end(kind)]
+        else:
+            # End of line: score what it held
+            if line_date:
+                confidence = _date_confidence(line_date) + (0.05 if line_date_label else 0)
+                if confidence > date[1]:
+                    date = (line_date, confidence)
+
+            label = 0.0 if line_excluded else line_label
+            if line_amounts:
+                amounts += line_amounts
+                score = label or pending_label * 0.8
+                amount_text = line_amounts[-1]
+                if price_column is not None:
+                    column_amount = price_column[line_number] if line_number < len(price_column) else None
+                    if column_amount:
+                        amount_text, word_confidence = column_amount
+                        column_amounts.append(amount_text)
+                        score *= 0.75 + word_confidence / 400  # A word Tesseract is unsure of costs up to a quarter
+                    else:
+                        score *= 0.8  # Amounts outside the price column are rarely what was paid
+                if score:
+                    # The right-most amount on a total line is the total ("AMOUNT DUE 0.00" after paying isn't)
+                    amount = _parse_amount(amount_text)
+                    if amount:
+                        total = max(total, (score, amount))
+            pending_label = label if label and not line_amounts else 0.0
+            line_number += 1
+
+            line_amounts = []
+            line_label = 0.0
+            line_excluded = False
+            line_date = None
+            line_date_label = False
+
+    # With no labelled total, the largest amount on the receipt (in its price column, if known) is the best guess
+    if not total[0] and amounts:
+        total = (0.3, max(map(_parse_amount, column_amounts or amounts)))
+
+    return {
+        "store_name": store[0],
+        "date": date[0],
+        "total": f"{total[1]:.2f}" if total[0] else "",
+        "confidence": {
+            "store_name": round(store[1], 2),
+            "date": round(date[1], 2),
+            "total": round(total[0], 2),
+        },
+    }
@@ -0,0 +1,386 @@
+"""
+Local SQLite replica of each user's Supabase tables
+After the first full load, reads only cost a delta query for rows changed since the last sync
+(updated_at high-water mark) plus tombstones for rows deleted since then
+Searches use a lowercase search column built once per synced row, indexed with FTS5 trigrams
+"""
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+import streamlit as st
+from config.config import REPLICA_DB_PATH, REPLICA_SYNC_INTERVAL_SECONDS, REPLICA_SYNC_OVERLAP_SECONDS
+from src.utils.auth import init_connection
+
+# Replicated columns and their SQLite types for each table (id, user_id and updated_at are implied)
+REPLICA_COLUMNS = {
+    "mileage_dictionary": {
+        "location_name": "TEXT",
+        "location_address": "TEXT",
+        "latitude": "REAL",
+        "longitude": "REAL",
+    },
+    "mileage_log": {
+        "date": "TEXT",
+        "start_location": "TEXT",
+        "start_address": "TEXT",
+        "end_location": "TEXT",
+        "end_address": "TEXT",
+        "distance": "REAL",
+    },
+    "receipts": {
+        "date": "TEXT",
+        "store_name": "TEXT",
+        "total": "REAL",
+        "upload_timestamp": "TEXT",
+        "content_hash": "TEXT",
+    },
+}
+
+# Columns matched by the search box for each table, joined into the replica's search_text column
+SEARCH_COLUMNS = {
+    "mileage_dictionary": ("location_name", "location_address"),
+    "mileage_log": ("start_location", "end_location", "start_address", "end_address"),
+    "receipts": ("store_name",),
+}
+
+# Trigram indexes only help searches of at least three characters
+SEARCH_INDEX_MIN_LENGTH = 3
+
+# Searches matching at most this many rows look them up through the index rather than scanning
+SEARCH_DIRECT_LIMIT = 500
+
+# Tables with a trigram search index (SQLite builds without FTS5 fall back to scanning search_text)
+_search_indexes = set()
+
+# Rows fetched per request while syncing
+SYNC_PAGE_SIZE = 1000
+
+# Oldest possible high-water mark, used before a table's first sync
+EPOCH = "1970-01-01T00:00:00+00:00"
+
+# sqlite3 connections are not safe to use from several threads at once
+_db_lock = threading.Lock()
+
+# One lock per (user, table) so two syncs of the same table never interleave
+_sync_locks = {}
+_sync_locks_lock = threading.Lock()
+
+def _table_columns(table):
+    return ["id", *REPLICA_COLUMNS[table]]
+
+@st.cache_resource
+def init_replica_db():
+    """Open the replica database, creating (or rebuilding) the replica tables"""
+    replica_dir = os.path.dirname(REPLICA_DB_PATH)
+    if replica_dir:
+        os.makedirs(replica_dir, exist_ok=True)
+
+    conn = sqlite3.connect(REPLICA_DB_PATH, check_same_thread=False, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sync_state (
+            user_id TEXT NOT NULL,
+            table_name TEXT NOT NULL,
+            rows_synced_to TEXT NOT NULL,
+            deletes_synced_to TEXT NOT NULL,
+            synced_at REAL NOT NULL,
+            PRIMARY KEY (user_id, table_name)
+        )
+    """)
+
+    for table, columns in REPLICA_COLUMNS.items():
+        expected = ["id", "user_id", *columns, "updated_at", "search_text"]
+        existing = [row["name"] for row in conn.execute(f"PRAGMA table_info({table})")]
+        if existing and existing != expected:
+            # The replicated columns changed, so rebuild the table with a full resync
+            conn.execute(f"DROP TABLE {table}")
+            conn.execute(f"DROP TABLE IF EXISTS {table}_search")
+            conn.execute("DELETE FROM sync_state WHERE table_name = ?", (table,))
+
+        column_defs = "".join(f"{name} {sql_type}, " for name, sql_type in columns.items())
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                id INTEGER NOT NULL,
+                user_id TEXT NOT NULL,
+                {column_defs}updated_at TEXT,
+                search_text TEXT NOT NULL DEFAULT '',
+                PRIMARY KEY (user_id, id)
+            )
+        """)
+        if "date" in columns:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_user_date ON {table} (user_id, date, id)")
+        _create_search_index(conn, table)
+
+    conn.commit()
+    return conn
+
+def _create_search_index(conn, table):
+    """
+    Create the trigram index over a table's search_text, kept current by triggers
+    Skipped (searches scan search_text instead) if this SQLite build lacks FTS5
+    """
+    try:
+        conn.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_search USING fts5("
+            f"search_text, content='{table}', content_rowid='rowid', tokenize='trigram')"
+        )
+    except sqlite3.OperationalError:
+        return
+
+    conn.executescript(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {table}_search (rowid, search_text) VALUES (new.rowid, new.search_text);
+        END;
+        CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {table}_search ({table}_search, rowid, search_text) VALUES ('delete', old.rowid, old.search_text);
+        END;
+        CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE OF search_text ON {table} BEGIN
+            INSERT INTO {table}_search ({table}_search, rowid, search_text) VALUES ('delete', old.rowid, old.search_text);
+            INSERT INTO {table}_search (rowid, search_text) VALUES (new.rowid, new.search_text);
+        END;
+    """)
+    _search_indexes.add(table)
+
+def _search_text(table, row):
+    """Lowercase text the search box matches for a row (one line per search column)"""
+    return "\n".join(str(row.get(column) or "") for column in SEARCH_COLUMNS.get(table, ())).lower()
+
+def _sync_lock(user_id, table):
+    with _sync_locks_lock:
+        return _sync_locks.setdefault((user_id, table), threading.Lock())
+
+def _parse_timestamp(value):
+    """Parse a PostgREST timestamptz into an aware UTC datetime"""
+    return datetime.fromisoformat(value).astimezone(timezone.utc)
+
+def _rewind(mark):
+    """
+    Move a high-water mark back by the overlap window
+    updated_at is the writing transaction's start time, so a slow transaction can commit rows
+    older than rows we already saw; re-reading a few seconds is cheap since upserts are idempotent
+    """
+    return (_parse_timestamp(mark) - timedelta(seconds=REPLICA_SYNC_OVERLAP_SECONDS)).isoformat()
+
+def _fetch_since(table, user_id, columns, time_column, since, equals=()):
+    """
+    Fetch every row of a user's Supabase table with time_column at or after since
+    Pages with a keyset on (time_column, id) so large loads are never cut off by the API's row limit,
+    even when many rows share one timestamp; equals is a tuple of (column, value) pairs that must match
+    """
+    supabase = init_connection()
+    rows = []
+    after = None
+
+    while True:
+        query = supabase.table(table).select(",".join(columns)).eq("user_id", user_id).gte(time_column, since)
+        for column, value in equals:
+            query = query.eq(column, value)
+        if after is not None:
+            last_time, last_id = after
+            query = query.or_(f'{time_column}.gt."{last_time}",and({time_column}.eq."{last_time}",id.gt.{last_id})')
+        page = query.order(time_column).order("id").limit(SYNC_PAGE_SIZE).execute().data
+        rows.extend(page)
+
+        if len(page) < SYNC_PAGE_SIZE:
+            return rows
+        after = (page[-1][time_column], page[-1]["id"])
+
+def _latest_mark(rows, time_column, current):
+    """Return the newest timestamp among the rows, or current if there are none newer"""
+    marks = [_parse_timestamp(row[time_column]) for row in rows]
+    marks.append(_parse_timestamp(current))
+    return max(marks).isoformat()
+
+def sync_table(user_id, table, force=False):
+    """
+    Bring the replica of a user's table up to date with Supabase
+
+    The first sync loads every row. Later syncs fetch only rows whose updated_at is past the
+    high-water mark and the tombstones of rows deleted since the last sync. Syncs are skipped
+    when the table was synced less than REPLICA_SYNC_INTERVAL_SECONDS ago, unless forced or
+    marked stale by a local write.
+    """
+    conn = init_replica_db()
+
+    with _sync_lock(user_id, table):
+        with _db_lock:
+            state = conn.execute(
+                "SELECT rows_synced_to, deletes_synced_to, synced_at FROM sync_state "
+                "WHERE user_id = ? AND table_name = ?",
+                (user_id, table)
+            ).fetchone()
+
+        if state is not None and not force and time.time() - state["synced_at"] < REPLICA_SYNC_INTERVAL_SECONDS:
+            return
+
+        started_at = time.time()
+        if state is None:
+            # Tombstones older than the first load can't refer to rows we will receive
+            tombstone_mark = _latest_tombstone(user_id, table)
+            rows = _fetch_since(table, user_id, [*_table_columns(table), "updated_at"], "updated_at", EPOCH)
+            tombstones = []
+            rows_mark = _latest_mark(rows, "updated_at", EPOCH)
+        else:
+            rows = _fetch_since(
+                table, user_id, [*_table_columns(table), "updated_at"], "updated_at",
+                _rewind(state["rows_synced_to"])
+            )
+            tombstones = _fetch_tombstones(user_id, table, _rewind(state["deletes_synced_to"]))
+            rows_mark = _latest_mark(rows, "updated_at", state["rows_synced_to"])
+            tombstone_mark = _latest_mark(tombstones, "deleted_at", state["deletes_synced_to"])
+
+        columns = ["id", "user_id", *REPLICA_COLUMNS[table], "updated_at", "search_text"]
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns[2:])
+        with _db_lock:
+            if state is None:
+                conn.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+            # An upsert rather than INSERT OR REPLACE, so the search index triggers see updates
+            conn.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+                f"ON CONFLICT (user_id, id) DO UPDATE SET {updates}",
+                [
+                    (row["id"], user_id, *(row.get(column) for column in REPLICA_COLUMNS[table]),
+                     row.get("updated_at"), _search_text(table, row))
+                    for row in rows
+                ]
+            )
+            # Tombstones are applied after the upserts, so a row deleted mid-sync ends up gone
+            conn.executemany(
+                f"DELETE FROM {table} WHERE user_id = ? AND id = ?",
+                [(user_id, tombstone["row_id"]) for tombstone in tombstones]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO sync_state (user_id, table_name, rows_synced_to, deletes_synced_to, synced_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (user_id, table, rows_mark, tombstone_mark, started_at)
+            )
+            conn.commit()
+
+def _latest_tombstone(user_id, table):
+    """Return the deleted_at of the user's newest tombstone for a table, or the epoch if none"""
+    supabase = init_connection()
+    rows = supabase.table("deleted_rows").select("deleted_at").eq("user_id", user_id).eq(
+        "table_name", table
+    ).order("deleted_at", desc=True).limit(1).execute().data
+    return _latest_mark(rows, "deleted_at", EPOCH)
+
+def _fetch_tombstones(user_id, table, since):
+    """
+    Fetch the user's tombstones for a table recorded at or after since
+    Paged like rows, since one bulk delete writes many tombstones with the same deleted_at
+    """
+    return _fetch_since(
+        "deleted_rows", user_id, ["id", "row_id", "deleted_at"], "deleted_at", since, (("table_name", table),)
+    )
+
+def mark_stale(user_id, table):
+    """Make the next read of a user's table run a delta sync, e.g. right after a local write"""
+    conn = init_replica_db()
+    with _db_lock:
+        conn.execute(
+            "UPDATE sync_state SET synced_at = 0 WHERE user_id = ? AND table_name = ?",
+            (user_id, table)
+        )
+        conn.commit()
+
+def _search_clause(table, search):
+    """
+    WHERE clause and parameters matching a search against a table's search_text
+
+    A selective search becomes the list of matching rows read from the trigram index. A search
+    matching more than SEARCH_DIRECT_LIMIT rows (or too short for trigrams) scans search_text
+    instead; so many rows match that an ordered page fills after a short scan.
+    """
+    if table in _search_indexes and len(search) >= SEARCH_INDEX_MIN_LENGTH:
+        conn = init_replica_db()
+        # A quoted phrase matches any substring of at least three characters
+        phrase = '"' + search.lower().replace('"', '""') + '"'
+        with _db_lock:
+            matches = [row[0] for row in conn.execute(
+                f"SELECT rowid FROM {table}_search WHERE {table}_search MATCH ? LIMIT ?",
+                (phrase, SEARCH_DIRECT_LIMIT + 1)
+            )]
+        if len(matches) <= SEARCH_DIRECT_LIMIT:
+            return f"rowid IN ({', '.join('?' for _ in matches)})", matches
+    return "instr(search_text, ?) > 0", [search.lower()]
+
+def _where(user_id, table, date_from=None, date_to=None, search=None, equals=()):
+    """
+    Build the WHERE clause and parameters for the shared date range and search filters
+    equals is a tuple of (column, value) pairs that must match exactly
+    """
+    clauses = ["user_id = ?"]
+    params = [user_id]
+    for column, value in equals:
+        clauses.append(f"{column} = ?")
+        params.append(value)
+    if date_from:
+        clauses.append("date >= ?")
+        params.append(str(date_from))
+    if date_to:
+        clauses.append("date <= ?")
+        params.append(str(date_to))
+    if search and table in SEARCH_COLUMNS:
+        clause, search_params = _search_clause(table, search)
+        if clause.startswith("rowid"):
+            # Look the few matching rows up by rowid rather than scanning the user's rows
+            clauses[0] = "+user_id = ?"
+        clauses.append(clause)
+        params.extend(search_params)
+    return " AND ".join(clauses), params
+
+def _check_columns(table, columns):
+    unknown = set(columns) - set(_table_columns(table))
+    if unknown:
+        raise ValueError(f"{table} replica has no column(s): {', '.join(sorted(unknown))}")
+
+def select_rows(user_id, table, columns=None, date_from=None, date_to=None, search=None,
+                order_by=None, descending=True, limit=None, after=None, equals=()):
+    """
+    Select a user's rows from the replica as a list of dicts
+    search matches SEARCH_COLUMNS case-insensitively as a substring
+    With after=(order value, id), returns the rows that follow that key in (order_by, id) order
+    """
+    columns = list(columns or _table_columns(table))
+    _check_columns(table, [*columns, *(column for column, _ in equals), *([order_by] if order_by else [])])
+
+    where, params = _where(user_id, table, date_from, date_to, search, equals)
+    direction = "DESC" if descending else "ASC"
+    sql = f"SELECT {', '.join(columns)} FROM {table} WHERE {where}"
+
+    if after is not None:
+        # Keyset condition: (order_by, id) strictly past the last row of the previous page
+        operator = "<" if descending else ">"
+        last_value, last_id = after
+        sql += f" AND ({order_by} {operator} ? OR ({order_by} = ? AND id {operator} ?))"
+        params += [last_value, last_value, last_id]
+    if order_by:
+        sql += f" ORDER BY {order_by} {direction}, id {direction}"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+
+    conn = init_replica_db()
+    with _db_lock:
+        return [dict(row) for row in conn.execute(sql, params)]
+
+def count_rows(user_id, table, date_from=None, date_to=None, search=None):
+    """Count a user's rows in the replica"""
+    where, params = _where(user_id, table, date_from, date_to, search)
+    conn = init_replica_db()
+    with _db_lock:
+        return conn.execute(f"SELECT COUNT(*) FROM {table} WHERE {where}", params).fetchone()[0]
+
+def aggregate_rows(user_id, table, column, date_from=None, date_to=None, search=None):
+    """Count a user's matching rows and sum and average a numeric column, in one query"""
+    _check_columns(table, [column])
+    where, params = _where(user_id, table, date_from, date_to, search)
+    conn = init_replica_db()
+    with _db_lock:
+        count, total, mean = conn.execute(
+            f"SELECT COUNT(*), TOTAL({column}), AVG({column}) FROM {table} WHERE {where}", params
+        ).fetchone()
+    return {"count": count, "sum": total, "mean": mean or 0.0}
@@ -1,11 +1,32 @@
 """
 Supabase database utilities for the mileage tracker application
 Replaces Google Sheets with Supabase PostgreSQL database
+Reads are served from a local replica kept current with delta syncs (see replica.py)
 """
 import streamlit as st
 import pandas as pd
 from datetime import datetime
 from src.utils.auth import init_connection
+from src.utils.replica import sync_table, select_rows, count_rows, aggregate_rows, mark_stale
+from src.utils.location_matrix import schedule_location_matrix_sync
+
+# Columns returned for each table
+DICTIONARY_COLUMNS = ["location_name", "location_address", "latitude", "longitude"]
+MILEAGE_LOG_COLUMNS = ["date", "start_location", "start_address", "end_location", "end_address", "distance"]
+RECEIPT_COLUMNS = ["date", "store_name", "total", "upload_timestamp"]
+
+# Fields returned by the dashboard_summary database function
+DASHBOARD_SUMMARY_FIELDS = ["location_count", "trip_count", "total_miles", "receipt_count", "receipt_total"]
+
+# Columns of the expense_rollups table read by reports
+ROLLUP_COLUMNS = ["period_start", "source", "label", "row_count", "amount"]
+
+# Rows per page for paginated reads shown in the UI, and for background streaming
+PAGE_SIZE = 100
+STREAM_PAGE_SIZE = 1000
+
+# Rows sent per multi-row insert request
+BULK_INSERT_CHUNK_SIZE = 500
 
 def get_user_id():
     """Get the current authenticated user's ID"""
@@ -13,33 +34,124 @@ def get_user_id():
         return st.session_state["user"].id
     return None
 
-def get_mileage_dictionary():
+def invalidate_table(table, user_id=None):
     """
-    Get all locations from Supabase mileage_dictionary table for current user
-    Returns a pandas DataFrame
+    Mark a user's table as changed after a write
+    The next read runs a delta sync instead of waiting for the sync interval
     """
+    mark_stale(user_id or get_user_id(), table)
+
+def _get_rows(table, **query):
+    """Read the current user's rows from a table through the local replica"""
+    user_id = get_user_id()
+    if not user_id:
+        return []
+    sync_table(user_id, table)
+    return select_rows(user_id, table, **query)
+
+def get_row_count(table, date_from=None, date_to=None, search=None):
+    """Get the number of rows the current user has in a Supabase table, optionally filtered"""
+    user_id = get_user_id()
+    if not user_id:
+        return 0
     try:
-        user_id = get_user_id()
-        if not user_id:
-            return pd.DataFrame(columns=["location_name", "location_address"])
-        
-        supabase = init_connection()
-        response = supabase.table('mileage_dictionary').select('*').eq('user_id', user_id).execute()
+        sync_table(user_id, table)
+        return count_rows(user_id, table, date_from, date_to, search)
+    except Exception as e:
+        st.error(f"Error counting {table}: {str(e)}")
+        return 0
+
+def _page_frame(rows, columns):
+    """Build a page's DataFrame with the date column parsed once, so pages never re-parse it"""
+    frame = pd.DataFrame(rows, columns=columns)
+    if "date" in frame:
+        frame["date"] = pd.to_datetime(frame["date"], format="ISO8601", errors="coerce")
+    return frame
+
+def iter_pages(table, columns, page_size=PAGE_SIZE, date_from=None, date_to=None, search=None,
+               order_by="date", descending=True):
+    """
+    Stream the current user's rows as DataFrame chunks of page_size rows
+    Uses keyset pagination on (order_by, id), so every page is a cheap indexed query
+    Pages come from the local replica, so reruns replay loaded pages without network calls
+    The date column of each page is datetime64
+    """
+    # The keyset columns must be part of every page
+    columns = list(dict.fromkeys(list(columns) + [order_by, "id"]))
+    after = None
+
+    while True:
+        rows = _get_rows(
+            table,
+            columns=tuple(columns),
+            date_from=date_from,
+            date_to=date_to,
+            search=search,
+            order_by=order_by,
+            descending=descending,
+            limit=page_size,
+            after=after
+        )
+        if not rows:
+            return
+
+        yield _page_frame(rows, columns)
+
+        if len(rows) < page_size:
+            return
+        after = (rows[-1][order_by], rows[-1]["id"])
+
+def get_summary(table, column, date_from=None, date_to=None, search=None):
+    """
+    Count the current user's matching rows and sum and average a numeric column over them
+    One aggregate query on the local replica; no rows are loaded
+    Returns a dict with count, sum and mean
+    """
+    user_id = get_user_id()
+    if not user_id:
+        return {"count": 0, "sum": 0.0, "mean": 0.0}
+    try:
+        sync_table(user_id, table)
+        return aggregate_rows(user_id, table, column, date_from, date_to, search)
+    except Exception as e:
+        st.error(f"Error summarizing {table}: {str(e)}")
+        return {"count": 0, "sum": 0.0, "mean": 0.0}
+
+def get_mileage_dictionary(include_ids=False, search=None):
+    """
+    Get locations from Supabase mileage_dictionary table for current user
+    Returns a pandas DataFrame (with an id column if include_ids is set)
+
+    Args:
+        include_ids: Also return the row id
+        search: Only return locations whose name or address contains this text
+    """
+    columns = (["id"] if include_ids else []) + DICTIONARY_COLUMNS
+    try:
+        rows = _get_rows(
+            'mileage_dictionary',
+            columns=tuple(columns),
+            search=search
+        )
         
-        if response.data:
-            df = pd.DataFrame(response.data)
-            # Only return the columns we need for the UI
-            return df[['location_name', 'location_address']]
+        if rows:
+            df = pd.DataFrame(rows)
+            return df.reindex(columns=columns)
         else:
-            return pd.DataFrame(columns=["location_name", "location_address"])
+            return pd.DataFrame(columns=columns)
     
     except Exception as e:
         st.error(f"Error loading locations: {str(e)}")
-        return pd.DataFrame(columns=["location_name", "location_address"])
+        return pd.DataFrame(columns=columns)
+
+def refresh_location_matrix(user_id):
+    """Start a background refresh of the user's location distance matrix after the dictionary changes"""
+    schedule_location_matrix_sync(user_id, get_mileage_dictionary())
 
-def add_location(location_name, location_address):
+def add_location(location_name, location_address, latitude=None, longitude=None):
     """
     Add a new location to Supabase mileage_dictionary table
+    Coordinates are optional and used for offline distance estimates
     """
     try:
         user_id = get_user_id()
@@ -62,18 +174,23 @@ def add_location(location_name, location_address):
         data = {
             "user_id": user_id,
             "location_name": location_name,
-            "location_address": location_address
+            "location_address": location_address,
+            "latitude": None if pd.isna(latitude) else latitude,
+            "longitude": None if pd.isna(longitude) else longitude
         }
         
         response = supabase.table('mileage_dictionary').insert(data).execute()
+        invalidate_table('mileage_dictionary', user_id)
+        refresh_location_matrix(user_id)
         return True
     
     except Exception as e:
         raise Exception(f"Error adding location: {str(e)}")
 
-def update_location(location_id, location_name, location_address):
+def update_location(location_id, location_name, location_address, latitude=None, longitude=None):
     """
     Update an existing location in Supabase mileage_dictionary table
+    Coordinates are replaced too, since they belong to the old address
     """
     try:
         user_id = get_user_id()
@@ -85,7 +202,9 @@ def update_location(location_id, location_name, location_address):
         # Update location
         data = {
             "location_name": location_name,
-            "location_address": location_address
+            "location_address": location_address,
+            "latitude": None if pd.isna(latitude) else latitude,
+            "longitude": None if pd.isna(longitude) else longitude
         }
         
         response = supabase.table('mileage_dictionary').update(data).eq(
@@ -94,6 +213,8 @@ def update_location(location_id, location_name, location_address):
             'user_id', user_id
         ).execute()
         
+        invalidate_table('mileage_dictionary', user_id)
+        refresh_location_matrix(user_id)
         return True
     
     except Exception as e:
@@ -117,41 +238,50 @@ def delete_location(location_id):
             'user_id', user_id
         ).execute()
         
+        invalidate_table('mileage_dictionary', user_id)
+        refresh_location_matrix(user_id)
         return True
     
     except Exception as e:
         raise Exception(f"Error deleting location: {str(e)}")
 
-def get_mileage_log():
+def get_mileage_log(include_ids=False, columns=None, date_from=None, date_to=None, search=None,
+                    order_by="date", descending=True):
     """
-    Get all trips from Supabase mileage_log table for current user
-    Returns a pandas DataFrame sorted by date (newest first)
+    Get trips from Supabase mileage_log table for current user
+    Filters, column selection and sorting run as SQL against the local replica
+
+    Args:
+        include_ids: Also return the row id
+        columns: Columns to return (defaults to the trip columns shown in the UI)
+        date_from, date_to: Only return trips on or between these dates
+        search: Only return trips whose locations or addresses contain this text
+        order_by, descending: Sort order (newest first by default)
+
+    Returns a pandas DataFrame
     """
+    columns = (["id"] if include_ids else []) + list(columns or MILEAGE_LOG_COLUMNS)
     try:
-        user_id = get_user_id()
-        if not user_id:
-            return pd.DataFrame(columns=["date", "start_location", "start_address", 
-                                        "end_location", "end_address", "distance"])
-        
-        supabase = init_connection()
-        response = supabase.table('mileage_log').select('*').eq(
-            'user_id', user_id
-        ).order('date', desc=True).execute()
+        rows = _get_rows(
+            'mileage_log',
+            columns=tuple(columns),
+            date_from=date_from,
+            date_to=date_to,
+            search=search,
+            order_by=order_by,
+            descending=descending
+        )
         
-        if response.data:
-            df = pd.DataFrame(response.data)
+        if rows:
+            df = pd.DataFrame(rows)
             # Only return the columns we need for the UI
-            columns = ["date", "start_location", "start_address", 
-                      "end_location", "end_address", "distance"]
             return df[columns]
         else:
-            return pd.DataFrame(columns=["date", "start_location", "start_address", 
-                                        "end_location", "end_address", "distance"])
+            return pd.DataFrame(columns=columns)
     
     except Exception as e:
         st.error(f"Error loading trips: {str(e)}")
-        return pd.DataFrame(columns=["date", "start_location", "start_address", 
-                                    "end_location", "end_address", "distance"])
+        return pd.DataFrame(columns=columns)
 
 def add_trip(date, start_location, start_address, end_location, end_address, distance):
     """
@@ -176,39 +306,119 @@ def add_trip(date, start_location, start_address, end_location, end_address, dis
         }
         
         response = supabase.table('mileage_log').insert(data).execute()
+        invalidate_table('mileage_log', user_id)
         return True
     
     except Exception as e:
         raise Exception(f"Error adding trip: {str(e)}")
 
-def get_receipts():
+def update_trip(trip_id, trip_data):
+    """
+    Update an existing trip in Supabase mileage_log table
+    """
+    try:
+        user_id = get_user_id()
+        if not user_id:
+            raise Exception("User not authenticated")
+        
+        supabase = init_connection()
+        
+        response = supabase.table('mileage_log').update(trip_data).eq(
+            'id', trip_id
+        ).eq(
+            'user_id', user_id
+        ).execute()
+        
+        invalidate_table('mileage_log', user_id)
+        return True
+    
+    except Exception as e:
+        raise Exception(f"Error updating trip: {str(e)}")
+
+def delete_trip(trip_id):
     """
-    Get all receipts from Supabase receipts table for current user
-    Returns a pandas DataFrame sorted by date (newest first)
+    Delete a trip from Supabase mileage_log table
     """
     try:
         user_id = get_user_id()
         if not user_id:
-            return pd.DataFrame(columns=["date", "store_name", "total", "upload_timestamp"])
+            raise Exception("User not authenticated")
         
         supabase = init_connection()
-        response = supabase.table('receipts').select('*').eq(
+        
+        response = supabase.table('mileage_log').delete().eq(
+            'id', trip_id
+        ).eq(
             'user_id', user_id
-        ).order('date', desc=True).execute()
+        ).execute()
+        
+        invalidate_table('mileage_log', user_id)
+        return True
+    
+    except Exception as e:
+        raise Exception(f"Error deleting trip: {str(e)}")
+
+def get_receipts(columns=None, date_from=None, date_to=None, search=None, order_by="date", descending=True):
+    """
+    Get receipts from Supabase receipts table for current user
+    Filters, column selection and sorting run as SQL against the local replica
+
+    Args:
+        columns: Columns to return (defaults to the receipt columns shown in the UI)
+        date_from, date_to: Only return receipts on or between these dates
+        search: Only return receipts whose store name contains this text
+        order_by, descending: Sort order (newest first by default)
+
+    Returns a pandas DataFrame
+    """
+    columns = list(columns or RECEIPT_COLUMNS)
+    try:
+        rows = _get_rows(
+            'receipts',
+            columns=tuple(columns),
+            date_from=date_from,
+            date_to=date_to,
+            search=search,
+            order_by=order_by,
+            descending=descending
+        )
         
-        if response.data:
-            df = pd.DataFrame(response.data)
+        if rows:
+            df = pd.DataFrame(rows)
             # Only return the columns we need for the UI
-            columns = ["date", "store_name", "total", "upload_timestamp"]
             return df[columns]
         else:
-            return pd.DataFrame(columns=["date", "store_name", "total", "upload_timestamp"])
+            return pd.DataFrame(columns=columns)
     
     except Exception as e:
         st.error(f"Error loading receipts: {str(e)}")
-        return pd.DataFrame(columns=["date", "store_name", "total", "upload_timestamp"])
+        return pd.DataFrame(columns=columns)
+
+def find_duplicate_receipts(content_hash=None, date=None, store_name=None, total=None):
+    """
+    Find the current user's saved receipts that look like the same purchase
+    Matches the same image (content_hash), or the same date, store and total
+
+    Returns a DataFrame of the matching receipts (empty if none)
+    """
+    columns = RECEIPT_COLUMNS
+    matches = []
+    try:
+        if content_hash:
+            matches += _get_rows('receipts', columns=tuple(columns), equals=(('content_hash', content_hash),))
+        if date and store_name and total is not None:
+            same_day = _get_rows('receipts', columns=tuple(columns), date_from=date, date_to=date)
+            matches += [
+                row for row in same_day
+                if str(row['store_name']).strip().lower() == str(store_name).strip().lower()
+                and abs(float(row['total'] or 0) - float(total)) < 0.005
+            ]
+    except Exception as e:
+        st.error(f"Error checking for duplicate receipts: {str(e)}")
 
-def add_receipt(date, store_name, total, ocr_raw_text=None):
+    return pd.DataFrame(matches, columns=columns).drop_duplicates()
+
+def add_receipt(date, store_name, total, ocr_raw_text=None, content_hash=None):
     """
     Add a new receipt to Supabase receipts table
     """
@@ -226,73 +436,202 @@ def add_receipt(date, store_name, total, ocr_raw_text=None):
             "store_name": store_name,
             "total": float(total) if total else 0.0,
             "upload_timestamp": datetime.now().isoformat(),
-            "ocr_raw_text": ocr_raw_text
+            "ocr_raw_text": ocr_raw_text,
+            "content_hash": content_hash
         }
         
         response = supabase.table('receipts').insert(data).execute()
+        invalidate_table('receipts', user_id)
         return True
     
     except Exception as e:
         raise Exception(f"Error adding receipt: {str(e)}")
 
+def get_dashboard_summary(date_from=None, date_to=None):
+    """
+    Get the current user's dashboard counts and totals from the dashboard_summary database function
+    A single call returning one row, however long the history; date_from/date_to limit trips and receipts
+
+    Returns a dict with location_count, trip_count, total_miles, receipt_count and receipt_total
+    """
+    summary = dict.fromkeys(DASHBOARD_SUMMARY_FIELDS, 0)
+    user_id = get_user_id()
+    if not user_id:
+        return summary
+    try:
+        supabase = init_connection()
+        rows = supabase.rpc("dashboard_summary", {
+            "summary_user_id": user_id,
+            "period_start": str(date_from) if date_from else None,
+            "period_end": str(date_to) if date_to else None,
+        }).execute().data
+        if rows:
+            summary.update({field: rows[0].get(field) or 0 for field in DASHBOARD_SUMMARY_FIELDS})
+    except Exception as e:
+        st.error(f"Error loading dashboard summary: {str(e)}")
+    return summary
+
+def get_recent_rows(table, columns, limit=5):
+    """
+    Get the current user's newest rows of a table (by date) with one small query
+    Returns a DataFrame of at most limit rows
+    """
+    user_id = get_user_id()
+    if not user_id:
+        return pd.DataFrame(columns=columns)
+    try:
+        supabase = init_connection()
+        rows = supabase.table(table).select(",".join(columns)).eq("user_id", user_id).order(
+            "date", desc=True
+        ).order("id", desc=True).limit(limit).execute().data
+        return pd.DataFrame(rows, columns=columns)
+    except Exception as e:
+        st.error(f"Error loading recent {table}: {str(e)}")
+        return pd.DataFrame(columns=columns)
+
+def get_rollups(period="month", date_from=None, date_to=None, source=None):
+    """
+    Get the current user's mileage and expense rollups, kept current by database triggers
+    Only rollup rows are read, so the cost doesn't grow with the number of trips or receipts
+
+    Args:
+        period: "month" or "year"
+        date_from, date_to: Only return periods starting on or between these dates
+        source: "mileage_log" (label is the destination, amount is miles) or
+            "receipts" (label is the store, amount is dollars); both by default
+
+    Returns a DataFrame with period_start (datetime64), source, label, row_count and amount
+    """
+    user_id = get_user_id()
+    if not user_id:
+        return pd.DataFrame(columns=ROLLUP_COLUMNS)
+    try:
+        supabase = init_connection()
+        query = supabase.table("expense_rollups").select(",".join(ROLLUP_COLUMNS)).eq("user_id", user_id).eq("period", period)
+        if date_from:
+            query = query.gte("period_start", str(date_from))
+        if date_to:
+            query = query.lte("period_start", str(date_to))
+        if source:
+            query = query.eq("source", source)
+        rows = query.order("period_start").execute().data
+
+        rollups = pd.DataFrame(rows, columns=ROLLUP_COLUMNS)
+        rollups["period_start"] = pd.to_datetime(rollups["period_start"])
+        rollups["amount"] = pd.to_numeric(rollups["amount"])
+        return rollups
+    except Exception as e:
+        st.error(f"Error loading rollups: {str(e)}")
+        return pd.DataFrame(columns=ROLLUP_COLUMNS)
+
 def get_data(table_name, create_if_missing=False, headers=None):
     """Get data from Supabase table"""
-    supabase_client = init_connection()
-    user_id = st.session_state.get("user").id if "user" in st.session_state else None
-    
-    if not user_id:
+    if not get_user_id():
         return pd.DataFrame()
     
-    try:
-        # Map table names to Supabase tables
-        if table_name == "Mileage_Dictionary":
-            response = supabase_client.table("mileage_dictionary").select("*").eq("user_id", user_id).execute()
-            
-            if response.data:
-                df = pd.DataFrame(response.data)
-                # Only return the columns we need for the UI
-                return df[['location_name', 'location_address']]
-            else:
-                return pd.DataFrame(columns=["location_name", "location_address"])
-        
-        elif table_name == "mileage_log":
-            response = supabase_client.table("mileage_log").select("*").eq("user_id", user_id).order("date", desc=True).execute()
-            
-            if response.data:
-                df = pd.DataFrame(response.data)
-                # Only return the columns we need for the UI
-                columns = ["date", "start_location", "start_address", 
-                          "end_location", "end_address", "distance"]
-                return df[columns]
-            else:
-                return pd.DataFrame(columns=["date", "start_location", "start_address", 
-                                            "end_location", "end_address", "distance"])
-        
-        elif table_name == "Receipts":
-            response = supabase_client.table("receipts").select("*").eq("user_id", user_id).order("date", desc=True).execute()
-            
-            if response.data:
-                df = pd.DataFrame(response.data)
-                # Only return the columns we need for the UI
-                columns = ["date", "store_name", "total", "upload_timestamp"]
-                return df[columns]
-            else:
-                return pd.DataFrame(columns=["date", "store_name", "total", "upload_timestamp"])
-        
-        else:
-            return pd.DataFrame()
-    except Exception as e:
-        st.error(f"Error loading data from {table_name}: {str(e)}")
+    # Map table names to Supabase tables
+    if table_name == "Mileage_Dictionary":
+        return get_mileage_dictionary()
+    elif table_name == "mileage_log":
+        return get_mileage_log()
+    elif table_name == "Receipts":
+        return get_receipts()
+    else:
         return pd.DataFrame()
 
+def _to_frame(data):
+    """Turn add_data input (DataFrame or a single list/tuple row) into a DataFrame"""
+    if isinstance(data, pd.DataFrame):
+        return data.reset_index(drop=True)
+    return pd.DataFrame([list(data)])
+
+def _optional_column(frame, position, default=None):
+    """Return the column at a position, or a column of defaults if the frame is narrower"""
+    if frame.shape[1] > position:
+        return frame.iloc[:, position]
+    return pd.Series(default, index=frame.index, dtype=object)
+
+def _parse_amounts(values):
+    """Parse amounts like "$1,234.50" to floats; blanks become 0.0 and anything else NaN"""
+    text = values.astype(str).str.replace(r"[$,\s]", "", regex=True)
+    amounts = pd.to_numeric(text, errors="coerce")
+    return amounts.mask(values.isna() | (text == ""), 0.0)
+
+def _build_records(frame, table_name, user_id):
+    """
+    Build the rows to insert column-wise
+    Returns (supabase table name, DataFrame of records, boolean Series marking invalid rows)
+    """
+    if table_name == "Mileage_Dictionary":
+        records = pd.DataFrame({
+            "user_id": user_id,
+            "location_name": frame.iloc[:, 0],  # First column
+            "location_address": frame.iloc[:, 1],  # Second column
+            "latitude": pd.to_numeric(_optional_column(frame, 2), errors="coerce"),
+            "longitude": pd.to_numeric(_optional_column(frame, 3), errors="coerce")
+        })
+        invalid = records["location_name"].isna() | records["location_address"].isna()
+        return "mileage_dictionary", records, invalid
+
+    if table_name == "mileage_log":
+        records = pd.DataFrame({
+            "user_id": user_id,
+            "date": frame.iloc[:, 0].astype(str),
+            "start_location": frame.iloc[:, 1],
+            "start_address": frame.iloc[:, 2],
+            "end_location": frame.iloc[:, 3],
+            "end_address": frame.iloc[:, 4],
+            "distance": pd.to_numeric(frame.iloc[:, 5], errors="coerce")
+        })
+        return "mileage_log", records, records["distance"].isna()
+
+    if table_name == "Receipts":
+        records = pd.DataFrame({
+            "user_id": user_id,
+            "date": frame.iloc[:, 0].astype(str),
+            "store_name": frame.iloc[:, 1],
+            "total": _parse_amounts(frame.iloc[:, 2]),
+            "upload_timestamp": _optional_column(frame, 3).fillna(datetime.now().isoformat()),
+            "content_hash": _optional_column(frame, 4)
+        })
+        return "receipts", records, records["total"].isna()
+
+    return None, None, None
+
+def _bulk_insert(supabase, table, records, chunk_size=BULK_INSERT_CHUNK_SIZE):
+    """
+    Insert records with one multi-row request per chunk
+    Each request is a single INSERT statement, so a chunk either lands completely or not at all
+
+    Returns (number of rows inserted, list of (row number, error message) for rows that failed)
+    """
+    # JSON has no NaN, so send missing values as null
+    rows = records.astype(object).where(records.notna(), None).to_dict("records")
+    inserted = 0
+    failed = []
+
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        try:
+            supabase.table(table).insert(chunk).execute()
+            inserted += len(chunk)
+        except Exception as e:
+            failed.extend((records.index[start + i], str(e)) for i in range(len(chunk)))
+
+    return inserted, failed
+
 def add_data(data, table_name):
     """
     Add data to Supabase tables
     Handles both DataFrame and list/tuple data formats
+    Rows are validated up front and sent in chunked multi-row inserts
     
     Args:
         data: DataFrame or list/tuple of values to insert
         table_name: Name of the table/data type ('Mileage_Dictionary', 'mileage_log', 'Receipts')
+
+    Returns:
+        dict with "inserted" (row count) and "failed" (list of (row position, error message))
     """
     try:
         user_id = get_user_id()
@@ -301,88 +640,46 @@ def add_data(data, table_name):
         
         supabase = init_connection()
         
-        # Handle Mileage Dictionary
-        if table_name == "Mileage_Dictionary":
-            if isinstance(data, pd.DataFrame):
-                # DataFrame format: batch insert
-                for _, row in data.iterrows():
-                    location_data = {
-                        "user_id": user_id,
-                        "location_name": row[0],  # First column
-                        "location_address": row[1]  # Second column
-                    }
-                    supabase.table('mileage_dictionary').insert(location_data).execute()
-            else:
-                # List/tuple format: single insert
-                location_data = {
-                    "user_id": user_id,
-                    "location_name": data[0],
-                    "location_address": data[1]
-                }
-                supabase.table('mileage_dictionary').insert(location_data).execute()
-            st.success("Location(s) added successfully!")
-            
-        # Handle Mileage Log
-        elif table_name == "mileage_log":
-            if isinstance(data, pd.DataFrame):
-                # DataFrame format: batch insert
-                for _, row in data.iterrows():
-                    trip_data = {
-                        "user_id": user_id,
-                        "date": str(row[0]),
-                        "start_location": row[1],
-                        "start_address": row[2],
-                        "end_location": row[3],
-                        "end_address": row[4],
-                        "distance": float(row[5])
-                    }
-                    supabase.table('mileage_log').insert(trip_data).execute()
-            else:
-                # List/tuple format: single insert
-                trip_data = {
-                    "user_id": user_id,
-                    "date": str(data[0]),
-                    "start_location": data[1],
-                    "start_address": data[2],
-                    "end_location": data[3],
-                    "end_address": data[4],
-                    "distance": float(data[5])
-                }
-                supabase.table('mileage_log').insert(trip_data).execute()
-            st.success("Trip(s) added successfully!")
-            
-        # Handle Receipts
-        elif table_name == "Receipts":
-            if isinstance(data, pd.DataFrame):
-                # DataFrame format: batch insert
-                for _, row in data.iterrows():
-                    receipt_data = {
-                        "user_id": user_id,
-                        "date": str(row[0]),
-                        "store_name": row[1],
-                        "total": float(row[2]) if row[2] else 0.0,
-                        "upload_timestamp": row[3] if len(row) > 3 else datetime.now().isoformat()
-                    }
-                    supabase.table('receipts').insert(receipt_data).execute()
-            else:
-                # List/tuple format: single insert
-                receipt_data = {
-                    "user_id": user_id,
-                    "date": str(data[0]),
-                    "store_name": data[1],
-                    "total": float(data[2]) if data[2] else 0.0,
-                    "upload_timestamp": data[3] if len(data) > 3 else datetime.now().isoformat()
-                }
-                supabase.table('receipts').insert(receipt_data).execute()
-            st.success("Receipt(s) added successfully!")
-        else:
+        table, records, invalid = _build_records(_to_frame(data), table_name, user_id)
+        if table is None:
             st.warning(f"Unknown table name: {table_name}")
+            return {"inserted": 0, "failed": []}
+
+        # Rows that can't be converted are reported instead of sent
+        failed = [(row, "Invalid value") for row in records.index[invalid]]
+        inserted, insert_failures = _bulk_insert(supabase, table, records[~invalid])
+        failed = sorted(failed + insert_failures)
+
+        if inserted:
+            labels = {
+                "mileage_dictionary": "Location(s)",
+                "mileage_log": "Trip(s)",
+                "receipts": "Receipt(s)"
+            }
+            st.success(f"{inserted} {labels[table]} added successfully!")
+        if failed:
+            failed_rows = ", ".join(str(row + 1) for row, _ in failed)
+            st.error(f"{len(failed)} row(s) could not be added to {table_name} (rows {failed_rows}): {failed[0][1]}")
+
+        if inserted:
+            invalidate_table(table, user_id)
+        if table == "mileage_dictionary" and inserted:
+            refresh_location_matrix(user_id)
+
+        return {"inserted": inserted, "failed": failed}
             
     except Exception as e:
         st.error(f"Error adding data to {table_name}: {str(e)}")
         raise
 
-# Backward compatibility alias
+# Backward compatibility aliases
+def get_sheet_data(sheet_name, create_if_missing=False, headers=None):
+    """
+    Legacy function name - calls get_data()
+    Kept for backward compatibility with existing code
+    """
+    return get_data(sheet_name, create_if_missing, headers)
+
 def append_to_gsheet(data, sheet_name):
     """
     Legacy function name - calls add_data()
@@ -0,0 +1,51 @@
+"""
+Shared background worker pools
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+from config.config import BACKGROUND_WORKERS, OCR_WORKERS, OCR_MAX_QUEUED, RECEIPT_JOB_WORKERS
+
+class BoundedExecutor:
+    """
+    Thread pool that blocks submitters once max_workers + max_queued jobs are in flight
+    Keeps a burst of work from piling up an unbounded queue
+    """
+
+    def __init__(self, max_workers, max_queued, thread_name_prefix=""):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self._slots = threading.BoundedSemaphore(max_workers + max_queued)
+
+    def submit(self, fn, *args, **kwargs):
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+@st.cache_resource
+def get_background_executor():
+    """Create the process-wide thread pool for background network jobs"""
+    return ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix="background")
+
+@st.cache_resource
+def get_ocr_executor():
+    """
+    Create the process-wide pool that runs Tesseract, shared by every session
+    Tesseract runs as a subprocess, so threads are enough to use every core; each run is
+    limited to one OpenMP thread so OCR_WORKERS parallel runs don't oversubscribe the node
+    """
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+    return BoundedExecutor(OCR_WORKERS, OCR_MAX_QUEUED, thread_name_prefix="ocr")
+
+@st.cache_resource
+def get_receipt_job_executor():
+    """
+    Create the process-wide pool that runs whole receipt jobs for batch uploads
+    Kept separate from the OCR pool because each job waits on OCR pool tasks of its own
+    """
+    return ThreadPoolExecutor(max_workers=RECEIPT_JOB_WORKERS, thread_name_prefix="receipt-job")
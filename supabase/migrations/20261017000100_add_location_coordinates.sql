@@ -0,0 +1,4 @@
+-- Store coordinates for saved locations so distances can be estimated offline
+alter table public.mileage_dictionary
+    add column if not exists latitude double precision,
+    add column if not exists longitude double precision;
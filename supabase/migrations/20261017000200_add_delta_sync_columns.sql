@@ -0,0 +1,85 @@
+-- Track row changes so the app can sync only what changed since its last read
+
+-- Last modification time of every row
+alter table public.mileage_dictionary
+    add column if not exists updated_at timestamptz not null default now();
+alter table public.mileage_log
+    add column if not exists updated_at timestamptz not null default now();
+alter table public.receipts
+    add column if not exists updated_at timestamptz not null default now();
+
+create or replace function public.set_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at = now();
+    return new;
+end;
+$$;
+
+drop trigger if exists mileage_dictionary_set_updated_at on public.mileage_dictionary;
+create trigger mileage_dictionary_set_updated_at
+    before update on public.mileage_dictionary
+    for each row execute function public.set_updated_at();
+
+drop trigger if exists mileage_log_set_updated_at on public.mileage_log;
+create trigger mileage_log_set_updated_at
+    before update on public.mileage_log
+    for each row execute function public.set_updated_at();
+
+drop trigger if exists receipts_set_updated_at on public.receipts;
+create trigger receipts_set_updated_at
+    before update on public.receipts
+    for each row execute function public.set_updated_at();
+
+create index if not exists mileage_dictionary_user_updated_idx on public.mileage_dictionary (user_id, updated_at, id);
+create index if not exists mileage_log_user_updated_idx on public.mileage_log (user_id, updated_at, id);
+create index if not exists receipts_user_updated_idx on public.receipts (user_id, updated_at, id);
+
+-- Tombstones for deleted rows, so replicas can drop them
+create table if not exists public.deleted_rows (
+    id bigint generated always as identity primary key,
+    table_name text not null,
+    row_id bigint not null,
+    user_id uuid not null,
+    deleted_at timestamptz not null default now()
+);
+
+create index if not exists deleted_rows_user_deleted_idx on public.deleted_rows (user_id, deleted_at, id);
+
+alter table public.deleted_rows enable row level security;
+
+drop policy if exists "Users can view their own deleted rows" on public.deleted_rows;
+create policy "Users can view their own deleted rows"
+    on public.deleted_rows for select
+    using (auth.uid() = user_id);
+
+-- Runs as the table owner so the tombstone is written even though users can't insert into deleted_rows
+create or replace function public.record_deleted_row()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    insert into public.deleted_rows (table_name, row_id, user_id)
+    values (tg_table_name, old.id, old.user_id);
+    return old;
+end;
+$$;
+
+drop trigger if exists mileage_dictionary_record_delete on public.mileage_dictionary;
+create trigger mileage_dictionary_record_delete
+    after delete on public.mileage_dictionary
+    for each row execute function public.record_deleted_row();
+
+drop trigger if exists mileage_log_record_delete on public.mileage_log;
+create trigger mileage_log_record_delete
+    after delete on public.mileage_log
+    for each row execute function public.record_deleted_row();
+
+drop trigger if exists receipts_record_delete on public.receipts;
+create trigger receipts_record_delete
+    after delete on public.receipts
+    for each row execute function public.record_deleted_row();
@@ -0,0 +1,5 @@
+-- SHA-256 of the uploaded receipt image, used to warn about duplicate uploads
+alter table public.receipts
+    add column if not exists content_hash text;
+
+create index if not exists receipts_user_content_hash_idx on public.receipts (user_id, content_hash);
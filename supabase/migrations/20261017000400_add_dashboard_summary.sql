@@ -0,0 +1,51 @@
+-- Dashboard counts and totals computed in the database, so the app never downloads whole tables for them
+
+create index if not exists mileage_log_user_date_idx on public.mileage_log (user_id, date desc, id desc);
+create index if not exists receipts_user_date_idx on public.receipts (user_id, date desc, id desc);
+
+-- One row of counts and sums for one user, optionally limited to trips and receipts between two dates
+-- Rows are filtered by the user id passed in, like every other read in the app; the function runs
+-- with the caller's rights, so row level security still applies as a second check
+drop function if exists public.dashboard_summary(date, date);
+
+create or replace function public.dashboard_summary(
+    summary_user_id uuid,
+    period_start date default null,
+    period_end date default null
+)
+returns table (
+    location_count bigint,
+    trip_count bigint,
+    total_miles double precision,
+    receipt_count bigint,
+    receipt_total double precision
+)
+language sql
+stable
+security invoker
+set search_path = public
+as $$
+    with trips as (
+        select count(*) as trip_count, coalesce(sum(distance), 0)::double precision as total_miles
+        from public.mileage_log
+        where user_id = summary_user_id
+            and (period_start is null or date >= period_start)
+            and (period_end is null or date <= period_end)
+    ),
+    receipt_totals as (
+        select count(*) as receipt_count, coalesce(sum(total), 0)::double precision as receipt_total
+        from public.receipts
+        where user_id = summary_user_id
+            and (period_start is null or date >= period_start)
+            and (period_end is null or date <= period_end)
+    )
+    select
+        (select count(*) from public.mileage_dictionary where user_id = summary_user_id),
+        trips.trip_count,
+        trips.total_miles,
+        receipt_totals.receipt_count,
+        receipt_totals.receipt_total
+    from trips, receipt_totals;
+$$;
+
+grant execute on function public.dashboard_summary(uuid, date, date) to authenticated;
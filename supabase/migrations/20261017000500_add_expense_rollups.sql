@@ -0,0 +1,150 @@
+-- Monthly and yearly mileage and expense totals, kept current by triggers so reports never scan raw rows
+
+-- One row per user, period, source and label:
+--   period is 'month' or 'year', starting on period_start
+--   source is 'mileage_log' (label = trip destination, amount = miles)
+--   or 'receipts' (label = store name, amount = dollars)
+create table if not exists public.expense_rollups (
+    user_id uuid not null,
+    period text not null check (period in ('month', 'year')),
+    period_start date not null,
+    source text not null check (source in ('mileage_log', 'receipts')),
+    label text not null default '',
+    row_count bigint not null default 0,
+    amount numeric(12, 2) not null default 0,
+    primary key (user_id, period, period_start, source, label)
+);
+
+alter table public.expense_rollups enable row level security;
+
+drop policy if exists "Users can view their own rollups" on public.expense_rollups;
+create policy "Users can view their own rollups"
+    on public.expense_rollups for select
+    using (auth.uid() = user_id);
+
+-- Add (or with negative deltas, remove) one row's contribution to its month and year
+-- Amounts are exact decimals so repeated +/- adjustments never drift
+create or replace function public.adjust_expense_rollup(
+    p_user_id uuid,
+    p_source text,
+    p_label text,
+    p_date date,
+    p_count bigint,
+    p_amount numeric(12, 2)
+)
+returns void
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    rollup_period text;
+    rollup_start date;
+begin
+    if p_user_id is null or p_date is null then
+        return;
+    end if;
+
+    foreach rollup_period in array array['month', 'year'] loop
+        rollup_start := date_trunc(rollup_period, p_date)::date;
+
+        insert into public.expense_rollups as r (user_id, period, period_start, source, label, row_count, amount)
+        values (p_user_id, rollup_period, rollup_start, p_source, coalesce(p_label, ''), p_count, p_amount)
+        on conflict (user_id, period, period_start, source, label)
+        do update set row_count = r.row_count + excluded.row_count, amount = r.amount + excluded.amount;
+
+        -- Drop rollups that no longer cover any rows
+        delete from public.expense_rollups
+        where user_id = p_user_id
+            and period = rollup_period
+            and period_start = rollup_start
+            and source = p_source
+            and label = coalesce(p_label, '')
+            and row_count <= 0;
+    end loop;
+end;
+$$;
+
+-- Only the triggers below may change rollups
+revoke execute on function public.adjust_expense_rollup(uuid, text, text, date, bigint, numeric)
+    from public, anon, authenticated;
+
+create or replace function public.rollup_mileage_log()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    if tg_op in ('UPDATE', 'DELETE') then
+        perform public.adjust_expense_rollup(
+            old.user_id, 'mileage_log', old.end_location, old.date::date, -1, -coalesce(old.distance, 0)::numeric(12, 2)
+        );
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') then
+        perform public.adjust_expense_rollup(
+            new.user_id, 'mileage_log', new.end_location, new.date::date, 1, coalesce(new.distance, 0)::numeric(12, 2)
+        );
+    end if;
+    return null;
+end;
+$$;
+
+create or replace function public.rollup_receipts()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    if tg_op in ('UPDATE', 'DELETE') then
+        perform public.adjust_expense_rollup(
+            old.user_id, 'receipts', old.store_name, old.date::date, -1, -coalesce(old.total, 0)::numeric(12, 2)
+        );
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') then
+        perform public.adjust_expense_rollup(
+            new.user_id, 'receipts', new.store_name, new.date::date, 1, coalesce(new.total, 0)::numeric(12, 2)
+        );
+    end if;
+    return null;
+end;
+$$;
+
+-- Updates only touch rollups when a rolled-up column changes
+drop trigger if exists mileage_log_rollup on public.mileage_log;
+create trigger mileage_log_rollup
+    after insert or delete on public.mileage_log
+    for each row execute function public.rollup_mileage_log();
+
+drop trigger if exists mileage_log_rollup_update on public.mileage_log;
+create trigger mileage_log_rollup_update
+    after update of user_id, date, end_location, distance on public.mileage_log
+    for each row execute function public.rollup_mileage_log();
+
+drop trigger if exists receipts_rollup on public.receipts;
+create trigger receipts_rollup
+    after insert or delete on public.receipts
+    for each row execute function public.rollup_receipts();
+
+drop trigger if exists receipts_rollup_update on public.receipts;
+create trigger receipts_rollup_update
+    after update of user_id, date, store_name, total on public.receipts
+    for each row execute function public.rollup_receipts();
+
+-- Backfill from the rows that already exist
+delete from public.expense_rollups;
+
+insert into public.expense_rollups (user_id, period, period_start, source, label, row_count, amount)
+select user_id, period, date_trunc(period, date::date)::date, 'mileage_log', coalesce(end_location, ''),
+    count(*), coalesce(sum(distance::numeric(12, 2)), 0)
+from public.mileage_log, unnest(array['month', 'year']) as period
+where user_id is not null and date is not null
+group by user_id, period, date_trunc(period, date::date)::date, coalesce(end_location, '');
+
+insert into public.expense_rollups (user_id, period, period_start, source, label, row_count, amount)
+select user_id, period, date_trunc(period, date::date)::date, 'receipts', coalesce(store_name, ''),
+    count(*), coalesce(sum(total::numeric(12, 2)), 0)
+from public.receipts, unnest(array['month', 'year']) as period
+where user_id is not null and date is not null
+group by user_id, period, date_trunc(period, date::date)::date, coalesce(store_name, '');
@@ -0,0 +1,68 @@
+"""
+Shared test setup
+
+config/config.py reads API keys and service account credentials from Streamlit secrets as soon
+as it is imported, so the tests register a config module with the default settings instead,
+with every cache file pointed at a temporary directory
+"""
+import os
+import sys
+import tempfile
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config  # noqa: E402
+
+TEST_DATA_DIR = tempfile.mkdtemp(prefix="mileage_tracker_tests_")
+
+TEST_SETTINGS = {
+    "google_api_key": "test-key",
+    "CACHE_DB_PATH": os.path.join(TEST_DATA_DIR, "cache.sqlite3"),
+    "ROUTE_CACHE_TTL_DAYS": 180,
+    "ROUTE_CACHE_MAX_ENTRIES": 50000,
+    "ROUTE_CACHE_SYMMETRIC": True,
+    "LOCATION_MATRIX_DIR": os.path.join(TEST_DATA_DIR, "location_matrices"),
+    "REPLICA_DB_PATH": os.path.join(TEST_DATA_DIR, "replica.sqlite3"),
+    "REPLICA_SYNC_INTERVAL_SECONDS": 5,
+    "REPLICA_SYNC_OVERLAP_SECONDS": 5,
+    "GEOCODE_CACHE_TTL_DAYS": 90,
+    "GEOCODE_CACHE_MAX_ENTRIES": 10000,
+    "OCR_CACHE_TTL_DAYS": 30,
+    "OCR_CACHE_MAX_ENTRIES": 2000,
+    "HTTP_CONNECT_TIMEOUT": 3.05,
+    "HTTP_READ_TIMEOUT": 10,
+    "HTTP_POOL_SIZE": 10,
+    "HTTP_MAX_RETRIES": 3,
+    "HTTP_BACKOFF_FACTOR": 0.5,
+    "GOOGLE_REQUESTS_PER_SECOND": 10,
+    "DISTANCE_MODE": "api",
+    "ROAD_CIRCUITY_FACTOR": 1.25,
+    "BACKGROUND_WORKERS": 2,
+    "OCR_WORKERS": 2,
+    "OCR_MAX_QUEUED": 32,
+    "RECEIPT_JOB_WORKERS": 2,
+    "OCR_OSD_MAX_SIDE": 2000,
+    "OCR_OSD_MIN_CONFIDENCE": 2.0,
+    "OCR_PROBE_MAX_SIDE": 1200,
+    "OCR_PROBE_EARLY_EXIT_CONFIDENCE": 75,
+    "OCR_TARGET_DPI": 300,
+    "OCR_MAX_SIDE": 2400,
+    "OCR_BINARIZE_WINDOW": 31,
+    "OCR_BINARIZE_OFFSET": 0.12,
+    "OCR_DESKEW_MAX_ANGLE": 5,
+    "OCR_STORE_NAMES_PATH": os.path.join(ROOT, "data", "store_names.txt"),
+    "OCR_PSM": 4,
+    "OCR_OEM": 1,
+    "OCR_LANG": "eng",
+    "OCR_AMOUNT_WHITELIST": "0123456789.,$-",
+    "OCR_MODE": "full",
+    "OCR_LAYOUT_MAX_SIDE": 1000,
+    "MILEAGE_RATE": 0.67,
+}
+
+test_config = types.ModuleType("config.config")
+test_config.__dict__.update(TEST_SETTINGS)
+sys.modules["config.config"] = test_config
+config.config = test_config
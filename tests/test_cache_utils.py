@@ -0,0 +1,18 @@
+"""
+Tests for cache key normalization
+"""
+import pytest
+from src.utils.cache_utils import normalize_address
+
+@pytest.mark.parametrize("address, expected", [
+    ("123 Main Street.", "123 main st"),
+    ("123  MAIN st", "123 main st"),
+    ("456 North Oak Avenue, Suite #200", "456 n oak ave ste 200"),
+    ("", ""),
+    (None, ""),
+])
+def test_normalize_address(address, expected):
+    assert normalize_address(address) == expected
+
+def test_equivalent_addresses_share_a_key():
+    assert normalize_address("1 Park Boulevard; Springfield") == normalize_address("1 park blvd springfield")
@@ -0,0 +1,80 @@
+"""
+Tests for Distance Matrix request planning and batching
+"""
+import random
+import pytest
+import src.utils.google_api as google_api
+from src.utils.google_api import (
+    _plan_matrix_tiles,
+    MAX_MATRIX_ORIGINS,
+    MAX_MATRIX_DESTINATIONS,
+    MAX_MATRIX_ELEMENTS,
+    MAX_MATRIX_WASTED_ELEMENTS,
+)
+
+def assert_valid_plan(routes, tiles):
+    """Every request is within the API limits, and together they cover every route"""
+    covered = set()
+    for origins, destinations in tiles:
+        assert len(origins) <= MAX_MATRIX_ORIGINS
+        assert len(destinations) <= MAX_MATRIX_DESTINATIONS
+        assert len(origins) * len(destinations) <= MAX_MATRIX_ELEMENTS
+        covered.update((origin, destination) for origin in origins for destination in destinations)
+    assert set(routes) <= covered
+
+def test_no_routes_need_no_requests():
+    assert _plan_matrix_tiles([]) == []
+
+def test_single_route_is_one_request():
+    assert _plan_matrix_tiles([("A", "B")]) == [(["A"], ["B"])]
+
+def test_disjoint_routes_pack_only_while_waste_stays_capped():
+    # Three unrelated trips per request bill 9 elements for 3 answers; a fourth would waste 12
+    routes = [(f"origin {i}", f"destination {i}") for i in range(20)]
+    tiles = _plan_matrix_tiles(routes)
+    assert_valid_plan(routes, tiles)
+    assert len(tiles) == 7
+    assert google_api._billed_elements(tiles) == 6 * 9 + 4  # Not the 200 of two full 10 x 10 requests
+    for origins, destinations in tiles:
+        assert len(origins) * len(destinations) - len(origins) <= MAX_MATRIX_WASTED_ELEMENTS
+
+@pytest.mark.parametrize("origin_count, destination_count, request_count", [
+    (10, 30, 3),
+    (30, 30, 9),
+    (1, 60, 3),
+])
+def test_dense_routes_use_the_fewest_tiles(origin_count, destination_count, request_count):
+    routes = [(f"o{i}", f"d{j}") for i in range(origin_count) for j in range(destination_count)]
+    tiles = _plan_matrix_tiles(routes)
+    assert_valid_plan(routes, tiles)
+    assert len(tiles) == request_count
+
+def test_random_route_sets_stay_within_limits():
+    rng = random.Random(7)
+    for _ in range(200):
+        routes = [(f"o{rng.randint(0, 40)}", f"d{rng.randint(0, 40)}") for _ in range(rng.randint(1, 120))]
+        assert_valid_plan(routes, _plan_matrix_tiles(routes))
+
+def test_fetch_distances_skips_reverse_routes_and_unrequested_elements(monkeypatch):
+    requests = []
+
+    def fake_request(origins, destinations, wanted=None):
+        requests.append((origins, destinations))
+        distances = {
+            (origin, destination): 10.0
+            for origin in origins for destination in destinations
+            if wanted is None or (origin, destination) in wanted
+        }
+        return distances, []
+
+    monkeypatch.setattr(google_api, "_request_distance_matrix", fake_request)
+    monkeypatch.setattr(google_api, "set_cached_distance", lambda *args, **kwargs: None)
+
+    routes = [("A", "B"), ("B", "A"), ("C", "D")]
+    distances, errors = google_api._fetch_distances(routes)
+
+    assert errors == []
+    assert distances == {("A", "B"): 10.0, ("B", "A"): 10.0, ("C", "D"): 10.0}
+    # B → A reuses the distance of A → B instead of being requested
+    requested = {(origin, destination) for origins, destinations in requests for origin in origins for destination in destinations}
+    assert ("B", "A") not in requested
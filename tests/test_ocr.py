@@ -0,0 +1,53 @@
+"""
+Tests for receipt field extraction
+"""
+import json
+import os
+import pytest
+from src.utils.ocr_utils import extract_receipt_info, _store_names_digest
+from src.utils.receipt_extractor import is_total_line, has_date
+
+SAMPLES_PATH = os.path.join(os.path.dirname(__file__), "..", "scripts", "sample_ocr_texts.jsonl")
+
+with open(SAMPLES_PATH, encoding="utf-8") as samples_file:
+    SAMPLES = [json.loads(line) for line in samples_file if line.strip()]
+
+@pytest.mark.parametrize("sample", SAMPLES, ids=[sample["store_name"] for sample in SAMPLES])
+def test_extracts_sample_receipt_fields(sample):
+    info = extract_receipt_info(sample["text"])
+
+    assert info["store_name"].lower() == sample["store_name"].lower()
+    assert info["date"] == sample["date"]
+    assert float(info["total"]) == pytest.approx(float(sample["total"]))
+    assert set(info["confidence"]) == {"store_name", "date", "total"}
+    assert all(0 <= score <= 1 for score in info["confidence"].values())
+
+def test_labeled_total_beats_larger_amounts():
+    text = "CORNER STORE\n01/02/2025\nITEM 3.00\nTOTAL 3.21\nCASH 20.00\nCHANGE 16.79\n"
+    assert extract_receipt_info(text)["total"] == "3.21"
+
+def test_zero_total_is_skipped():
+    text = "CORNER STORE\n01/02/2025\nTOTAL 12.50\nAMOUNT DUE 0.00\n"
+    assert extract_receipt_info(text)["total"] == "12.50"
+
+def test_empty_text_has_no_fields():
+    info = extract_receipt_info("")
+    assert not info["date"]
+    assert not info["total"]
+
+def test_line_helpers():
+    assert is_total_line("Grand Total $25.17")
+    assert not is_total_line("Subtotal 23.47")
+    assert has_date("Sold 07/22/2025 14:32")
+    assert not has_date("Register 12")
+
+def test_store_names_digest_follows_dictionary_contents(tmp_path):
+    path = tmp_path / "store_names.txt"
+    path.write_text("Acme: ACME MKT\n", encoding="utf-8")
+    digest = _store_names_digest(str(path))
+
+    path.write_text("# Grocery\nAcme:ACME MKT\n\n", encoding="utf-8")
+    assert _store_names_digest(str(path)) == digest  # Comments and spacing don't change matching
+
+    path.write_text("Acme: ACME MKT, ACME MARKET\n", encoding="utf-8")
+    assert _store_names_digest(str(path)) != digest
@@ -0,0 +1,216 @@
+"""
+Tests for the local replica: delta sync with tombstones, keyset paging and search
+"""
+import itertools
+import re
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+import pytest
+import src.utils.replica as replica
+
+class FakeQuery:
+    """The slice of the PostgREST query builder the replica uses, run against in-memory rows"""
+
+    def __init__(self, rows, max_rows=None):
+        self.rows = rows
+        self.max_rows = max_rows
+        self.filters = []
+        self.orders = []
+        self.row_limit = None
+        self.columns = None
+
+    def select(self, columns):
+        self.columns = columns.split(",")
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row[column] == value)
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(lambda row: _timestamp(row[column]) >= _timestamp(value))
+        return self
+
+    def or_(self, condition):
+        # Only the keyset condition used by _fetch_since: column > t, or column = t and id > n
+        column, last_time, last_id = re.fullmatch(
+            r'(\w+)\.gt\."([^"]+)",and\(\w+\.eq\."[^"]+",id\.gt\.(\d+)\)', condition
+        ).groups()
+        self.filters.append(lambda row: (_timestamp(row[column]), row["id"]) > (_timestamp(last_time), int(last_id)))
+        return self
+
+    def order(self, column, desc=False):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, count):
+        self.row_limit = count
+        return self
+
+    def execute(self):
+        rows = [row for row in self.rows if all(matches(row) for matches in self.filters)]
+        for column, desc in reversed(self.orders):
+            rows.sort(key=lambda row: _timestamp(row[column]) if column.endswith("_at") else row[column], reverse=desc)
+        if self.row_limit is not None:
+            rows = rows[:self.row_limit]
+        if self.max_rows is not None:
+            rows = rows[:self.max_rows]
+        return SimpleNamespace(data=[{column: row[column] for column in self.columns} for row in rows])
+
+class FakeSupabase:
+    """In-memory Supabase tables that count the queries made against them, capped at max_rows like PostgREST"""
+
+    def __init__(self):
+        self.tables = {"mileage_log": [], "deleted_rows": []}
+        self.query_count = 0
+        self.max_rows = None
+
+    def table(self, name):
+        self.query_count += 1
+        return FakeQuery(self.tables[name], self.max_rows)
+
+def _timestamp(value):
+    return datetime.fromisoformat(value)
+
+_ids = itertools.count(1)
+
+def trip(user_id, date, start_location, updated_at, distance=10.0):
+    return {
+        "id": next(_ids),
+        "user_id": user_id,
+        "date": date,
+        "start_location": start_location,
+        "start_address": f"{start_location} address",
+        "end_location": "Office",
+        "end_address": "1 Main St",
+        "distance": distance,
+        "updated_at": updated_at,
+    }
+
+@pytest.fixture
+def supabase(monkeypatch):
+    client = FakeSupabase()
+    monkeypatch.setattr(replica, "init_connection", lambda: client)
+    return client
+
+@pytest.fixture
+def user_id():
+    # Each test gets its own user, so tests share the replica file without seeing each other's rows
+    return str(uuid.uuid4())
+
+def test_first_sync_pages_through_rows_sharing_a_timestamp(supabase, user_id, monkeypatch):
+    monkeypatch.setattr(replica, "SYNC_PAGE_SIZE", 2)
+    supabase.tables["mileage_log"] = [
+        trip(user_id, f"2025-01-0{day}", f"Client {day}", "2025-06-01T10:00:00+00:00") for day in range(1, 6)
+    ]
+
+    replica.sync_table(user_id, "mileage_log")
+
+    assert replica.count_rows(user_id, "mileage_log") == 5
+
+def test_delta_sync_applies_updates_and_tombstones(supabase, user_id):
+    kept, deleted = (
+        trip(user_id, "2025-01-01", "Client A", "2025-06-01T10:00:00+00:00"),
+        trip(user_id, "2025-01-02", "Client B", "2025-06-01T10:00:01+00:00"),
+    )
+    supabase.tables["mileage_log"] = [kept, deleted]
+    replica.sync_table(user_id, "mileage_log")
+
+    kept.update(distance=42.0, updated_at="2025-06-02T09:00:00+00:00")
+    supabase.tables["mileage_log"].remove(deleted)
+    supabase.tables["deleted_rows"].append({
+        "id": next(_ids),
+        "table_name": "mileage_log",
+        "row_id": deleted["id"],
+        "user_id": user_id,
+        "deleted_at": "2025-06-02T09:00:01+00:00",
+    })
+    replica.mark_stale(user_id, "mileage_log")
+    replica.sync_table(user_id, "mileage_log")
+
+    assert replica.select_rows(user_id, "mileage_log", columns=["id", "distance"]) == [
+        {"id": kept["id"], "distance": 42.0}
+    ]
+
+def test_delta_sync_pages_through_tombstones_sharing_a_timestamp(supabase, user_id, monkeypatch):
+    monkeypatch.setattr(replica, "SYNC_PAGE_SIZE", 2)
+    supabase.max_rows = 2
+    trips = [trip(user_id, f"2025-01-0{day}", f"Client {day}", "2025-06-01T10:00:00+00:00") for day in range(1, 7)]
+    supabase.tables["mileage_log"] = list(trips)
+    replica.sync_table(user_id, "mileage_log")
+
+    # One statement deletes five trips, so their tombstones share a deleted_at
+    for deleted in trips[:5]:
+        supabase.tables["mileage_log"].remove(deleted)
+        supabase.tables["deleted_rows"].append({
+            "id": next(_ids),
+            "table_name": "mileage_log",
+            "row_id": deleted["id"],
+            "user_id": user_id,
+            "deleted_at": "2025-06-02T09:00:00+00:00",
+        })
+    replica.mark_stale(user_id, "mileage_log")
+    replica.sync_table(user_id, "mileage_log")
+
+    assert replica.select_rows(user_id, "mileage_log", columns=["id"]) == [{"id": trips[5]["id"]}]
+
+def test_recent_sync_is_skipped_unless_stale(supabase, user_id):
+    supabase.tables["mileage_log"] = [trip(user_id, "2025-01-01", "Client A", "2025-06-01T10:00:00+00:00")]
+    replica.sync_table(user_id, "mileage_log")
+
+    queries = supabase.query_count
+    replica.sync_table(user_id, "mileage_log")
+    assert supabase.query_count == queries
+
+    replica.mark_stale(user_id, "mileage_log")
+    replica.sync_table(user_id, "mileage_log")
+    assert supabase.query_count > queries
+
+def test_keyset_pages_cover_every_row_once(supabase, user_id):
+    # Pairs of trips on the same date, so pages split rows that tie on the sort column
+    supabase.tables["mileage_log"] = [
+        trip(user_id, f"2025-02-{day:02d}", f"Client {day}-{n}", "2025-06-01T10:00:00+00:00")
+        for day in range(1, 6) for n in range(2)
+    ]
+    replica.sync_table(user_id, "mileage_log")
+
+    seen = []
+    after = None
+    while True:
+        page = replica.select_rows(
+            user_id, "mileage_log", columns=["id", "date"], order_by="date", descending=True, limit=3, after=after
+        )
+        if not page:
+            break
+        seen.extend(page)
+        after = (page[-1]["date"], page[-1]["id"])
+
+    expected = sorted(supabase.tables["mileage_log"], key=lambda row: (row["date"], row["id"]), reverse=True)
+    assert [row["id"] for row in seen] == [row["id"] for row in expected]
+
+def test_search_matches_substrings_case_insensitively(supabase, user_id):
+    supabase.tables["mileage_log"] = [
+        trip(user_id, "2025-03-01", "Acme Warehouse", "2025-06-01T10:00:00+00:00", distance=12.0),
+        trip(user_id, "2025-03-02", "Bolt Factory", "2025-06-01T10:00:01+00:00", distance=8.0),
+        trip(user_id, "2025-03-03", "ACME Depot", "2025-06-01T10:00:02+00:00", distance=5.0),
+    ]
+    replica.sync_table(user_id, "mileage_log")
+
+    # Long enough for the trigram index, and too short for it
+    assert replica.count_rows(user_id, "mileage_log", search="acme") == 2
+    assert replica.count_rows(user_id, "mileage_log", search="cm") == 2
+    assert replica.count_rows(user_id, "mileage_log", search="nowhere") == 0
+    assert replica.aggregate_rows(user_id, "mileage_log", "distance", search="acme")["sum"] == 17.0
+
+def test_search_index_follows_updates(supabase, user_id):
+    row = trip(user_id, "2025-03-01", "Acme Warehouse", "2025-06-01T10:00:00+00:00")
+    supabase.tables["mileage_log"] = [row]
+    replica.sync_table(user_id, "mileage_log")
+
+    row.update(start_location="Zenith Labs", start_address="9 Elm St", updated_at="2025-06-02T10:00:00+00:00")
+    replica.mark_stale(user_id, "mileage_log")
+    replica.sync_table(user_id, "mileage_log")
+
+    assert replica.count_rows(user_id, "mileage_log", search="acme") == 0
+    assert replica.count_rows(user_id, "mileage_log", search="zenith") == 1
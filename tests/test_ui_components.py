@@ -0,0 +1,127 @@
+"""
+Tests for the trip entry form
+"""
+import pandas as pd
+import pytest
+from streamlit.testing.v1 import AppTest
+import src.components.ui_components as ui_components
+from src.utils.location_matrix import LocationMatrix
+
+LOCATIONS = pd.DataFrame({
+    "location_name": ["Home", "Office"],
+    "location_address": ["1 Home Rd", "2 Office Ave"],
+})
+
+def trip_form_app():
+    """Trip form on its own, as the Mileage Log page renders it"""
+    import streamlit as st
+    import pandas as pd
+    from src.components.ui_components import render_trip_form
+
+    if "entries_mileage_log" not in st.session_state:
+        st.session_state.entries_mileage_log = []
+    render_trip_form(pd.DataFrame({
+        "location_name": ["Home", "Office"],
+        "location_address": ["1 Home Rd", "2 Office Ave"],
+    }))
+
+@pytest.fixture
+def trip_form(monkeypatch):
+    """The trip form app with the location matrix, distance lookups and inserts replaced by test doubles"""
+    state = {"matrix": None, "mileages": {}, "estimated": set(), "saved": []}
+
+    def fake_get_mileages(pairs, coordinates=None):
+        routes = list(pairs)
+        return {route: state["mileages"].get(route, 0) for route in routes}, state["estimated"] & set(routes)
+
+    def fake_add_data(data, table_name):
+        state["saved"].append(data)
+        return {"inserted": len(data), "failed": []}
+
+    monkeypatch.setattr(ui_components, "get_location_matrix", lambda user_id, locations: state["matrix"])
+    monkeypatch.setattr(ui_components, "get_user_id", lambda: "test-user")
+    monkeypatch.setattr(ui_components, "get_mileages", fake_get_mileages)
+    monkeypatch.setattr(ui_components, "add_data", fake_add_data)
+
+    app = AppTest.from_function(trip_form_app)
+    app.run()
+    return app, state
+
+def queue_trip(app):
+    app.selectbox(key="start_loc_select").select("Home")
+    app.selectbox(key="end_loc_select").select("Office")
+    next(button for button in app.button if button.label == "Add Trip").click()
+    app.run()
+
+def submit(app):
+    next(button for button in app.button if button.label == "Submit Changes to Mileage Log").click()
+    app.run()
+
+def ready_matrix(miles):
+    distances = [[0.0, miles], [miles, 0.0]]
+    return LocationMatrix(LOCATIONS["location_name"], LOCATIONS["location_address"], pd.DataFrame(distances).to_numpy())
+
+def test_trip_queued_before_matrix_is_ready_uses_matrix_on_submit(trip_form):
+    app, state = trip_form
+    queue_trip(app)
+    assert app.session_state.entries_mileage_log[0][5] is None
+
+    # The background sync finishes between queueing and submitting
+    state["matrix"] = ready_matrix(12)
+    submit(app)
+
+    assert not app.exception
+    assert len(state["saved"]) == 1
+    assert state["saved"][0]["total_mileage"].tolist() == [12]
+    assert app.session_state.entries_mileage_log == []
+
+def test_estimated_trip_is_replaced_by_matrix_distance(trip_form):
+    app, state = trip_form
+    queue_trip(app)
+    app.session_state.entries_mileage_log[0][5:] = [9, True]  # Queued with an offline estimate
+
+    state["matrix"] = ready_matrix(12)
+    submit(app)
+
+    assert not app.exception
+    assert state["saved"][0]["total_mileage"].tolist() == [12]
+
+def test_estimated_trip_is_held_until_confirmed(trip_form):
+    app, state = trip_form
+    route = ("1 Home Rd", "2 Office Ave")
+    state["mileages"] = {route: 9}
+    state["estimated"] = {route}
+    queue_trip(app)
+
+    submit(app)
+    assert not app.exception
+    assert state["saved"] == []
+    assert app.session_state.entries_mileage_log[0][5:] == [9, True]
+
+    app.checkbox(key="save_estimated_mileage").check()
+    submit(app)
+    assert state["saved"][0]["total_mileage"].tolist() == [9]
+
+def duplicate_warnings_app():
+    """Duplicate warnings for a manual receipt, with receipts already queued"""
+    import streamlit as st
+    from src.components.ui_components import get_duplicate_entry_warnings
+
+    st.session_state.entries_receipts = [
+        ["2025-03-01", "Acme", "", "2025-03-01 10:00:00"],
+        ["2025-03-01", "Acme", "not read", "2025-03-01 10:00:00"],
+        ["2025-03-01", "Acme", "$1,025.50", "2025-03-01 10:00:00"],
+    ]
+    for warning in get_duplicate_entry_warnings("2025-03-01", "acme", "1025.50"):
+        st.warning(warning)
+
+def test_duplicate_warnings_skip_queued_receipts_without_a_total(monkeypatch):
+    monkeypatch.setattr(ui_components, "find_duplicate_receipts", lambda **filters: pd.DataFrame())
+
+    app = AppTest.from_function(duplicate_warnings_app)
+    app.run()
+
+    assert not app.exception
+    assert [warning.value for warning in app.warning] == [
+        "A acme receipt for $1025.50 on 2025-03-01 is already waiting to be submitted"
+    ]